@@ -0,0 +1,181 @@
+import multiprocessing
+from collections import namedtuple
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+import pandas as pd
+
+from constraint import GroupConstraint
+from portfolio import Portfolio
+
+
+# target : Portfolio or array of weights in the order of the price columns
+# rebalance : number of periods between rebalances back to the target, None to buy and hold
+# name : column label of the results
+# constraints : GroupConstraints (or (limit, factor, factor_value) tuples) the target is held to
+# replace : (to_replace, replacements) pair, or a list of them, applied to the target with Portfolio.replace
+# rebalancer : Rebalancer that trades towards the target on the rebalance dates (paying its costs out of that period's return), None to trade all the way to it for free
+# Replacement rules and constraint levels shape the target Portfolio, so they're applied once per configuration before the simulation and the drift/rebalance loop stays vectorized over the whole batch.
+BacktestConfig = namedtuple('BacktestConfig', ['target', 'rebalance', 'name', 'constraints', 'replace', 'rebalancer'])
+BacktestConfig.__new__.__defaults__ = (None, None, None, None, None)
+
+# shared return panel of the worker processes, set by _init_worker
+_returns = None
+
+
+def _init_worker(raw, shape):
+    global _returns
+    _returns = np.frombuffer(raw, dtype = np.float64).reshape(shape)
+
+
+def _align(target, names):
+    # target weights in the order of the price columns
+    if isinstance(target, Portfolio):
+        port = target.port
+        return np.array([port[name] for name in names], dtype = np.float64)
+    return np.asarray(target, dtype = np.float64)
+
+
+def _target(config, names):
+    # the configuration's target weights after its replacement rules and constraints
+    if not (config.constraints or config.replace):
+        return _align(config.target, names)
+    target = config.target
+    if not isinstance(target, Portfolio):
+        target = Portfolio(names, _align(target, names))
+    target = target.copy()
+    rules = config.replace
+    if isinstance(rules, tuple):
+        rules = [rules]
+    for (to_replace, replacements) in rules or []:
+        target.replace(to_replace, replacements)
+    if config.constraints:
+        for constraint in config.constraints:
+            if isinstance(constraint, GroupConstraint):
+                target.constraints.append(constraint)
+            else:
+                target.set_constraint(*constraint)
+        target.apply_constraints()
+    return _align(target, names)
+
+
+def _periods(rebalance):
+    # rebalance period as an int, 0 for never
+    if rebalance is None:
+        return 0
+    if isinstance(rebalance, (bool, np.bool_)) or not isinstance(rebalance, (int, long, np.integer)) or rebalance < 1:
+        raise ValueError("rebalance must be a positive number of periods or None, not %r" % (rebalance,))
+    return int(rebalance)
+
+
+def simulate(returns, targets, rebalance, keep_weights = False, rebalancers = None):
+    """
+    Drift and rebalance a batch of portfolios over the same returns
+    
+    returns : T by N array
+        asset returns of each period (the drift from Portfolio.get_drift)
+    targets : M by N array
+        target weights of each portfolio, which is also where it starts
+    rebalance : M length array
+        periods between rebalances of each portfolio, 0 never rebalances
+    keep_weights : bool
+        also return the M by T by N weights after each period
+    rebalancers : M length list
+        (Rebalancer, costs) of each portfolio or None to trade straight to the target, costs is the N length array from Rebalancer.costs in the column order
+    
+    Returns
+    -------
+    port_returns : T by M array
+    weights : M by T by N array or None
+    
+    Note: Every portfolio steps through the periods together, so each period is one vectorized get_drift -> apply_drift -> normalize over the whole batch. A portfolio with a Rebalancer runs its solve on its own row of the weights when it's due, which is already lined up with the targets and costs so nothing gets looked up by name.
+    """
+    targets = np.asarray(targets, dtype = np.float64)
+    rebalance = np.asarray(rebalance)
+    held = rebalance <= 0
+    rebalance = np.where(held, 1, rebalance)
+    T = len(returns)
+    weights = targets.copy()
+    partial = np.array([r is not None for r in rebalancers or []] or [False] * len(targets))
+    port_returns = np.empty((T, len(targets)))
+    path = np.empty((len(targets), T, targets.shape[1])) if keep_weights else None
+    for t in range(T):
+        drifted = weights * (1.0 + np.nan_to_num(returns[t]))
+        total = drifted.sum(axis = 1)
+        port_returns[t] = total / weights.sum(axis = 1) - 1.0
+        weights = drifted / total[:, np.newaxis]
+        due = ((t + 1) % rebalance == 0) & ~held
+        for i in np.flatnonzero(due & partial):
+            (rebalancer, costs) = rebalancers[i]
+            trades = rebalancer.solve(weights[i], targets[i], costs)
+            weights[i] += trades
+            port_returns[t, i] -= np.dot(costs, np.abs(trades))
+        due &= ~partial
+        weights[due] = targets[due]
+        if keep_weights:
+            path[:, t] = weights
+    return port_returns, path
+
+
+def _simulate_batch(args):
+    (targets, rebalance, keep_weights, rebalancers) = args
+    return simulate(_returns, targets, rebalance, keep_weights, rebalancers)
+
+
+def run_backtest(prices, configs, processes = None, batch_size = None, keep_weights = False):
+    """
+    Simulate many portfolio configurations over one price history in parallel
+    
+    Parameters
+    ----------
+    prices : T by N DataFrame
+        prices with a column per asset name
+    configs : list
+        BacktestConfig (or (target, rebalance, ...) tuples in the same order)
+    processes : int
+        worker processes, defaults to the number of cores - 1 runs everything in this process
+    batch_size : int
+        configurations per task, defaults to spreading them evenly over the workers
+    keep_weights : bool
+        also collect the weight path of every configuration
+    
+    Returns
+    -------
+    port_returns : T - 1 by M DataFrame
+        return series of each configuration
+    weights : M by T - 1 by N array or None
+    
+    Note: The returns are computed once and put in shared memory that the workers map without copying, so only the targets and the results go between processes. Each configuration's replacement rules and constraints are applied to its target here, once, so the workers only ever see target weights.
+    """
+    configs = [BacktestConfig(*c) for c in configs]
+    names = list(prices.columns)
+    p = prices.values.astype(np.float64)
+    returns = (p[1:] - p[:-1]) / p[:-1]
+    
+    targets = np.array([_target(c, names) for c in configs])
+    rebalance = np.array([_periods(c.rebalance) for c in configs], dtype = np.intp)
+    # costs by name are looked up once here, the simulation only sees arrays
+    rebalancers = [None if c.rebalancer is None else (c.rebalancer, c.rebalancer.costs(names)) for c in configs]
+    labels = [i if c.name is None else c.name for (i, c) in enumerate(configs)]
+    
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if batch_size is None:
+        batch_size = max(1, -(-len(configs) // processes))
+    batches = [(targets[i:i + batch_size], rebalance[i:i + batch_size], keep_weights, rebalancers[i:i + batch_size]) for i in range(0, len(configs), batch_size)]
+    
+    if processes == 1:
+        results = [simulate(returns, *batch) for batch in batches]
+    else:
+        raw = RawArray('d', returns.size)
+        np.frombuffer(raw, dtype = np.float64)[:] = returns.ravel()
+        pool = multiprocessing.Pool(processes, initializer = _init_worker, initargs = (raw, returns.shape))
+        try:
+            results = pool.map(_simulate_batch, batches)
+        finally:
+            pool.close()
+            pool.join()
+    
+    port_returns = pd.DataFrame(np.hstack([r for (r, w) in results]), index = prices.index[1:], columns = labels)
+    weights = np.concatenate([w for (r, w) in results]) if keep_weights else None
+    return port_returns, weights
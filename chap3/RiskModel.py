@@ -1,6 +1,8 @@
 # Structural Risk Model
 # The multiple-factor risk model is based on the notion that the return of  a stock can be explained by a collection of common factors plus an idiosyncratic element that pertains to that particular stock.
 # Fama and MacBeth - Risk, Return,  and Equilibrium: Empirical Tests
+import numpy as np
+from scipy import linalg
 
 
 def returns(X, b, u):
@@ -37,16 +39,96 @@ def returns_covariance(X, F, Delta):
     F : K by K matrix
         Covariance matrix of factor returns
     Delta : N by N matrix
-        Diagonal covariance matrix of specific returns
+        Diagonal covariance matrix of specific returns, or just its diagonal as an N length array (e.g. from specific_risk.specific_variance)
         
     Returns
     -------
     V : N by N matrix
         Covariance of stock returns.
     """
+    if np.ndim(Delta) == 1:
+        V = np.dot(np.asarray(X), np.dot(np.asarray(F), np.asarray(X).T))
+        V[np.diag_indices_from(V)] += Delta
+        return V
     return X * F * X.T + Delta
 
 
+class FactorCovariance(object):
+    """
+    Covariance of stock returns V = X F X' + Delta kept in factor form
+    
+    Parameters
+    ----------
+    X : N by K array
+        Factor Exposures
+    F : K by K array
+        Covariance matrix of factor returns
+    delta : N length array
+        Specific variances (the diagonal of Delta) - a diagonal matrix is also accepted
+    
+    Note: V is never formed. Products with V cost O(NK + K^2) and solves go through the Woodbury identity, which only factors a K by K matrix. Use this instead of returns_covariance for anything but small universes.
+    """
+    def __init__(self, X, F, delta):
+        self.X = np.asarray(X, dtype = np.float64)
+        self.F = np.asarray(F, dtype = np.float64)
+        delta = np.asarray(delta, dtype = np.float64)
+        self.delta = np.diag(delta).copy() if delta.ndim == 2 else delta
+        self._lu = None
+    
+    @property
+    def shape(self):
+        return (len(self.delta), len(self.delta))
+    
+    def _diag(self, w):
+        # delta lined up with w, which can be a vector or N by M block of vectors
+        return self.delta if np.ndim(w) == 1 else self.delta[:, np.newaxis]
+    
+    def matvec(self, w):
+        """
+        V w for a holdings vector or an N by M block of them
+        """
+        w = np.asarray(w, dtype = np.float64)
+        return np.dot(self.X, np.dot(self.F, np.dot(self.X.T, w))) + self._diag(w) * w
+    
+    def variance(self, w):
+        """
+        Portfolio variance w' V w (one per column for an N by M block)
+        """
+        w = np.asarray(w, dtype = np.float64)
+        y = np.dot(self.X.T, w)
+        return np.sum(y * np.dot(self.F, y), axis = 0) + np.sum(self._diag(w) * w**2, axis = 0)
+    
+    def risk(self, w):
+        return np.sqrt(self.variance(w))
+    
+    def marginal_contribution(self, w):
+        """
+        Marginal contribution to risk of each asset, V w / sqrt(w' V w)
+        """
+        return self.matvec(w) / self.risk(w)
+    
+    def solve(self, b):
+        """
+        V^-1 b for a vector or an N by M block
+        
+        Woodbury with the factor inverse folded in so F can be singular:
+        V^-1 = D^-1 - D^-1 X (I + F X' D^-1 X)^-1 F X' D^-1
+        """
+        b = np.asarray(b, dtype = np.float64)
+        if self._lu is None:
+            M = np.dot(self.X.T, self.X / self.delta[:, np.newaxis])
+            self._lu = linalg.lu_factor(np.eye(len(self.F)) + np.dot(self.F, M))
+        Db = b / self._diag(b)
+        y = linalg.lu_solve(self._lu, np.dot(self.F, np.dot(self.X.T, Db)))
+        return Db - np.dot(self.X, y) / self._diag(b)
+    
+    def to_dense(self):
+        """
+        The full N by N matrix - only for small universes
+        """
+        return np.dot(self.X, np.dot(self.F, self.X.T)) + np.diag(self.delta)
+
+
 
 def factor_return_matrix(X, Delta, r):
     """
@@ -57,7 +139,7 @@ def factor_return_matrix(X, Delta, r):
     X : ndarray
         Exposure matrix
     Delta : ndarray
-        Diagonal matrix of GLS Regression weights
+        Diagonal matrix of GLS Regression weights, or just its diagonal as an N length array of specific variances
     r : array_like
         Vector of excess returns
     
@@ -66,11 +148,154 @@ def factor_return_matrix(X, Delta, r):
     b : ndarray
         Estimated factor returns
     """
+    if np.ndim(Delta) == 1:
+        X = np.asarray(X)
+        XtW = X.T / np.asarray(Delta)
+        return np.linalg.solve(np.dot(XtW, X), np.dot(XtW, r))
     return (X.T * Delta**-1 * X)**-1 * X.T * Delta**-1 * r
 
 
+def factor_return_panel(X, r, delta, chunksize = None):
+    """
+    Estimated Factor Returns for every period at once
+    
+    Parameters
+    ----------
+    X : T by N by K array
+        Exposure matrix for each period - a memory-mapped Panel works too
+    r : T by N array
+        Excess returns for each period (or a one factor Panel)
+    delta : T by N array
+        Specific variances (GLS regression weights are 1 / delta) - an N length array is used for every period
+    chunksize : int
+        number of periods solved at a time, by default all of them - set it to only read a chunk of a memory-mapped panel into memory at once
+    
+    Returns
+    -------
+    b : T by K array
+        Estimated factor returns, NaN for periods with fewer usable assets than factors
+    u : T by N array
+        Residual (specific) returns, NaN for the assets left out
+    
+    Note: Assets with a missing return, exposure or specific variance are masked out of that period's regression only. The T weighted least squares problems are solved as one stack of K by K normal equations, Delta is never formed.
+    """
+    r = np.asarray(r, dtype = np.float64)
+    if r.ndim == 3:
+        r = r[:, :, 0]
+    delta = np.asarray(delta, dtype = np.float64)
+    if delta.ndim == 3:
+        delta = delta[:, :, 0]
+    T = len(r)
+    if chunksize is not None and chunksize < T:
+        chunks = [factor_return_panel(X[start:start + chunksize], r[start:start + chunksize], delta if delta.ndim == 1 else delta[start:start + chunksize]) for start in range(0, T, chunksize)]
+        return np.concatenate([b for (b, u) in chunks]), np.concatenate([u for (b, u) in chunks])
+    
+    X = np.asarray(X, dtype = np.float64)
+    delta = np.broadcast_to(delta, r.shape)
+    
+    mask = np.isfinite(r) & (np.where(np.isfinite(delta), delta, 0.0) > 0) & np.isfinite(X).all(axis = 2)
+    weights = np.where(mask, 1.0 / np.where(mask, delta, 1.0), 0.0)
+    Xm = np.where(mask[:, :, np.newaxis], X, 0.0)
+    XtW = (Xm * weights[:, :, np.newaxis]).transpose(0, 2, 1)
+    A = np.matmul(XtW, Xm)
+    c = np.matmul(XtW, np.where(mask, r, 0.0)[:, :, np.newaxis])
+    
+    K = X.shape[2]
+    solvable = mask.sum(axis = 1) >= K
+    b = np.full((len(r), K), np.nan)
+    if solvable.any():
+        try:
+            b[solvable] = np.linalg.solve(A[solvable], c[solvable])[:, :, 0]
+        except np.linalg.LinAlgError:
+            # collinear exposures in some period - fall back to the pseudo-inverse
+            b[solvable] = np.matmul(np.linalg.pinv(A[solvable]), c[solvable])[:, :, 0]
+    
+    u = r - np.matmul(X, b[:, :, np.newaxis])[:, :, 0]
+    u[~mask] = np.nan
+    return b, u
+
+
+def factor_portfolio_weights(X, delta):
+    """
+    Factor-mimicking portfolio weights, (X' Delta^-1 X)^-1 X' Delta^-1
+    
+    Parameters
+    ----------
+    X : N by K array
+        Exposure matrix - a T by N by K stack (or Panel) gives the weights for every period
+    delta : N array
+        Specific variances (GLS regression weights are 1 / delta), T by N to go with a stack of exposures
+    
+    Returns
+    -------
+    W : K by N array
+        One row per factor, each with unit exposure to its own factor and none to the others. T by K by N for a stack, NaN for periods with fewer usable assets than factors.
+    
+    Note: Assets with a missing exposure or specific variance get no weight. The K by K normal equations are solved against X' Delta^-1, nothing is inverted. Like factor_return_panel, a period with fewer usable assets than factors has no portfolio with unit exposures, so its weights are NaN rather than a pseudo-inverse that only looks like one.
+    """
+    X = np.asarray(X, dtype = np.float64)
+    if X.ndim == 2:
+        return factor_portfolio_weights(X[np.newaxis], delta)[0]
+    delta = np.asarray(delta, dtype = np.float64)
+    if delta.ndim == 3:
+        delta = delta[:, :, 0]
+    delta = np.broadcast_to(delta, X.shape[:-1])
+    mask = (np.where(np.isfinite(delta), delta, 0.0) > 0) & np.isfinite(X).all(axis = -1)
+    Xm = np.where(mask[..., np.newaxis], X, 0.0)
+    XtW = np.swapaxes(Xm * np.where(mask, 1.0 / np.where(mask, delta, 1.0), 0.0)[..., np.newaxis], -1, -2)
+    A = np.matmul(XtW, Xm)
+    
+    solvable = mask.sum(axis = -1) >= X.shape[-1]
+    W = np.full(XtW.shape, np.nan)
+    if solvable.any():
+        try:
+            W[solvable] = np.linalg.solve(A[solvable], XtW[solvable])
+        except np.linalg.LinAlgError:
+            # collinear exposures in some period - fall back to the pseudo-inverse
+            W[solvable] = np.matmul(np.linalg.pinv(A[solvable]), XtW[solvable])
+    return W
+
+
+def factor_portfolio_returns(X, delta, r, chunksize = None):
+    """
+    Returns to every factor-mimicking portfolio over a block of periods
+    
+    Parameters
+    ----------
+    X : N by K array
+        Exposure matrix, held fixed over all the periods - or T by N by K (e.g. a memory-mapped Panel) for new exposures every period
+    delta : N array
+        Specific variances, T by N to go with a stack of exposures
+    r : T by N array
+        Asset returns for each period
+    chunksize : int
+        number of periods done at a time when the exposures change each period, by default all of them
+    
+    Returns
+    -------
+    T by K array of factor portfolio returns, NaN for periods with fewer usable assets than factors
+    
+    Note: A missing return counts as a zero return on that asset. With fixed exposures the weights are built once and applied to all T periods in a single matmul. With a stack they're built one chunk of periods at a time, so only chunksize periods of exposures and weights are ever in memory.
+    """
+    r = np.asarray(r, dtype = np.float64)
+    if r.ndim == 3:
+        r = r[:, :, 0]
+    r = np.where(np.isfinite(r), r, 0.0)
+    if np.ndim(X) == 2:
+        return np.dot(r, factor_portfolio_weights(X, delta).T)
+    
+    delta = np.asarray(delta, dtype = np.float64)
+    T = len(r)
+    chunksize = chunksize or T
+    returns = np.empty((T, X.shape[2]))
+    for start in range(0, T, chunksize):
+        stop = min(start + chunksize, T)
+        W = factor_portfolio_weights(X[start:stop], delta if delta.ndim == 1 else delta[start:stop])
+        returns[start:stop] = np.matmul(W, r[start:stop, :, np.newaxis])[:, :, 0]
+    return returns
+
+
 # This is just weighted returns of a portfolio
-# There's probably a better way to do this with np.prod, but I couldn't figure it out right now
 # Reread the Characteristic Portfolio Stuff
 def factor_return(weights, returns):
     """
@@ -88,8 +313,9 @@ def factor_return(weights, returns):
     Notes
     -----
     Used for factor-mimicking portfolio.  Portfolio that capture the specific effect of the exposure.  Factor Portfolios are not investable since they hold all assets in some weight.
+    weights can also be the K by N output of factor_portfolio_weights, which gives all K factor returns in one product. See factor_portfolio_returns for a whole history.
     """
-    return np.sum([w * r for (w, r) in zip(weights, returns)], axis = 0)
+    return np.dot(weights, returns)
 
 # French's website of factor returns
 # http://mba.tuck.dartmouth.edu/pages/faculty/ken.french/data_library.html
@@ -0,0 +1,224 @@
+import numpy as np
+from collections import deque
+
+# Estimating the factor covariance F that RiskModel.returns_covariance and FactorCovariance take as an input.
+# The estimator keeps exponentially weighted moments of the factor returns, so a new day is an O(K^2) update instead of a pass over the whole history, and the state is a handful of arrays that can be checkpointed.
+
+
+class FactorCovarianceEstimator(object):
+    """
+    Exponentially weighted K by K factor covariance, updated one day of factor returns at a time
+    
+    n_factors : int
+        K, the number of factors
+    decay : float
+        weight kept by the past on each update, 1.0 is an equally weighted history and e.g. 0.97 is a half-life of about 23 days
+    nw_lags : int
+        number of lags in the Newey-West serial correlation adjustment, 0 for none
+    shrinkage : float, 'auto' or None
+        Ledoit-Wolf style shrinkage towards mu * I (mu the average variance). A float is a fixed intensity in [0, 1], 'auto' uses the Ledoit-Wolf (2004) optimal intensity with the effective number of observations
+    demean : bool
+        take out the weighted mean, set False to treat daily factor returns as mean zero like most commercial risk models do
+    
+    Note: The moments are kept raw (weighted sums of f and f f'), which is what lets the lagged cross moments be updated exactly. The weights of the lagged moments are tracked on their own since they've seen fewer pairs, and every lag is centered on the one overall weighted mean. save / load checkpoint the whole state to an .npz so a restarted job carries on without replaying the history.
+    """
+    def __init__(self, n_factors, decay = 1.0, nw_lags = 0, shrinkage = None, demean = True):
+        self.n_factors = n_factors
+        self.decay = decay
+        self.nw_lags = nw_lags
+        self.shrinkage = shrinkage
+        self.demean = demean
+        self.count = 0
+        self.weight = 0.0
+        # sum of the squared weights, for the effective number of observations
+        self.weight2 = 0.0
+        self.total = np.zeros(n_factors)
+        # lag -> weighted sum of f_t f_{t-lag}' and its weight
+        self.moments = np.zeros((nw_lags + 1, n_factors, n_factors))
+        self.lag_weights = np.zeros(nw_lags + 1)
+        # weighted sums of f_i^2 f_j and f_i^2 f_j^2, only needed for the automatic shrinkage
+        self.third = np.zeros((n_factors, n_factors))
+        self.fourth = np.zeros((n_factors, n_factors))
+        self.history = deque(maxlen = nw_lags)
+    
+    def update(self, f):
+        """
+        Fold in one day of factor returns
+    
+        f : K array
+            factor returns, a day with any NaN is skipped
+        """
+        f = np.asarray(f, dtype = np.float64)
+        if not np.isfinite(f).all():
+            return self
+        decay = self.decay
+        self.count += 1
+        self.weight = decay * self.weight + 1.0
+        self.weight2 = decay**2 * self.weight2 + 1.0
+        self.total = decay * self.total + f
+    
+        self.moments *= decay
+        self.lag_weights *= decay
+        self.moments[0] += np.outer(f, f)
+        self.lag_weights[0] += 1.0
+        # history[-1] is yesterday
+        for (lag, past) in enumerate(reversed(self.history), 1):
+            self.moments[lag] += np.outer(f, past)
+            self.lag_weights[lag] += 1.0
+        self.history.append(f)
+    
+        if self.shrinkage == 'auto':
+            square = f**2
+            self.third = decay * self.third + np.outer(square, f)
+            self.fourth = decay * self.fourth + np.outer(square, square)
+        return self
+    
+    def extend(self, returns):
+        """
+        Fold in a T by K block of factor returns, oldest first
+        """
+        for f in np.asarray(returns, dtype = np.float64):
+            self.update(f)
+        return self
+    
+    @property
+    def mean(self):
+        if not self.weight:
+            return np.zeros(self.n_factors)
+        return self.total / self.weight
+    
+    @property
+    def effective_count(self):
+        """
+        Number of equally weighted observations carrying the same information, (sum w)^2 / sum w^2
+        """
+        return self.weight**2 / self.weight2 if self.weight2 else 0.0
+    
+    def autocovariance(self, lag = 0):
+        """
+        Weighted cov(f_t, f_{t-lag}) as a K by K array
+        """
+        gamma = self.moments[lag] / self.lag_weights[lag]
+        if self.demean:
+            mean = self.mean
+            gamma = gamma - np.outer(mean, mean)
+        return gamma
+    
+    @property
+    def sample_covariance(self):
+        """
+        Covariance with the Newey-West adjustment but before any shrinkage
+        """
+        cov = self.autocovariance(0)
+        for lag in range(1, self.nw_lags + 1):
+            if not self.lag_weights[lag]:
+                break
+            gamma = self.autocovariance(lag)
+            # Bartlett weights keep the adjusted matrix positive semi-definite
+            cov = cov + (1.0 - lag / (self.nw_lags + 1.0)) * (gamma + gamma.T)
+        return cov
+    
+    def shrinkage_intensity(self, cov = None):
+        """
+        The weight put on mu * I, either the fixed shrinkage or the Ledoit-Wolf estimate
+        """
+        if self.shrinkage is None:
+            return 0.0
+        if self.shrinkage != 'auto':
+            return float(self.shrinkage)
+        if cov is None:
+            cov = self.sample_covariance
+        mu = np.trace(cov) / self.n_factors
+        distance = np.sum((cov - mu * np.eye(self.n_factors))**2)
+        if not distance:
+            return 0.0
+        s = self.autocovariance(0)
+        # sum over i, j of the variance of f_i f_j, spread over the effective number of days
+        spread = max(np.sum(self._centered_fourth() - s**2), 0.0) / self.effective_count
+        return min(spread, distance) / distance
+    
+    def _centered_fourth(self):
+        # weighted mean of (f_i - m_i)^2 (f_j - m_j)^2 expanded into the raw moments
+        fourth = self.fourth / self.weight
+        if not self.demean:
+            return fourth
+        m = self.mean
+        third = self.third / self.weight
+        second = self.moments[0] / self.weight
+        square = np.diag(second)
+        return (fourth - 2.0 * third * m - 2.0 * m[:, np.newaxis] * third.T
+            + np.outer(square, m**2) + np.outer(m**2, square) + 4.0 * np.outer(m, m) * second
+            - 3.0 * np.outer(m**2, m**2))
+    
+    @property
+    def covariance(self):
+        """
+        The K by K factor covariance F
+        """
+        cov = self.sample_covariance
+        intensity = self.shrinkage_intensity(cov)
+        if intensity:
+            mu = np.trace(cov) / self.n_factors
+            cov = (1.0 - intensity) * cov + intensity * mu * np.eye(self.n_factors)
+        return cov
+    
+    def state(self):
+        """
+        Everything needed to pick up where this estimator left off, as a dict of arrays
+        """
+        history = np.zeros((self.nw_lags, self.n_factors))
+        if self.history:
+            history[self.nw_lags - len(self.history):] = self.history
+        return {
+            'n_factors': self.n_factors,
+            'decay': self.decay,
+            'nw_lags': self.nw_lags,
+            # repr round-trips a float exactly, str only keeps 12 digits in python 2
+            'shrinkage': str(self.shrinkage) if self.shrinkage is None or isinstance(self.shrinkage, basestring) else repr(float(self.shrinkage)),
+            'demean': self.demean,
+            'count': self.count,
+            'weight': self.weight,
+            'weight2': self.weight2,
+            'total': self.total,
+            'moments': self.moments,
+            'lag_weights': self.lag_weights,
+            'third': self.third,
+            'fourth': self.fourth,
+            'history': history,
+            'history_length': len(self.history),
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        shrinkage = str(state['shrinkage'])
+        if shrinkage == 'None':
+            shrinkage = None
+        elif shrinkage != 'auto':
+            shrinkage = float(shrinkage)
+        new = cls(int(state['n_factors']), float(state['decay']), int(state['nw_lags']), shrinkage, bool(state['demean']))
+        new.count = int(state['count'])
+        new.weight = float(state['weight'])
+        new.weight2 = float(state['weight2'])
+        new.total = np.array(state['total'], dtype = np.float64)
+        new.moments = np.array(state['moments'], dtype = np.float64)
+        new.lag_weights = np.array(state['lag_weights'], dtype = np.float64)
+        new.third = np.array(state['third'], dtype = np.float64)
+        new.fourth = np.array(state['fourth'], dtype = np.float64)
+        length = int(state['history_length'])
+        history = np.array(state['history'], dtype = np.float64)
+        new.history.extend(history[len(history) - length:] if length else [])
+        return new
+    
+    def save(self, path):
+        """
+        Checkpoint the state to an .npz file
+        """
+        np.savez(path, **self.state())
+    
+    @classmethod
+    def load(cls, path):
+        """
+        Restart from a checkpoint written by save
+        """
+        with np.load(path) as data:
+            return cls.from_state(dict((key, data[key]) for key in data.files))
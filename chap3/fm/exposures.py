@@ -0,0 +1,234 @@
+from collections import deque, namedtuple
+
+import numpy as np
+from scipy import linalg
+
+
+FirstPass = namedtuple('FirstPass', ['exposures', 'intercepts', 'r2', 'resid_var'])
+
+
+def _design(factors, intercept):
+    F = np.asarray(factors, dtype = np.float64)
+    if F.ndim == 1:
+        F = F[:, np.newaxis]
+    if intercept:
+        F = np.column_stack([F, np.ones(len(F))])
+    return F
+
+
+def first_pass(returns, factors, intercept = True):
+    """
+    Time-series regression of every asset's returns on the factor returns at once - the first pass of Fama-MacBeth
+    
+    Parameters
+    ----------
+    returns : T by N array or DataFrame
+        asset (excess) returns, NaN where an asset has no data
+    factors : T by K array or DataFrame
+        factor returns shared by every asset
+    intercept : bool
+        fit an intercept for each asset
+    
+    Returns
+    -------
+    FirstPass of arrays
+        exposures (N by K), intercepts (N), r2 (N) and resid_var (N, SSR over the residual degrees of freedom). NaN for assets with no more observations than parameters.
+    
+    Note: The assets with a full history share the design, so it's factored once (QR) and solved against all of them together. Assets with missing data get their own masked normal equations, built for all of them with one product and solved as a stack.
+    """
+    Y = np.asarray(returns, dtype = np.float64)
+    D = _design(factors, intercept)
+    # periods without factor data can't be used by anyone
+    rows = np.isfinite(D).all(axis = 1)
+    Y, D = Y[rows], D[rows]
+    T, P = D.shape
+    N = Y.shape[1]
+    
+    obs = np.isfinite(Y)
+    complete = obs.all(axis = 0)
+    coef = np.full((N, P), np.nan)
+    
+    if complete.any():
+        Q, R = np.linalg.qr(D)
+        coef[complete] = linalg.solve_triangular(R, np.dot(Q.T, Y[:, complete])).T
+    
+    partial = np.flatnonzero(~complete)
+    if len(partial):
+        m = obs[:, partial].astype(np.float64)
+        G = np.dot(m.T, (D[:, :, np.newaxis] * D[:, np.newaxis, :]).reshape(T, P * P)).reshape(-1, P, P)
+        c = np.dot(np.where(obs[:, partial], Y[:, partial], 0.0).T, D)
+        fit = m.sum(axis = 0) > P
+        if fit.any():
+            try:
+                coef[partial[fit]] = np.linalg.solve(G[fit], c[fit][:, :, np.newaxis])[:, :, 0]
+            except np.linalg.LinAlgError:
+                coef[partial[fit]] = np.matmul(np.linalg.pinv(G[fit]), c[fit][:, :, np.newaxis])[:, :, 0]
+    
+    resid = np.where(obs, Y - np.dot(D, coef.T), 0.0)
+    n = obs.sum(axis = 0)
+    ssr = (resid**2).sum(axis = 0)
+    mean = np.where(obs, Y, 0.0).sum(axis = 0) / np.maximum(n, 1)
+    sst = (np.where(obs, Y - mean, 0.0)**2).sum(axis = 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        r2 = 1.0 - ssr / sst
+        resid_var = ssr / (n - P)
+    fitted = np.isfinite(coef).all(axis = 1)
+    r2[~fitted] = np.nan
+    resid_var[~fitted] = np.nan
+    
+    if intercept:
+        return FirstPass(coef[:, :-1], coef[:, -1], r2, resid_var)
+    return FirstPass(coef, np.zeros(N), r2, resid_var)
+
+
+class RollingExposures(object):
+    """
+    Rolling or expanding first-pass exposures updated one period at a time
+    
+    Parameters
+    ----------
+    n_factors : int
+        number of factors K
+    n_assets : int
+        number of assets N
+    window : int
+        number of periods in the window, None for an expanding window
+    decay : float
+        exponential weight kept by each older period, 1.0 weights the window equally
+    intercept : bool
+        fit an intercept for each asset
+    
+    Note: X'X and X'Y are kept as running sums - each update adds the new period and drops the one leaving the window, O(K^2 + NK), and the exposures of every asset come out of one K by K solve. A period without factor data is skipped like first_pass does, it still takes its place in the window. In a rolling window an asset missing a return anywhere in the window gets NaN until it rolls out, use first_pass for ragged histories. An expanding window fits an asset that listed late on the periods since its first return, from a snapshot of X'X taken when it listed - one extra K by K solve per listing date - and only a return missing after that makes it NaN.
+    """
+    def __init__(self, n_factors, n_assets, window = None, decay = 1.0, intercept = True):
+        self.intercept = intercept
+        self.window = window
+        self.decay = decay
+        P = n_factors + 1 if intercept else n_factors
+        self.XtX = np.zeros((P, P))
+        self.XtY = np.zeros((P, n_assets))
+        self.count = 0
+        self.steps = 0
+        self._missing = np.zeros(n_assets, dtype = int)
+        # the periods in the window, for dropping them again
+        self._rows = deque()
+        # expanding windows only - the step each asset first had a return, and step -> (X'X, count) just before it
+        self._first = np.full(n_assets, -1, dtype = np.intp)
+        self._listings = {}
+    
+    def update(self, returns, factors):
+        """
+        Add one period - returns is the N length cross-section and factors the K factor returns
+        """
+        d = _design(np.atleast_2d(factors), self.intercept)[0]
+        y = np.asarray(returns, dtype = np.float64)
+        missing = ~np.isfinite(y)
+        y = np.where(missing, 0.0, y)
+        used = bool(np.isfinite(d).all())
+        if not used:
+            # no factor data, nobody can use the period
+            d = np.zeros(len(d))
+            y = np.zeros(len(y))
+            missing = np.zeros(len(y), dtype = bool)
+        elif self.window is None:
+            listed = ~missing & (self._first < 0)
+            if listed.any():
+                self._first[listed] = self.steps
+                self._listings[self.steps] = (self.XtX.copy(), self.count)
+            # returns missing before an asset listed don't count against it
+            missing &= self._first >= 0
+        
+        self.XtX *= self.decay
+        self.XtY *= self.decay
+        self.XtX += np.outer(d, d)
+        self.XtY += np.outer(d, y)
+        self._missing += missing
+        self.count += used
+        self.steps += 1
+        
+        if self.window is not None:
+            self._rows.append((d, y, missing, used))
+            if len(self._rows) > self.window:
+                (d, y, missing, used) = self._rows.popleft()
+                weight = self.decay ** self.window
+                self.XtX -= weight * np.outer(d, d)
+                self.XtY -= weight * np.outer(d, y)
+                self._missing -= missing
+                self.count -= used
+        return self
+    
+    def _solve(self, XtX, count, cols = slice(None)):
+        # coefficients of the assets in cols from a Gram matrix over count periods, None if it can't be solved
+        if count < len(XtX):
+            return None
+        try:
+            return linalg.solve(XtX, self.XtY[:, cols], assume_a = 'pos')
+        except (linalg.LinAlgError, ValueError):
+            return None
+    
+    def coefficients(self):
+        """
+        P by N coefficients (the intercept last), NaN for assets that can't be fit
+        """
+        coef = np.full(self.XtY.shape, np.nan)
+        solved = self._solve(self.XtX, self.count)
+        if solved is not None:
+            coef = solved
+        if self.window is None:
+            coef[:, self._first < 0] = np.nan
+            for (step, (XtX, count)) in self._listings.items():
+                cols = np.flatnonzero(self._first == step)
+                if not step or not len(cols):
+                    continue
+                # X'X over the periods since the listing, the X'Y of these assets is already only over them
+                solved = self._solve(self.XtX - self.decay ** (self.steps - step) * XtX, self.count - count, cols)
+                coef[:, cols] = np.nan if solved is None else solved
+        coef[:, self._missing > 0] = np.nan
+        return coef
+    
+    @property
+    def exposures(self):
+        coef = self.coefficients()
+        return (coef[:-1] if self.intercept else coef).T
+    
+    @property
+    def intercepts(self):
+        if not self.intercept:
+            return np.zeros(self.XtY.shape[1])
+        return self.coefficients()[-1]
+
+
+def rolling_exposures(returns, factors, window = None, decay = 1.0, intercept = True):
+    """
+    Exposures of every asset on every date from a rolling (or expanding) window of the periods up to it
+    
+    Parameters
+    ----------
+    returns : T by N array or DataFrame
+        asset returns
+    factors : T by K array or DataFrame
+        factor returns
+    window, decay, intercept :
+        see RollingExposures
+    
+    Returns
+    -------
+    exposures : T by N by K array
+    intercepts : T by N array
+    """
+    Y = np.asarray(returns, dtype = np.float64)
+    F = np.asarray(factors, dtype = np.float64)
+    if F.ndim == 1:
+        F = F[:, np.newaxis]
+    T, N = Y.shape
+    K = F.shape[1]
+    
+    rolling = RollingExposures(K, N, window, decay, intercept)
+    exposures = np.empty((T, N, K))
+    intercepts = np.zeros((T, N))
+    for t in range(T):
+        coef = rolling.update(Y[t], F[t]).coefficients()
+        exposures[t] = (coef[:K]).T
+        if intercept:
+            intercepts[t] = coef[K]
+    return exposures, intercepts
@@ -1,11 +1,38 @@
-from pandas.core.base import StringMixin
-from pandas.compat import StringIO, range
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 import numpy as np
 
-from pandas.core.api import Series, DataFrame
-import pandas.stats.common as common
-from pandas.util.decorators import cache_readonly
+from pandas import Series, DataFrame
+
+from panel import Panel
+
+
+class cache_readonly(object):
+    """
+    Property computed on first access and cached on the instance
+    
+    Stands in for pandas.util.decorators.cache_readonly, which pandas has since removed.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+    
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        cache = obj.__dict__.setdefault('_cache', {})
+        if self not in cache:
+            cache[self] = self.func(obj)
+        return cache[self]
+
+
+def _banner(text, width = 80):
+    fill = width - len(text)
+    left = fill // 2
+    return '%s%s%s' % ('-' * left, text, '-' * (fill - left))
 
 
 def fama_macbeth(**kwargs):
@@ -13,8 +40,10 @@ def fama_macbeth(**kwargs):
 
     Parameters
     ----------
-    Takes the same arguments as a panel OLS, in addition to:
+    Takes the same arguments as FamaMacBeth, in addition to:
 
+    window_type: {'rolling', 'expanding'}
+       runs a MovingFamaMacBeth when given
     nw_lags_beta: int
        Newey-West adjusts the betas by the given lags
        """
@@ -27,29 +56,97 @@ def fama_macbeth(**kwargs):
     return klass(**kwargs)
 
 
-class FamaMacBeth(StringMixin):
-    def __init__(self, y, x, intercept=True, nw_lags=None,
-                 nw_lags_beta=None,
-                 entity_effects=False, time_effects=False, x_effects=None,
-                 cluster=None, dropped_dummies=None, verbose=False):
-
-        if dropped_dummies is None:
-                dropped_dummies = {}
+def _panel_arrays(y, x):
+    """
+    y and x as a T by N array and a T by N by K array, with the period index and variable names
+    
+    y : Series, Panel or array
+        Series with a (date, entity) MultiIndex, a one factor Panel or a T by N array
+    x : DataFrame, Panel or array
+        DataFrame on the same kind of index with a column per variable, a Panel or a T by N by K array
+    
+    A memory-mapped Panel is passed through as is, so it's only read a chunk at a time by the regressions.
+    """
+    if isinstance(x, Panel):
+        Y = y.values[:, :, 0] if isinstance(y, Panel) else np.asarray(y, dtype = np.float64)
+        return Y, x.values, x.dates, list(x.factors)
+    if isinstance(y, Series):
+        Y = y.unstack()
+        X = np.empty(Y.shape + (len(x.columns),))
+        for (k, col) in enumerate(x.columns):
+            X[:, :, k] = x[col].unstack().reindex(index = Y.index, columns = Y.columns).values
+        return Y.values.astype(np.float64), X, Y.index, list(x.columns)
+    
+    Y = np.asarray(y, dtype = np.float64)
+    X = np.asarray(x, dtype = np.float64)
+    if X.ndim == 2:
+        X = X[:, :, np.newaxis]
+    return Y, X, np.arange(len(Y)), ['x%d' % k for k in range(X.shape[2])]
+
+
+def _cross_sectional_betas(Y, X, intercept = True, chunksize = 250):
+    """
+    OLS of each period's cross-section of Y on X, all periods in a few batched solves
+    
+    Returns
+    -------
+    betas : T by K (+ 1 with the intercept, last) array, NaN for periods that couldn't be fit
+    mask : T length boolean array of the periods that were fit
+    """
+    T, N, K = X.shape
+    nvar = K + 1 if intercept else K
+    betas = np.full((T, nvar), np.nan)
+    
+    # chunks of periods keep the masked copies of X small
+    for start in range(0, T, chunksize):
+        y = Y[start:start + chunksize]
+        x = X[start:start + chunksize]
+        obs = np.isfinite(y) & np.isfinite(x).all(axis = 2)
+        xm = np.where(obs[:, :, np.newaxis], x, 0.0)
+        if intercept:
+            xm = np.concatenate([xm, obs[:, :, np.newaxis].astype(np.float64)], axis = 2)
+        xt = xm.transpose(0, 2, 1)
+        A = np.matmul(xt, xm)
+        c = np.matmul(xt, np.where(obs, y, 0.0)[:, :, np.newaxis])
+        
+        fit = obs.sum(axis = 1) >= nvar
+        if not fit.any():
+            continue
+        try:
+            b = np.linalg.solve(A[fit], c[fit])
+        except np.linalg.LinAlgError:
+            b = np.matmul(np.linalg.pinv(A[fit]), c[fit])
+        betas[start:start + chunksize][fit] = b[:, :, 0]
+    
+    return betas, np.isfinite(betas).all(axis = 1)
+
+
+class FamaMacBeth(object):
+    """
+    Fama-MacBeth regression
+    
+    y : Series, Panel or array
+        returns, on a (date, entity) MultiIndex or as a T by N array
+    x : DataFrame, Panel or array
+        exposures on the same index with a column per variable, or a T by N by K array
+    intercept : bool
+        add an intercept to each cross-sectional regression
+    nw_lags_beta : int
+        Newey-West adjusts the betas by the given lags
+    chunksize : int
+        number of periods regressed in each batch
+    
+    Every period's cross-sectional regression is solved in one batched least squares over the T by N by K panel, instead of a rolling OLS with a window of one period.
+    """
+    def __init__(self, y, x, intercept=True, nw_lags_beta=None, chunksize=250):
         self._nw_lags_beta = nw_lags_beta
-
-        from pandas.stats.plm import MovingPanelOLS
-        self._ols_result = MovingPanelOLS(
-            y=y, x=x, window_type='rolling', window=1,
-            intercept=intercept,
-            nw_lags=nw_lags, entity_effects=entity_effects,
-            time_effects=time_effects, x_effects=x_effects, cluster=cluster,
-            dropped_dummies=dropped_dummies, verbose=verbose)
-
-        self._cols = self._ols_result._x.columns
+        Y, X, self._index, cols = _panel_arrays(y, x)
+        self._cols = cols + ['intercept'] if intercept else cols
+        self._all_betas, self._mask = _cross_sectional_betas(Y, X, intercept, chunksize)
 
     @cache_readonly
     def _beta_raw(self):
-        return self._ols_result._beta_raw
+        return self._all_betas[self._mask]
 
     @cache_readonly
     def _stats(self):
@@ -99,7 +196,7 @@ class FamaMacBeth(StringMixin):
 
         for i, name in enumerate(self._cols):
             if i and not (i % 5):
-                buffer.write('\n' + common.banner(''))
+                buffer.write('\n' + _banner(''))
 
             mean_beta = self._results['mean_beta'][i]
             std_beta = self._results['std_beta'][i]
@@ -121,6 +218,12 @@ class FamaMacBeth(StringMixin):
     def __unicode__(self):
         return self.summary
 
+    def __str__(self):
+        return self.summary
+
+    def __repr__(self):
+        return self.summary
+
     @cache_readonly
     def summary(self):
         template = """
@@ -144,22 +247,16 @@ Formula: Y ~ %(formulaRHS)s
 
 class MovingFamaMacBeth(FamaMacBeth):
     def __init__(self, y, x, window_type='rolling', window=10,
-                 intercept=True, nw_lags=None, nw_lags_beta=None,
-                 entity_effects=False, time_effects=False, x_effects=None,
-                 cluster=None, dropped_dummies=None, verbose=False):
-        if dropped_dummies is None:
-                dropped_dummies = {}
-        self._window_type = common._get_window_type(window_type)
+                 intercept=True, nw_lags_beta=None, chunksize=250):
+        if window_type not in ('rolling', 'expanding'):
+            raise ValueError("window_type must be 'rolling' or 'expanding'")
+        self._window_type = window_type
         self._window = window
 
         FamaMacBeth.__init__(
             self, y=y, x=x, intercept=intercept,
-            nw_lags=nw_lags, nw_lags_beta=nw_lags_beta,
-            entity_effects=entity_effects, time_effects=time_effects,
-            x_effects=x_effects, cluster=cluster,
-            dropped_dummies=dropped_dummies, verbose=verbose)
+            nw_lags_beta=nw_lags_beta, chunksize=chunksize)
 
-        self._index = self._ols_result._index
         self._T = len(self._index)
 
     @property
@@ -167,28 +264,20 @@ class MovingFamaMacBeth(FamaMacBeth):
         return self._window_type == 'rolling'
 
     def _calc_stats(self):
-        mean_betas = []
-        std_betas = []
-        t_stats = []
-
-        # XXX
-
-        mask = self._ols_result._rolling_ols_call[2]
+        mask = self._mask
         obs_total = mask.astype(int).cumsum()
 
         start = self._window - 1
-        betas = self._beta_raw
-        for i in range(start, self._T):
-            if self._is_rolling:
-                begin = i - start
-            else:
-                begin = 0
-
-            B = betas[max(obs_total[begin] - 1, 0): obs_total[i]]
-            mean_beta, std_beta, t_stat = _calc_t_stat(B, self._nw_lags_beta)
-            mean_betas.append(mean_beta)
-            std_betas.append(std_beta)
-            t_stats.append(t_stat)
+        # one window per entry of _result_index
+        ends = np.flatnonzero(obs_total >= self._window)
+        if self._is_rolling:
+            begins = ends - start
+        else:
+            begins = np.zeros(len(ends), dtype=int)
+
+        starts = np.maximum(obs_total[begins] - 1, 0)
+        mean_betas, std_betas, t_stats = _rolling_t_stat(
+            self._beta_raw, starts, obs_total[ends], self._nw_lags_beta)
 
         return np.array([mean_betas, std_betas, t_stats])
 
@@ -199,7 +288,7 @@ class MovingFamaMacBeth(FamaMacBeth):
 
     @cache_readonly
     def _result_index(self):
-        mask = self._ols_result._rolling_ols_call[2]
+        mask = self._mask
         # HACK XXX
         return self._index[mask.cumsum() >= self._window]
 
@@ -228,4 +317,59 @@ def _calc_t_stat(beta, nw_lags_beta):
     std_beta = np.sqrt(np.diag(C)) / np.sqrt(N)
     t_stat = mean_beta / std_beta
 
-    return mean_beta, std_beta, t_stat
\ No newline at end of file
+    return mean_beta, std_beta, t_stat
+
+
+
+def _rolling_t_stat(beta, starts, ends, nw_lags_beta):
+    """
+    _calc_t_stat of beta[starts[j]:ends[j]] for every window j
+
+    starts and ends can't decrease, so the windows slide forward and only
+    running sums are kept: the prefix sums of the betas and, for each lag,
+    the sum of lagged outer products inside the window. Each window then
+    costs O(K^2 L) instead of recentering and redoing every product.
+    """
+    T, K = beta.shape
+    lags = [] if nw_lags_beta is None else list(range(nw_lags_beta + 1))
+    S = np.vstack([np.zeros(K), np.cumsum(beta, axis=0)])
+    G = np.zeros((K, K))
+    P = np.zeros((len(lags), K, K))
+
+    mean_betas = np.full((len(starts), K), np.nan)
+    std_betas = np.full((len(starts), K), np.nan)
+    lo = hi = 0
+    for j in range(len(starts)):
+        s, e = starts[j], ends[j]
+        for t in range(hi, e):
+            G += np.outer(beta[t], beta[t])
+            for i in lags:
+                if t - i >= lo:
+                    P[i] += np.outer(beta[t], beta[t - i])
+        hi = e
+        for t in range(lo, s):
+            G -= np.outer(beta[t], beta[t])
+            for i in lags:
+                if t + i < hi:
+                    P[i] -= np.outer(beta[t + i], beta[t])
+        lo = s
+
+        N = e - s
+        if N <= 0:
+            continue
+        m = (S[e] - S[s]) / N
+        C = (G - N * np.outer(m, m)) / N
+        for i in lags:
+            if i >= N:
+                continue
+            lead = S[e] - S[s + i]
+            lag = S[e - i] - S[s]
+            cov = (P[i] - np.outer(lead, m) - np.outer(m, lag)
+                   + (N - i) * np.outer(m, m)) / N
+            weight = i / (nw_lags_beta + 1)
+            C += 2 * (1 - weight) * cov
+
+        mean_betas[j] = m
+        std_betas[j] = np.sqrt(np.diag(C)) / np.sqrt(N)
+
+    return mean_betas, std_betas, mean_betas / std_betas
@@ -3,6 +3,7 @@ from datetime import datetime
 from pandas import Series, DataFrame
 import pandas as pd
 import numpy as np
+from fama_macbeth import fama_macbeth
 
 
 def cumret(ret,beg,end):
@@ -32,6 +33,6 @@ if __name__ == '__main__':
   print ind.head(20)
 
   # target returns
-  print pd.fama_macbeth(y=ind['ret'],x=ind.ix[:,['rmom']])
+  print fama_macbeth(y=ind['ret'],x=ind.ix[:,['rmom']])
   
   
\ No newline at end of file
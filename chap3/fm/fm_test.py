@@ -65,7 +65,8 @@ reg_pred = reg.predict(X_test)
 reg.score(X_test, y_test)
 
 factor_expoosure = reg.coef_
-specific_risk = reg.intercept_
+# the intercept is the asset's alpha, specific risk is the volatility of what the fit leaves over
+specific_risk = np.std(y_train - reg.predict(X_train))
 
 
 
@@ -114,20 +115,12 @@ reg.intercept_
 
 
 # bulk test
-from sklearn.multioutput import MultiOutputRegressor
+from exposures import first_pass
 targets = new_data[['BBG000C2V3D6', 'BBG005P7Q881', 'BBG000F7RCJ1', 'BBG000B9XRY4', 'BBG0025Y4RY4']]
-variables = new_data[['Mkt-RF', 'SMB', 'HML']].values
+variables = new_data[['Mkt-RF', 'SMB', 'HML']]
 
-reg = linear_model.LinearRegression(n_jobs = -1)
+# all the targets in one fit
+first = first_pass(targets, variables)
+print first.exposures, first.intercepts
 
-for y in targets:
-    reg.fit(X = variables, y = targets[y].values.reshape(-1,1))
-    print reg.coef_, reg.intercept_
-
-def fmb(series):
-    reg = linear_model.LinearRegression(n_jobs = -1)
-    reg.fit(X = variables, y = series.values.reshape(-1,1))
-    return list(reg.coef_.flatten())
-
-# returns a series - not ideal, but getting there
-coefs = targets.apply(fmb)
\ No newline at end of file
+coefs = pd.DataFrame(first.exposures.T, index = list(variables), columns = list(targets))
\ No newline at end of file
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import store
+
+
+def count_rows(path, blocksize = 1 << 24):
+    """
+    Number of lines after the header in a csv, without parsing it
+    
+    This is an upper bound on the data rows - pandas skips blank lines - so use it to size buffers, not as the row count.
+    """
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return lines - 1
+
+
+def ingest_prices(path, out, horizon = 250, risk_free = 'USGG10YR Index', rf_scale = 100.0, index_col = 'date', skip = 1, chunksize = 5000):
+    """
+    Stream a wide daily price csv into forward, trailing and excess return frames on disk
+    
+    Parameters
+    ----------
+    path : str
+        csv of prices, a date column and a column per security plus the risk free rate
+    out : str
+        directory the frames are written to (store format, read them back with store.load_frame)
+    horizon : int
+        number of rows the returns are measured over, 250 for annual returns on daily data
+    risk_free : str
+        risk free rate column, quoted in percent (divided by rf_scale)
+    skip : int
+        data rows to skip after the header - the spx csv has a junk first row
+    chunksize : int
+        rows parsed at a time
+    
+    Returns
+    -------
+    dict of memory-mapped DataFrames
+        forward_returns - return over the next horizon rows, dated at the start
+        trailing_returns - return over the last horizon rows, dated at the end
+        excess_returns - forward returns less the risk free rate quoted on the start date
+    
+    Note: A horizon row ring buffer of prices is carried across the chunk boundaries, so peak memory is about (chunksize + horizon) rows of the universe no matter how long the file is. The forward return dated t and the trailing return dated t + horizon are the same number, so they're computed and stored once - trailing_returns is the forward_returns values under the later dates (store.share_frame). Unlike pct_change, missing prices are not padded and give NaN returns.
+    The files are sized from a line count, which can overshoot (blank lines), and the frames are cut down to the rows actually parsed.
+    """
+    columns = pd.read_csv(path, index_col = index_col, nrows = 0).columns
+    assets = [c for c in columns if c != risk_free]
+    T = count_rows(path) - skip
+    n = max(T - horizon, 0)
+    
+    forward, excess = [store.create_frame(os.path.join(out, name), n, assets) for name in ('forward_returns', 'excess_returns')]
+    
+    dates = []
+    prices = np.empty((0, len(assets)))
+    rates = np.empty(0)
+    done = 0  # rows seen before the current chunk
+    reader = pd.read_csv(path, index_col = index_col, parse_dates = True, skiprows = range(1, 1 + skip), chunksize = chunksize)
+    for chunk in reader:
+        dates.extend(chunk.index)
+        # the buffer holds the last min(done, horizon) rows, so block row i is file row done - len(prices) + i
+        block = np.vstack([prices, chunk[assets].values.astype(np.float64)])
+        block_rates = np.concatenate([rates, chunk[risk_free].values.astype(np.float64) / rf_scale])
+        first = done - len(prices)
+        if len(block) > horizon:
+            returns = block[horizon:] / block[:-horizon] - 1.0
+            if first + len(returns) > n:
+                raise ValueError("%s has more rows than lines counted, are there quoted line breaks?" % path)
+            rows = slice(first, first + len(returns))
+            forward[rows] = returns
+            excess[rows] = returns - block_rates[:-horizon, np.newaxis]
+        done += len(chunk)
+        prices = block[-horizon:]
+        rates = block_rates[-horizon:]
+    
+    for array in (forward, excess):
+        array.flush()
+    n = max(len(dates) - horizon, 0)
+    store.write_labels(os.path.join(out, 'forward_returns'), dates[:n])
+    store.write_labels(os.path.join(out, 'excess_returns'), dates[:n])
+    store.share_frame(os.path.join(out, 'trailing_returns'), os.path.join(out, 'forward_returns'), dates[horizon:])
+    names = ('forward_returns', 'trailing_returns', 'excess_returns')
+    return dict((name, store.load_frame(os.path.join(out, name))) for name in names)
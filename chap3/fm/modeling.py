@@ -7,21 +7,18 @@ import pandas as pd
 # Fama-Macbeth Two Step Regression
 from sklearn import linear_model
 from data_prep import new_data
+from exposures import first_pass
 # First step is regressing excess Asset returns for N assets to K factor returns
-reg = linear_model.LinearRegression(n_jobs = -1, normalize=True)
 
 # the model targets are all the asset excess returns
 targets = list(new_data)[:-4]  # grab everything except the factor returns
 variables = list(new_data)[::-1][1:4]  # the Fama-French Factors
 
-
-factor_exposures = pd.DataFrame(columns = [variables], index = targets)
-specific_returns = pd.Series(index = targets)
-
-for asset in targets:
-    reg.fit(X = new_data[variables], y = new_data[asset])
-    factor_exposures.loc[asset] = reg.coef_
-    specific_returns.loc[asset] = reg.score(X = new_data[variables], y = new_data[asset])
+# every asset at once against the shared factor design
+first = first_pass(new_data[targets], new_data[variables])
+factor_exposures = pd.DataFrame(first.exposures, columns = variables, index = targets)
+# r2 is how much the factors explain, the specific risk comes from what they leave over
+specific_variance = pd.Series(first.resid_var, index = targets)
     
 
 # second step you need a portfolio
@@ -34,11 +31,9 @@ portfolio = new_data[list(new_data)[:20]]
 port_exposures = factor_exposures.loc[portfolio.columns]
 port_exposures.index.names = ['sec']
 
-stk = portfolio.stack()
-stk.index.names = ['date', 'sec']
-paneldata = port_exposures.mul(stk, axis = 0, level = 1)
-
-pangroup = paneldata.groupby(level = [0], axis = 0).apply(np.mean)
+# mean over the securities held each date of exposure * return - a dates by securities times securities by factors product, no stacked frame needed
+held = portfolio.notnull()
+pangroup = pd.DataFrame(np.dot(portfolio.fillna(0.0).values, port_exposures.values.astype(float)) / held.sum(axis = 1).values[:, np.newaxis], index = portfolio.index, columns = port_exposures.columns)
 port_returns = portfolio.mean(axis = 1)
 
 # I don't think you normalize for this one
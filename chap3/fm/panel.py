@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from store import _labels, _index
+
+
+class Panel(object):
+    """
+    Dense dates by assets by factors array with its labels
+    
+    values : T by N by K array
+        usually a memory-mapped .npy file, see Panel.create and Panel.open
+    dates, assets, factors : array_like
+        labels of the three axes
+    
+    Slicing by position with integers and slices (panel[10:20], panel[:, 100:200, 0]), between and iter_chunks return Panels that are views of the same memory, so a history far bigger than RAM can be walked a chunk of dates at a time. Indexing with a list or array of positions (panel[:, [0, 2]]) is numpy fancy indexing, so it reads the selection into a new in-memory array. np.asarray(panel) is the values array itself.
+    """
+    def __init__(self, values, dates, assets, factors):
+        self.values = values
+        self.dates = pd.Index(dates)
+        self.assets = pd.Index(assets)
+        self.factors = pd.Index(factors)
+        if values.shape != (len(self.dates), len(self.assets), len(self.factors)):
+            raise ValueError("values are %s but the labels are %s" % (values.shape, (len(self.dates), len(self.assets), len(self.factors))))
+    
+    def __repr__(self):
+        return 'Panel(%d dates x %d assets x %d factors)' % self.shape
+    
+    def __len__(self):
+        return len(self.dates)
+    
+    def __array__(self, dtype = None):
+        return np.asarray(self.values, dtype = dtype)
+    
+    @property
+    def shape(self):
+        return self.values.shape
+    
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        # integers would drop an axis, keep them as length one slices - slices stay views, lists and arrays copy
+        key = tuple(slice(k, k + 1 or None) if isinstance(k, (int, np.integer)) else k for k in key)
+        values = self.values
+        for (axis, k) in enumerate(key):
+            values = values[(slice(None),) * axis + (k,)]
+        return Panel(values, self.dates[key[0]], self.assets[key[1]], self.factors[key[2]])
+    
+    def between(self, start = None, stop = None):
+        """
+        Panel view of the dates from start through stop
+        """
+        return self[self.dates.slice_indexer(start, stop)]
+    
+    def factor(self, name):
+        """
+        dates by assets view of one factor
+        """
+        return pd.DataFrame(self.values[:, :, self.factors.get_loc(name)], index = self.dates, columns = self.assets, copy = False)
+    
+    def iter_chunks(self, size):
+        """
+        Panel views of size dates at a time
+        """
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+    
+    @classmethod
+    def create(cls, path, dates, assets, factors, fill = np.nan):
+        """
+        New memory-mapped panel on disk, filled with fill
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        values = np.lib.format.open_memmap(os.path.join(path, 'values.npy'), mode = 'w+', dtype = np.float64, shape = (len(dates), len(assets), len(factors)))
+        for start in range(0, len(dates), 256):
+            values[start:start + 256] = fill
+        for (name, labels) in (('dates', dates), ('assets', assets), ('factors', factors)):
+            np.save(os.path.join(path, name + '.npy'), _labels(labels))
+        return cls(values, dates, assets, factors)
+    
+    @classmethod
+    def open(cls, path, mode = 'r'):
+        """
+        Memory-map a panel written by create or save
+        """
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode = mode)
+        labels = [_index(np.load(os.path.join(path, name + '.npy'))) for name in ('dates', 'assets', 'factors')]
+        return cls(values, *labels)
+    
+    def save(self, path):
+        """
+        Write to disk a chunk of dates at a time and return the memory-mapped copy
+        """
+        panel = Panel.create(path, self.dates, self.assets, self.factors)
+        for start in range(0, len(self), 256):
+            panel.values[start:start + 256] = self.values[start:start + 256]
+        panel.values.flush()
+        return panel
+    
+    @classmethod
+    def from_frame(cls, frame):
+        """
+        Panel from a DataFrame (or Series) stacked on a (date, asset) MultiIndex with a column per factor
+        """
+        if isinstance(frame, pd.Series):
+            frame = frame.to_frame()
+        dates = frame.index.levels[0]
+        assets = frame.index.levels[1]
+        values = np.full((len(dates), len(assets), len(frame.columns)), np.nan)
+        values[frame.index.codes[0] if hasattr(frame.index, 'codes') else frame.index.labels[0],
+               frame.index.codes[1] if hasattr(frame.index, 'codes') else frame.index.labels[1]] = frame.values
+        return cls(values, dates, assets, frame.columns)
+    
+    def to_frame(self):
+        """
+        Stacked (date, asset) by factor DataFrame - only for panels that fit in memory
+        """
+        index = pd.MultiIndex.from_product([self.dates, self.assets])
+        return pd.DataFrame(np.asarray(self.values).reshape(-1, len(self.factors)), index = index, columns = self.factors)
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# bump when the on-disk layout or the prep code changes so old caches aren't reused
+CACHE_VERSION = 1
+
+
+def file_hash(path, blocksize = 1 << 20):
+    """
+    sha1 of a file's contents, read in blocks so big files don't have to fit in memory
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(sources, params):
+    """
+    Key of a cache entry - changes with the contents of any source file or any parameter
+    """
+    digest = hashlib.sha1()
+    digest.update(str(CACHE_VERSION).encode('utf-8'))
+    for path in sources:
+        digest.update(file_hash(path).encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys = True, default = str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _labels(labels):
+    values = np.asarray(pd.Index(labels))
+    if values.dtype == object:
+        values = values.astype('U')
+    return values
+
+
+def _index(values, name = None):
+    # labels saved by _labels back to an Index
+    if values.dtype.kind == 'M':
+        return pd.DatetimeIndex(values, name = name)
+    return pd.Index(values.tolist(), name = name)
+
+
+def _name(labels):
+    # name of an axis for meta.json, which only holds strings
+    name = getattr(labels, 'name', None)
+    return None if name is None else str(name)
+
+
+def save_frame(frame, directory):
+    """
+    Write a DataFrame or Series as .npy columns: values.npy (float64), index.npy and columns.npy
+    
+    The names of the index and columns go in meta.json with the rest of the description, as strings.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    series = isinstance(frame, pd.Series)
+    meta = {'kind': 'series' if series else 'frame'}
+    if series:
+        meta['name'] = None if frame.name is None else str(frame.name)
+        frame = frame.to_frame()
+    meta['index_name'] = _name(frame.index)
+    meta['columns_name'] = None if series else _name(frame.columns)
+    np.save(os.path.join(directory, 'values.npy'), np.ascontiguousarray(frame.values, dtype = np.float64))
+    np.save(os.path.join(directory, 'index.npy'), _labels(frame.index))
+    np.save(os.path.join(directory, 'columns.npy'), _labels(frame.columns))
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def create_frame(directory, nrows, columns):
+    """
+    Memory-mapped values.npy for a frame that's filled in a piece at a time
+    
+    Call write_labels once the index is known to finish the frame.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    np.save(os.path.join(directory, 'columns.npy'), _labels(columns))
+    return np.lib.format.open_memmap(os.path.join(directory, 'values.npy'), mode = 'w+', dtype = np.float64, shape = (nrows, len(columns)))
+
+
+def write_labels(directory, index):
+    """
+    Finish a frame started with create_frame
+    
+    The frame is as long as index - values.npy can have been made with room to spare, the rows past the end are left out when it's loaded.
+    """
+    np.save(os.path.join(directory, 'index.npy'), _labels(index))
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'kind': 'frame', 'rows': len(index), 'index_name': _name(index)}, f)
+
+
+def share_frame(directory, source, index):
+    """
+    Frame that reads its values from another frame's values.npy under a different index
+    
+    Nothing but the labels is written, so a second labelling of the same numbers costs no disk or I/O.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    shutil.copy(os.path.join(source, 'columns.npy'), os.path.join(directory, 'columns.npy'))
+    np.save(os.path.join(directory, 'index.npy'), _labels(index))
+    values = os.path.relpath(os.path.join(source, 'values.npy'), directory)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'kind': 'frame', 'rows': len(index), 'index_name': _name(index), 'values': values}, f)
+
+
+def load_frame(directory, mmap = True):
+    """
+    Read a frame written by save_frame - the values are memory-mapped and wrapped without copying
+    
+    The map is copy-on-write, so the frame can be changed like any other but the changes stay in memory and never reach the file.
+    """
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    values = np.load(os.path.join(directory, meta.get('values', 'values.npy')), mmap_mode = 'c' if mmap else None)
+    if 'rows' in meta:
+        values = values[:meta['rows']]
+    index = _index(np.load(os.path.join(directory, 'index.npy')), meta.get('index_name'))
+    columns = pd.Index(np.load(os.path.join(directory, 'columns.npy')).tolist(), name = meta.get('columns_name'))
+    if meta['kind'] == 'series':
+        return pd.Series(values[:, 0], index = index, name = meta['name'])
+    return pd.DataFrame(values, index = index, columns = columns, copy = False)
+
+
+def cached(directory, sources, params, build, mmap = True):
+    """
+    Frames from the cache entry for these sources and parameters, built and written first if there isn't one
+    
+    directory : str
+        cache root - each entry is a subdirectory named by its cache_key
+    sources : list
+        paths of the files the frames are built from
+    params : dict
+        parameters of the build, passed to it as keyword arguments so the key and the build can't disagree
+    build : callable
+        build(**params) returns a dict of name -> DataFrame or Series
+    
+    Note: The entry is written to a temporary directory and renamed into place, so a run that dies half way doesn't leave a broken entry behind.
+    """
+    path = os.path.join(directory, cache_key(sources, params))
+    if not os.path.isdir(path):
+        frames = build(**params)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp = tempfile.mkdtemp(dir = directory)
+        try:
+            for (name, frame) in frames.items():
+                save_frame(frame, os.path.join(tmp, name))
+            os.rename(tmp, path)
+        except OSError:
+            # somebody else finished the same entry first
+            shutil.rmtree(tmp, ignore_errors = True)
+            if not os.path.isdir(path):
+                raise
+    return dict((name, load_frame(os.path.join(path, name), mmap)) for name in os.listdir(path))
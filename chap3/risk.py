@@ -1,4 +1,43 @@
 import numpy as np
+import pandas as pd
+from scipy import linalg
+
+# Every function below works on a single series or on a T by N panel (array or DataFrame) of N assets at once, along axis. With skipna = True the NaN-aware numpy reductions are used, so assets with ragged listing histories don't need to be handled one at a time.
+
+
+def _values(x):
+    return np.asarray(x, dtype = np.float64)
+
+
+def _wrap(result, like, axis = 0):
+    # put the labels of a pandas input back on the result
+    if np.ndim(result) == 0 or not isinstance(like, (pd.Series, pd.DataFrame)):
+        return result
+    if isinstance(like, pd.Series):
+        return pd.Series(result, index = like.index[len(like) - len(result):], name = like.name)
+    if np.ndim(result) == 1:
+        return pd.Series(result, index = like.columns if axis == 0 else like.index)
+    if axis == 0:
+        return pd.DataFrame(result, index = like.index[len(like) - len(result):], columns = like.columns)
+    return pd.DataFrame(result, index = like.index, columns = like.columns[len(like.columns) - result.shape[1]:])
+
+
+def _along(b, ndim, axis):
+    # lay a benchmark series along axis of an ndim panel so it broadcasts against every asset
+    b = _values(b)
+    if b.ndim == ndim:
+        return b
+    shape = [1] * ndim
+    shape[axis] = len(b)
+    return b.reshape(shape)
+
+
+def _mean(x, axis, skipna):
+    return np.nanmean(x, axis = axis) if skipna else np.mean(x, axis = axis)
+
+
+def _var(x, axis, skipna):
+    return np.nanvar(x, axis = axis) if skipna else np.var(x, axis = axis)
 
 
 def cgr(beg, end, freq = 1, hold_period = 1):
@@ -8,27 +47,38 @@ def cgr(beg, end, freq = 1, hold_period = 1):
     return (end / beg) ** (freq / hold_period) - 1.0
 
 
-def ror(prices):
+def ror(prices, axis = 0):
     """
     Rate of Return
     pretty much a percent change
     """
-    return np.diff(prices) / prices[:len(prices) - 1]
+    p = _values(prices)
+    n = p.shape[axis]
+    return _wrap(np.diff(p, axis = axis) / np.take(p, np.arange(n - 1), axis = axis), prices, axis)
 
 
-def compound_returns(returns):
+def compound_returns(returns, axis = 0, skipna = False):
     """
     Compound Returns
     Cumulative returns assuming reinvestment
+    
+    With skipna, NaN returns (e.g. before an asset listed) count as no return and stay NaN in the result.
     """
-    return np.cumprod(1.0 + returns) - 1.0
+    r = _values(returns)
+    if skipna:
+        missing = np.isnan(r)
+        compounded = np.cumprod(1.0 + np.where(missing, 0.0, r), axis = axis) - 1.0
+        compounded[missing] = np.nan
+    else:
+        compounded = np.cumprod(1.0 + r, axis = axis) - 1.0
+    return _wrap(compounded, returns, axis)
 
 
-def compounded_returns(prices):
+def compounded_returns(prices, axis = 0, skipna = False):
     """
     Wrapper for ror and compound_returns functions
     """
-    return compound_returns(ror(prices))
+    return compound_returns(ror(prices, axis), axis, skipna)
 
 
 def annualized_return(R, t):
@@ -41,45 +91,83 @@ def annualized_return(R, t):
     return (1.0 + R) ** (1.0 / t) - 1.0
     
 
-def period_risk(returns, freq = None):
+def period_risk(returns, freq = None, axis = 0, skipna = False):
     """
     returns: numpy array
         Total Returns for a period
     freq: 
         number of instances that correspond to the return period - e.g. when calculation annual risk based on monthly total returns freq = 12
+        defaults to the number of returns of each asset
     """
+    r = _values(returns)
     if(freq == None):
-        freq = len(returns)
-    return np.sqrt(freq) * np.std(returns)
+        freq = np.sum(~np.isnan(r), axis = axis) if skipna else r.shape[axis]
+    return _wrap(np.sqrt(freq) * np.sqrt(_var(r, axis, skipna)), returns, axis)
 
 
-def active_risk(portfolio_returns, benchmark_returns):
+def active_risk(portfolio_returns, benchmark_returns, axis = 0, skipna = False):
     """
     Difference between portfolio and benchmark returns.
     Tracking Error when investing to a benchmark - describes how well the portfolio tracks to the benchmark.
     """
-    return np.std(portfolio_returns - benchmark_returns)
+    p = _values(portfolio_returns)
+    active = p - _along(benchmark_returns, p.ndim, axis)
+    return _wrap(np.sqrt(_var(active, axis, skipna)), portfolio_returns, axis)
 
 
-def beta(x, y):
-    return np.cov(x, y) / np.var(y)
+def _beta(p, b, axis, skipna):
+    # beta of every asset in p against benchmark b (already laid along axis) and the benchmark variance each one saw
+    b = np.broadcast_to(b, p.shape)
+    if skipna:
+        # only the periods where both have a return
+        both = np.isnan(p) | np.isnan(b)
+        p = np.where(both, np.nan, p)
+        b = np.where(both, np.nan, b)
+    dp = p - np.expand_dims(_mean(p, axis, skipna), axis)
+    db = b - np.expand_dims(_mean(b, axis, skipna), axis)
+    var_b = _mean(db**2, axis, skipna)
+    return _mean(dp * db, axis, skipna) / var_b, var_b
 
 
-def residual_risk(portfolio_returns, benchmark_returns):
+def beta(x, y, axis = 0, skipna = False):
+    """
+    Beta of x (one or many assets) to the benchmark y, cov(x, y) / var(y)
+    """
+    p = _values(x)
+    return _wrap(_beta(p, _along(y, p.ndim, axis), axis, skipna)[0], x, axis)
+
+
+def residual_risk(portfolio_returns, benchmark_returns, axis = 0, skipna = False):
     """
     Residual Risk of a Portfolio is the risk of return orthogonal to the systematic risk (the Beta Portfolio)
     """
-    return np.sqrt(np.std(portfolio_returns) -  beta(portfolio_returns, benchmark_returns)**2 * np.var(benchmark_returns))
+    p = _values(portfolio_returns)
+    b = _along(benchmark_returns, p.ndim, axis)
+    if skipna:
+        p = np.where(np.isnan(np.broadcast_to(b, p.shape)), np.nan, p)
+    (betas, var_b) = _beta(p, b, axis, skipna)
+    return _wrap(np.sqrt(_var(p, axis, skipna) - betas**2 * var_b), portfolio_returns, axis)
 
 
-def port_risk(positions):
+def port_risk(positions, axis = 0, skipna = False):
     """
     Risk of Portfolio of equally weighted positions
+    
+    positions : T by N prices, or a list of N price series
+    
+    Uses the average pairwise correlation, avg_risk * sqrt((1 + rho * (N - 1)) / N)
     """
-    returns = [compounded_returns(pos) for pos in positions]
-    avg_risk = np.mean([period_risk(ret) for ret in returns])
-    rho = np.corrcoef(returns)
-    return avg_risk * np.sqrt((1 + rho * len(returns) - 1) / len(returns))
+    if isinstance(positions, list):
+        positions = np.column_stack([_values(pos) for pos in positions])
+        axis = 0
+    returns = _values(compounded_returns(positions, axis, skipna))
+    if axis != 0:
+        returns = returns.T
+    n = returns.shape[1]
+    avg_risk = np.mean(_values(period_risk(returns, skipna = skipna)))
+    rho = pd.DataFrame(returns).corr().values if skipna else np.corrcoef(returns, rowvar = False)
+    avg_rho = (rho.sum() - n) / (n * (n - 1))
+    return avg_risk * np.sqrt((1 + avg_rho * (n - 1)) / n)
 
 
 def total_risk(returns, weights):
@@ -112,10 +200,232 @@ def characteristic_portfolio(V, a):
     """
     Returns the holdings of the Characteristic Portfolio. Characteristic Portfolio has minimum risk and unit exposure to a.
     
-    V : Covariance Matrix of excess returns for the risky assets (assumed nonsingular)
+    V : Covariance Matrix of excess returns for the risky assets (assumed nonsingular), or a FactorCovariance
     a : vector of asset attributes or characteristics
     """
-    return (V**-1.0 * a) / (a.T * V**-1 * a)
+    return characteristic_portfolios(V, a)[0]
+
+
+def characteristic_portfolios(V, A):
+    """
+    Holdings and variances of the Characteristic Portfolios of many attributes at once
+    
+    V : Covariance Matrix (N by N) or anything with a solve method, like RiskModel.FactorCovariance
+    A : N vector or N by A block of attributes, one column per attribute
+    
+    Returns (holdings, variances) - h_a = V^-1 a / (a' V^-1 a) with variance 1 / (a' V^-1 a)
+    """
+    return CharacteristicSolver(V).portfolios(A)
+
+
+class CharacteristicSolver(object):
+    """
+    Characteristic portfolios against one covariance matrix
+    
+    V : Covariance Matrix (N by N) or anything with a solve method, like RiskModel.FactorCovariance
+    
+    V is factored once (Cholesky, LU if it isn't positive definite) when the solver is made, so building portfolios for alpha, beta and every style factor on the same date is one triangular solve against the whole attribute block. A FactorCovariance is left as is, its solve uses the X F X' + Delta structure so nothing N by N is ever formed.
+    """
+    def __init__(self, V):
+        self.V = V
+        self._cho = None
+        self._lu = None
+        if not hasattr(V, 'solve'):
+            V = _values(V)
+            try:
+                self._cho = linalg.cho_factor(V)
+            except linalg.LinAlgError:
+                self._lu = linalg.lu_factor(V)
+    
+    def solve(self, b):
+        """
+        V^-1 b for a vector or an N by M block
+        """
+        if self._cho is not None:
+            return linalg.cho_solve(self._cho, b)
+        if self._lu is not None:
+            return linalg.lu_solve(self._lu, b)
+        return self.V.solve(b)
+    
+    def portfolios(self, A):
+        """
+        Returns (holdings, variances) of the characteristic portfolio of each column of A
+        
+        A : N vector or N by A block of attributes
+        """
+        values = _values(A)
+        block = values.reshape(len(values), -1)
+        VA = np.asarray(self.solve(block))
+        # a' V^-1 a for every column at once
+        exposure = np.einsum('ij,ij->j', block, VA)
+        holdings = VA / exposure
+        variances = 1.0 / exposure
+        if values.ndim == 1:
+            holdings, variances = holdings[:, 0], variances[0]
+            if isinstance(A, pd.Series):
+                holdings = pd.Series(holdings, index = A.index, name = A.name)
+        elif isinstance(A, pd.DataFrame):
+            holdings = pd.DataFrame(holdings, index = A.index, columns = A.columns)
+            variances = pd.Series(variances, index = A.columns)
+        return holdings, variances
+
+class RunningMoments(object):
+    """
+    Running mean and variance that take one return (or one array of returns) at a time
+    
+    decay : float
+        weight kept by the past on each update, 1.0 is an equally weighted history and e.g. 0.94 is RiskMetrics style exponential weighting
+    
+    Welford's update, so each update is O(1) and nothing but the moments is stored. The variance is the population variance like np.var.
+    """
+    def __init__(self, decay = 1.0):
+        self.decay = decay
+        self.count = 0
+        self.weight = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+    
+    def update(self, x):
+        x = np.asarray(x, dtype = np.float64)
+        self.count += 1
+        self.weight = self.decay * self.weight + 1.0
+        delta = x - self.mean
+        self.mean = self.mean + delta / self.weight
+        self.m2 = self.decay * self.m2 + delta * (x - self.mean)
+        return self
+    
+    def merge(self, other):
+        """
+        Fold in an accumulator over the observations that came after this one's
+        
+        With decay the earlier observations are discounted by the later ones, so the order matters. Without it this is Chan's parallel merge.
+        """
+        discount = self.decay ** other.count
+        a = self.weight * discount
+        b = other.weight
+        total = a + b
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * b / total
+        self.m2 = self.m2 * discount + other.m2 + delta**2 * a * b / total
+        self.weight = total
+        self.count += other.count
+        return self
+    
+    @property
+    def variance(self):
+        return self.m2 / self.weight
+    
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class TrackingError(RunningMoments):
+    """
+    Running active risk - the moments of portfolio less benchmark returns
+    """
+    def update(self, portfolio_return, benchmark_return):
+        return RunningMoments.update(self, np.asarray(portfolio_return) - np.asarray(benchmark_return))
+    
+    @property
+    def active_risk(self):
+        return self.std
+
+
+class RunningCovariance(object):
+    """
+    Running covariance of portfolio returns x against benchmark returns y, with the beta and residual risk that come out of it
+    
+    decay : float
+        weight kept by the past on each update
+    """
+    def __init__(self, decay = 1.0):
+        self.decay = decay
+        self.count = 0
+        self.weight = 0.0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2_x = 0.0
+        self.m2_y = 0.0
+        self.c_xy = 0.0
+    
+    def update(self, x, y):
+        x = np.asarray(x, dtype = np.float64)
+        y = np.asarray(y, dtype = np.float64)
+        decay = self.decay
+        self.count += 1
+        self.weight = decay * self.weight + 1.0
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x = self.mean_x + dx / self.weight
+        self.mean_y = self.mean_y + dy / self.weight
+        self.m2_x = decay * self.m2_x + dx * (x - self.mean_x)
+        self.m2_y = decay * self.m2_y + dy * (y - self.mean_y)
+        self.c_xy = decay * self.c_xy + dx * (y - self.mean_y)
+        return self
+    
+    def merge(self, other):
+        """
+        Fold in an accumulator over the observations that came after this one's
+        """
+        discount = self.decay ** other.count
+        a = self.weight * discount
+        b = other.weight
+        total = a + b
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        self.mean_x = self.mean_x + dx * b / total
+        self.mean_y = self.mean_y + dy * b / total
+        self.m2_x = self.m2_x * discount + other.m2_x + dx**2 * a * b / total
+        self.m2_y = self.m2_y * discount + other.m2_y + dy**2 * a * b / total
+        self.c_xy = self.c_xy * discount + other.c_xy + dx * dy * a * b / total
+        self.weight = total
+        self.count += other.count
+        return self
+    
+    @property
+    def covariance(self):
+        return self.c_xy / self.weight
+    
+    @property
+    def correlation(self):
+        return self.c_xy / np.sqrt(self.m2_x * self.m2_y)
+    
+    @property
+    def beta(self):
+        return self.c_xy / self.m2_y
+    
+    @property
+    def residual_variance(self):
+        return (self.m2_x - self.c_xy**2 / self.m2_y) / self.weight
+    
+    @property
+    def residual_risk(self):
+        return np.sqrt(self.residual_variance)
+
+
+class CompoundReturn(object):
+    """
+    Running compound return, the streaming version of compound_returns
+    """
+    def __init__(self):
+        self.count = 0
+        self.growth = 1.0
+    
+    def update(self, r):
+        self.count += 1
+        self.growth = self.growth * (1.0 + np.asarray(r, dtype = np.float64))
+        return self
+    
+    def merge(self, other):
+        self.count += other.count
+        self.growth = self.growth * other.growth
+        return self
+    
+    @property
+    def value(self):
+        return self.growth - 1.0
+
 
 if __name__ == '__main__':
     # testing with Quandl data
@@ -124,11 +434,9 @@ if __name__ == '__main__':
     quandl.ApiConfig.api_key = key
     data = quandl.get_table('WIKI/PRICES', qopts = { 'columns': ['ticker', 'date', 'adj_close'] }, ticker = ['AAPL', 'MSFT', 'AA'], date = { 'gte': '2010-01-01', 'lte': '2017-12-31' })
     
-    AAPL = data.loc[data['ticker'] == 'AAPL']
-    MSFT = data.loc[data['ticker'] == 'MSFT']
-    AA = data.loc[data['ticker'] == 'AA']
+    # one column per ticker, in date order
+    prices = data.pivot(index = 'date', columns = 'ticker', values = 'adj_close').sort_index()
     
-    import pandas as pd
     # bloomberg daily S&P index data
     spx = pd.read_csv('../grid1.csv', parse_dates = True)
     # reversing order to have increasing date, and get rid of the first date since it's the last day in 2009
@@ -137,31 +445,21 @@ if __name__ == '__main__':
     
     # you need to take the first date of the next period to get the returns on the last day
     spx_2010 = spx['PX_LAST'][0:253]
-    aapl_2010 = AAPL['adj_close'][0:253]
-    msft_2010 = MSFT['adj_close'][0:253]
-    aa_2010 = AA['adj_close'][0:253]
+    prices_2010 = prices[0:253]
     
     spx_comp_rets = compounded_returns(spx_2010)
-    aapl_comp_rets = compounded_returns(aapl_2010)
-    msft_comp_rets = compounded_returns(msft_2010)
-    aa_comp_rets = compounded_returns(aa_2010)
+    comp_rets = compounded_returns(prices_2010)
     
     spx_ann_risk = period_risk(spx_comp_rets)
-    aapl_ann_risk = period_risk(aapl_comp_rets)
-    msft_ann_risk = period_risk(msft_comp_rets)
-    aa_ann_risk = period_risk(aa_comp_rets)
-    
-    
-    residual_risk(aapl_comp_rets, spx_comp_rets)
-    residual_risk(msft_comp_rets, spx_comp_rets)
-    residual_risk(aa_comp_rets, spx_comp_rets)
+    ann_risk = period_risk(comp_rets)
     
+    residual_risk(comp_rets, spx_comp_rets)
     
-    my_port = [aapl_2010, msft_2010, aa_2010]
-    port_returns = np.sum([msft_comp_rets * .3, aapl_comp_rets * .3, aa_comp_rets * .4], axis = 0)
+    weights = pd.Series({'AAPL': .3, 'MSFT': .3, 'AA': .4})
+    port_returns = comp_rets[weights.index].values.dot(weights.values)
     residual_risk(port_returns, spx_comp_rets)
     active_risk(port_returns, spx_comp_rets)
-    my_port_risk = port_risk(my_port)
+    my_port_risk = port_risk(prices_2010)
     
     
     
\ No newline at end of file
@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+# Specific risk, the Delta in V = X F X' + Delta
+# Everything here works on a T by N panel of residual (specific) returns for all N assets at once and gives back a length N vector of variances, which RiskModel.returns_covariance, factor_return_matrix and FactorCovariance take directly.
+# See USE4 Methodology (Menchero, Orr, Wang 2011) for the Bayesian shrinkage and the structural model blend.
+
+
+def ewma_variance(u, decay = 1.0):
+    """
+    Exponentially weighted residual variance of every asset
+    
+    Parameters
+    ----------
+    u : T by N array or DataFrame
+        residual returns, oldest first, NaN where an asset has no data
+    decay : float
+        weight kept by the past each period, 1.0 is an equally weighted history
+    
+    Returns
+    -------
+    variance : N array
+        weighted mean of u^2 over the periods each asset was observed (residuals are mean zero), NaN for assets never observed
+    count : N array
+        effective number of observations behind each variance, (sum w)^2 / sum w^2 over the observed periods
+    """
+    u = np.asarray(u, dtype = np.float64)
+    if u.ndim == 1:
+        u = u[:, np.newaxis]
+    obs = np.isfinite(u)
+    w = decay ** np.arange(len(u) - 1, -1, -1, dtype = np.float64)
+    weight = np.dot(w, obs)
+    weight2 = np.dot(w**2, obs)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        variance = np.dot(w, np.where(obs, u, 0.0)**2) / weight
+        count = np.where(weight2 > 0, weight**2 / weight2, 0.0)
+    return variance, count
+
+
+def size_buckets(cap, n_buckets = 10):
+    """
+    Size decile (or n_buckets quantile) of each asset, -1 where the cap is missing
+    """
+    cap = np.asarray(cap, dtype = np.float64)
+    codes = np.full(len(cap), -1, dtype = np.intp)
+    known = np.isfinite(cap)
+    if known.any():
+        codes[known] = pd.qcut(pd.Series(cap[known]).rank(method = 'first'), min(n_buckets, known.sum()), labels = False).values
+    return codes
+
+
+def _bucket_mean(x, buckets, weights, use):
+    # weighted mean of x in each bucket over the assets in use, laid back out over every asset - NaN for assets without a bucket (-1)
+    n = max(buckets.max() + 1 if len(buckets) else 0, 1)
+    inside = use & (buckets >= 0)
+    total = np.bincount(buckets[inside], weights[inside], minlength = n)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = np.bincount(buckets[inside], (weights * x)[inside], minlength = n) / total
+        spread = np.sqrt(np.bincount(buckets[inside], (weights * x**2)[inside], minlength = n) / total - mean**2)
+    lookup = np.where(buckets >= 0, buckets, 0)
+    return np.where(buckets >= 0, mean[lookup], np.nan), np.where(buckets >= 0, spread[lookup], np.nan)
+
+
+def _weights(cap, n):
+    # cap weights, equal weights without caps (or when none of them are known)
+    if cap is None:
+        return np.ones(n)
+    weights = np.where(np.isfinite(cap), cap, 0.0)
+    return weights if weights.sum() > 0 else np.ones(n)
+
+
+def _average(x, weights):
+    # weighted mean, falling back to the plain mean when the weights are all zero (e.g. no caps known)
+    if not len(x):
+        return np.nan
+    if weights.sum() > 0:
+        return np.average(x, weights = weights)
+    return x.mean()
+
+
+def bayesian_shrinkage(sigma, buckets, cap = None, q = 0.1):
+    """
+    Shrink each asset's specific risk towards the (cap weighted) mean of its size bucket
+    
+    Parameters
+    ----------
+    sigma : N array
+        specific risk (volatility, not variance) of each asset
+    buckets : N int array
+        size bucket of each asset, e.g. from size_buckets, -1 to leave an asset alone
+    cap : N array
+        weights for the bucket means, equally weighted by default
+    q : float
+        shrinkage parameter, 0 for none
+    
+    Returns
+    -------
+    N array of shrunk specific risk, sigma_SH = v * mean + (1 - v) * sigma with v = q |sigma - mean| / (spread + q |sigma - mean|)
+    """
+    sigma = np.asarray(sigma, dtype = np.float64)
+    buckets = np.asarray(buckets, dtype = np.intp)
+    weights = _weights(cap, len(sigma))
+    mean, spread = _bucket_mean(sigma, buckets, weights, np.isfinite(sigma))
+    gap = q * np.abs(sigma - mean)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        v = np.where(gap > 0, gap / (spread + gap), 0.0)
+    return np.where(np.isfinite(v) & np.isfinite(mean), v * mean + (1.0 - v) * sigma, sigma)
+
+
+def structural_risk(sigma, reliable, exposures = None, buckets = None, cap = None):
+    """
+    Specific risk predicted from the assets' characteristics, for assets without enough history of their own
+    
+    Parameters
+    ----------
+    sigma : N array
+        time series specific risk
+    reliable : N bool array
+        assets whose sigma is trusted enough to fit the structural model
+    exposures : N by K array
+        factor exposures, log sigma is regressed on them (plus a constant) over the reliable assets
+    buckets : N int array
+        size buckets, used for a bucket mean when no exposures are given
+    cap : N array
+        regression / bucket weights, equally weighted by default
+    
+    Returns
+    -------
+    N array of structural specific risk
+    """
+    sigma = np.asarray(sigma, dtype = np.float64)
+    weights = _weights(cap, len(sigma))
+    use = reliable & (np.where(np.isfinite(sigma), sigma, 0.0) > 0)
+    if exposures is not None:
+        D = np.column_stack([np.asarray(exposures, dtype = np.float64), np.ones(len(sigma))])
+        use = use & np.isfinite(D).all(axis = 1)
+        if use.sum() > D.shape[1]:
+            root = np.sqrt(weights[use])[:, np.newaxis]
+            coef = np.linalg.lstsq(D[use] * root, np.log(sigma[use]) * root[:, 0], rcond = None)[0]
+            # E[sigma] over E[exp(fitted)] corrects the bias from fitting in logs
+            fitted = np.exp(np.dot(np.where(np.isfinite(D), D, 0.0), coef))
+            return fitted * _average(sigma[use], weights[use]) / _average(fitted[use], weights[use])
+    if buckets is not None:
+        mean = _bucket_mean(sigma, np.asarray(buckets, dtype = np.intp), weights, use)[0]
+        if use.any():
+            return np.where(np.isfinite(mean), mean, _average(sigma[use], weights[use]))
+    return np.full(len(sigma), _average(sigma[use], weights[use]))
+
+
+def specific_variance(u, decay = 1.0, cap = None, n_buckets = 10, q = 0.1, min_history = 0.25, full_history = 0.75, exposures = None):
+    """
+    Delta for every asset from a panel of residual returns
+    
+    Parameters
+    ----------
+    u : T by N array or DataFrame
+        residual (specific) returns, e.g. the u from RiskModel.factor_return_panel, NaN where an asset has no data
+    decay : float
+        EWMA decay of the time series estimate
+    cap : N array
+        market caps, for the size buckets and the cap weighted means. Without it there's no size bucketing, every asset is shrunk towards the overall mean
+    n_buckets : int
+        number of size buckets
+    q : float
+        Bayesian shrinkage parameter, 0 for none
+    min_history : float
+        effective observations below which the time series estimate gets no weight at all, as a fraction of the effective observations of an asset with the whole history
+    full_history : float
+        fraction of the whole history's effective observations at which the time series estimate gets all the weight
+    exposures : N by K array
+        factor exposures for the structural model, the size bucket means are used without them
+    
+    Returns
+    -------
+    N array of specific variances (a Series over the assets for a DataFrame) - not an N by N diagonal matrix
+    
+    Note: The time series risk is blended with the structural risk by the history each asset has, gamma = (count / most - min_history) / (full_history - min_history) clipped to [0, 1], then shrunk towards its size bucket. most is the effective count of an asset observed every period, which is all the decay allows - (1 + decay) / (1 - decay) at most - so the thresholds mean the same thing for any decay and panel length. Where there's no structural estimate the time series one is kept as is.
+    """
+    variance, count = ewma_variance(u, decay)
+    sigma = np.sqrt(variance)
+    N = len(sigma)
+    most = ewma_variance(np.zeros((len(u), 1)), decay)[1][0]
+    if cap is not None:
+        cap = np.asarray(cap, dtype = np.float64)
+        buckets = size_buckets(cap, n_buckets)
+    else:
+        buckets = np.zeros(N, dtype = np.intp)
+    
+    gamma = np.clip((count / most - min_history) / max(full_history - min_history, 1e-12), 0.0, 1.0)
+    gamma[~np.isfinite(sigma)] = 0.0
+    if (gamma < 1.0).any():
+        structural = structural_risk(sigma, gamma >= 1.0, exposures, buckets, cap)
+        with np.errstate(invalid = 'ignore'):
+            blend = np.where(gamma > 0, gamma * sigma, 0.0) + (1.0 - gamma) * structural
+        sigma = np.where(np.isfinite(structural), blend, sigma)
+    if q:
+        sigma = bayesian_shrinkage(sigma, buckets, cap, q)
+    
+    if isinstance(u, pd.DataFrame):
+        return pd.Series(sigma**2, index = u.columns)
+    return sigma**2
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+
+class GroupConstraint(object):
+    """
+    Cap on the total weight held in each group of a factor
+    
+    limit : float
+        maximum weight of a group
+    factor : key
+        Security.factors key to group by - None caps every position on its own
+    factor_value : key
+        only cap this group of the factor, the rest are left alone
+    """
+    def __init__(self, limit, factor = None, factor_value = None):
+        self.limit = limit
+        self.factor = factor
+        self.factor_value = factor_value
+    
+    def __repr__(self):
+        return 'GroupConstraint(%r, factor = %r, factor_value = %r)' % (self.limit, self.factor, self.factor_value)
+    
+    def caps(self, groups):
+        """
+        Cap for each group label, inf for the groups this constraint doesn't touch
+        """
+        if self.factor_value is None:
+            return np.repeat(float(self.limit), len(groups))
+        caps = np.repeat(np.inf, len(groups))
+        caps[np.asarray(groups) == self.factor_value] = self.limit
+        return caps
+
+
+def group_codes(labels):
+    """
+    Integer group code for each label and the array of group labels
+    
+    Missing labels (None or NaN) get the code -1 and aren't part of any group.
+    """
+    codes, groups = pd.factorize(np.asarray(labels, dtype = object))
+    return codes.astype(np.intp), np.asarray(groups)
+
+
+def apply_limits(weights, codes, caps, max_iter = 100, tol = 1e-10):
+    """
+    Scale weights down until every group cap is satisfied
+    
+    weights : ndarray
+        weights to limit, modified in place
+    codes : list of ndarray
+        group code of each weight for every constraint, -1 for weights outside the constraint
+    caps : list of ndarray
+        cap of each group for every constraint
+    
+    Returns
+    -------
+    weights : ndarray
+        the limited weights, with the same total as before
+    
+    Note : Each pass computes every group sum with np.bincount, scales the groups over their cap down to the cap and hands the freed weight to the names that aren't in a group at its cap. Giving out the freed weight can push new groups over, so it repeats until nothing is over.
+    """
+    total = weights.sum()
+    valid = [c >= 0 for c in codes]
+    for i in range(max_iter):
+        scale = np.ones(len(weights))
+        over = False
+        for (c, cap, v) in zip(codes, caps, valid):
+            sums = np.bincount(c[v], weights = weights[v], minlength = len(cap))
+            violated = sums > cap * (1.0 + tol)
+            if violated.any():
+                over = True
+                ratio = np.where(violated, cap / np.where(violated, sums, 1.0), 1.0)
+                scale[v] = np.minimum(scale[v], ratio[c[v]])
+        if not over:
+            return weights
+        weights *= scale
+        
+        # anything in a group sitting at its cap can't take more weight
+        free = weights > 0.0
+        for (c, cap, v) in zip(codes, caps, valid):
+            sums = np.bincount(c[v], weights = weights[v], minlength = len(cap))
+            binding = sums >= cap * (1.0 - tol)
+            free[v] &= ~binding[c[v]]
+        excess = total - weights.sum()
+        room = weights[free].sum()
+        if room <= 0.0:
+            raise ValueError("group limits can't hold the full portfolio weight")
+        weights[free] *= 1.0 + excess / room
+    raise ValueError("group limits didn't converge in %d iterations" % max_iter)
@@ -1,6 +1,160 @@
-class Factor(dict):
-    # I'm not totally sure how I should do this
-    # it's pretty much just a dictionary of the feature characteristics
-    # it should also contain a transformative function
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# every cross-section appended anywhere gets a new version, so a cached result can't be mistaken for one computed from other data
+_versions = itertools.count(1)
+
+
+class CrossSections(object):
+    """
+    Raw characteristic data as an ordered set of dated cross-sections
+    
+    Each date holds a Series indexed by asset and a version that changes whenever that date's data is replaced, which is what Factor caches against.
+    """
     def __init__(self):
-        pass
\ No newline at end of file
+        self.dates = []
+        self.data = {}
+        self.versions = {}
+        self._position = {}
+    
+    @classmethod
+    def from_frame(cls, df):
+        """
+        dates by assets DataFrame to CrossSections
+        """
+        sections = cls()
+        for (date, row) in df.iterrows():
+            sections.append(date, row)
+        return sections
+    
+    def __len__(self):
+        return len(self.dates)
+    
+    def __getitem__(self, date):
+        return self.data[date]
+    
+    def append(self, date, values):
+        """
+        Add or replace the cross-section for a date
+        
+        values : Series
+            characteristic values indexed by asset
+        """
+        if date not in self.data:
+            if self.dates and date < self.dates[-1]:
+                raise ValueError("dates have to be appended in order")
+            self._position[date] = len(self.dates)
+            self.dates.append(date)
+        self.data[date] = values
+        self.versions[date] = next(_versions)
+    
+    def shift(self, date, periods):
+        """
+        Date that is periods cross-sections before date, None if there isn't one
+        """
+        position = self._position[date] - periods
+        if position < 0 or position >= len(self.dates):
+            return None
+        return self.dates[position]
+
+
+class ZScore(object):
+    def __call__(self, values):
+        return (values - values.mean()) / values.std()
+
+
+class Winsorize(object):
+    def __init__(self, lower = 0.01, upper = 0.99):
+        self.lower = lower
+        self.upper = upper
+    
+    def __call__(self, values):
+        return values.clip(values.quantile(self.lower), values.quantile(self.upper))
+
+
+class Rank(object):
+    def __init__(self, pct = True):
+        self.pct = pct
+    
+    def __call__(self, values):
+        return values.rank(pct = self.pct)
+
+
+class Quantile(object):
+    """
+    Quantile buckets of the cross-section, e.g. Quantile(2, ["small", "large"]) for a size split
+    """
+    def __init__(self, q, labels = None):
+        self.q = q
+        self.labels = labels
+    
+    def __call__(self, values):
+        return pd.qcut(values, self.q, labels = self.labels)
+
+
+class Lag(object):
+    """
+    Use the cross-section from periods dates earlier
+    """
+    def __init__(self, periods = 1):
+        self.periods = periods
+
+
+class Factor(dict):
+    """
+    Factor defined as a pipeline of transforms over raw characteristic data
+    
+    name : str
+        name of the factor
+    transforms : list
+        ZScore, Winsorize, Rank, Quantile, Lag or any callable taking and returning a cross-section Series
+    
+    The Factor itself is a dictionary of date -> evaluated cross-section. Nothing is computed until a date is asked for, and a date is only recomputed when the raw data it came from has a new version, so appending a date to the CrossSections only costs that one cross-section.
+    
+    Note : Every transform except Lag works on a single cross-section, so the lags commute with the rest and are applied up front by reading an earlier date's raw data.
+    """
+    def __init__(self, name = None, transforms = ()):
+        dict.__init__(self)
+        self.name = name
+        self.transforms = [t for t in transforms if not isinstance(t, Lag)]
+        self.lag = sum(t.periods for t in transforms if isinstance(t, Lag))
+        # date -> (raw date, raw version) each cached cross-section was computed from
+        self._inputs = {}
+    
+    def __repr__(self):
+        return 'Factor(%r)' % self.name
+    
+    def evaluate(self, data, date):
+        """
+        Factor cross-section for one date of a CrossSections
+        """
+        source = data.shift(date, self.lag)
+        if source is None:
+            return pd.Series(np.nan, index = data[date].index)
+        key = (source, data.versions[source])
+        if self._inputs.get(date) == key:
+            return self[date]
+        
+        values = data[source]
+        for transform in self.transforms:
+            values = transform(values)
+        if self.name is not None:
+            values = values.rename(self.name)
+        self[date] = values
+        self._inputs[date] = key
+        return values
+    
+    def __call__(self, data, dates = None):
+        """
+        Evaluate the factor over every date (or the dates given) as a dates by assets DataFrame
+        
+        data : CrossSections or DataFrame
+            raw data - a DataFrame is wrapped in a new CrossSections each call, so keep a CrossSections around to benefit from the cache
+        """
+        if isinstance(data, pd.DataFrame):
+            data = CrossSections.from_frame(data)
+        if dates is None:
+            dates = data.dates
+        return pd.DataFrame.from_dict(dict((date, self.evaluate(data, date)) for date in dates), orient = 'index').reindex(dates)
@@ -1,33 +1,301 @@
 import numpy as np
 import pandas as pd
-from collections import defaultdict
-from copy import deepcopy
+from scipy import sparse
+from constraint import GroupConstraint, group_codes, apply_limits
+from security import _is_number
+from collections import MutableMapping
 
-class Portfolio:
-    def names(self): return self.port.keys()
-    def weights(self): return self.port.values()
+
+class PositionMap(MutableMapping):
+    """
+    Dictionary of positions backed by a contiguous float64 array
+    
+    Each name is assigned a slot in the weight array through an index dictionary. Removing a name leaves a tombstone (zero weight, dead slot) so the other slots don't move, and the array is compacted once the tombstones make up too much of it. Missing names read as 0.0 like the defaultdict this replaces, but reading doesn't insert them.
+    """
+    # compact once this fraction of the used slots are tombstones
+    compact_ratio = 0.5
+    
+    def __init__(self, capacity = 16):
+        self._index = {}
+        self._names = []
+        self._weights = np.zeros(capacity, dtype = np.float64)
+        self._alive = np.zeros(capacity, dtype = bool)
+        self._dead = 0
+        # bumped whenever the slot layout or the set of live slots changes so cached slot-aligned arrays can be invalidated
+        self.version = 0
+    
+    def __len__(self):
+        return len(self._index)
+    
+    def __iter__(self):
+        return iter(self.live_names())
+    
+    def __contains__(self, name):
+        return name in self._index
+    
+    def __getitem__(self, name):
+        slot = self._index.get(name)
+        if slot is None:
+            return 0.0
+        return self._weights[slot]
+    
+    def get(self, name, default = None):
+        slot = self._index.get(name)
+        if slot is None:
+            return default
+        return self._weights[slot]
+    
+    def __setitem__(self, name, weight):
+        slot = self._index.get(name)
+        if slot is None:
+            slot = self._insert(name)
+        self._weights[slot] = weight
+    
+    def __delitem__(self, name):
+        slot = self._index.pop(name)
+        self._weights[slot] = 0.0
+        self._alive[slot] = False
+        self._dead += 1
+        # the live mask changed, so anything cached against it (e.g. group codes) is stale
+        self.version += 1
+        if self._dead > self.compact_ratio * len(self._names):
+            self.compact()
+    
+    def _insert(self, name):
+        slot = len(self._names)
+        if slot == len(self._weights):
+            self._grow(2 * slot)
+        self._index[name] = slot
+        self._names.append(name)
+        self._alive[slot] = True
+        self.version += 1
+        return slot
+    
+    def _grow(self, capacity):
+        weights = np.zeros(capacity, dtype = np.float64)
+        alive = np.zeros(capacity, dtype = bool)
+        weights[:len(self._names)] = self._weights[:len(self._names)]
+        alive[:len(self._names)] = self._alive[:len(self._names)]
+        self._weights = weights
+        self._alive = alive
+    
+    def compact(self):
+        """
+        Drop the tombstones and renumber the live slots
+        """
+        if not self._dead:
+            return
+        used = len(self._names)
+        alive = self._alive[:used]
+        self._names = [name for (name, keep) in zip(self._names, alive) if keep]
+        capacity = max(16, 2 * len(self._names))
+        weights = np.zeros(capacity, dtype = np.float64)
+        weights[:len(self._names)] = self._weights[:used][alive]
+        self._weights = weights
+        self._alive = np.zeros(capacity, dtype = bool)
+        self._alive[:len(self._names)] = True
+        self._index = dict(zip(self._names, range(len(self._names))))
+        self._dead = 0
+        self.version += 1
+    
+    @property
+    def array(self):
+        """
+        View of the weights in every used slot - tombstones hold 0.0 so they can be left in sums and products
+        """
+        return self._weights[:len(self._names)]
+    
+    @property
+    def mask(self):
+        """
+        Boolean mask of the live slots in array
+        """
+        return self._alive[:len(self._names)]
+    
+    def live_names(self):
+        if self._dead:
+            return [name for (name, keep) in zip(self._names, self.mask) if keep]
+        return list(self._names)
+    
+    def live_weights(self):
+        if self._dead:
+            return self.array[self.mask]
+        return self.array.copy()
+    
+    def slots(self, names, insert = False):
+        """
+        Slot of each name as an integer array
+        
+        names : iterable
+            names to look up
+        insert : bool
+            give missing names a new slot, otherwise missing names get -1
+        """
+        index = self._index
+        if insert:
+            names = list(names)
+            used = len(self._names)
+            fresh = dict(zip(names, range(used, used + len(names))))
+            if len(fresh) == len(names) and (not index or not index.viewkeys() & fresh.viewkeys()):
+                # all new and no repeats (e.g. building a Portfolio), so the whole batch goes in without a loop
+                self._append(names, fresh)
+                return np.arange(used, used + len(names), dtype = np.intp)
+            new = []
+            for name in names:
+                if name not in index:
+                    index[name] = used + len(new)
+                    new.append(name)
+            if new:
+                self._append(new)
+            return np.array([index[name] for name in names], dtype = np.intp)
+        return np.array([index.get(name, -1) for name in names], dtype = np.intp)
+    
+    def _append(self, new, slots = None):
+        # new slots for names that aren't held, one grow and one version bump for the whole batch rather than per name
+        used = len(self._names)
+        if used + len(new) > len(self._weights):
+            self._grow(max(2 * used, used + len(new)))
+        if slots is not None:
+            self._index.update(slots)
+        self._names.extend(new)
+        self._alive[used:len(self._names)] = True
+        self.version += 1
+    
+    def copy(self):
+        """
+        Copy of the weight arrays and index - the names themselves (e.g. Security objects) are shared, not cloned
+        """
+        new = PositionMap.__new__(PositionMap)
+        new._index = self._index.copy()
+        new._names = list(self._names)
+        new._weights = self._weights.copy()
+        new._alive = self._alive.copy()
+        new._dead = self._dead
+        new.version = self.version
+        return new
+    
+    def assign(self, weights):
+        """
+        Set the weight of every used slot at once from an array lined up with array
+        
+        Slots set to 0.0 become tombstones and tombstones given a weight come back to life, so a whole solve can be written back without going name by name. Only the slots whose state changes are visited one at a time.
+        """
+        used = len(self._names)
+        weights = np.asarray(weights, dtype = np.float64)
+        alive = weights != 0.0
+        changed = np.flatnonzero(alive != self._alive[:used])
+        index = self._index
+        names = self._names
+        now = alive[changed]
+        killed = [names[slot] for slot in changed[~now].tolist()]
+        revived = changed[now].tolist()
+        # checked before anything changes so a bad array doesn't leave the index half updated
+        gone = set(killed)
+        held = set()
+        for slot in revived:
+            name = names[slot]
+            if (name in index and name not in gone) or name in held:
+                raise ValueError("%s would be held in two slots" % (name,))
+            held.add(name)
+        for name in killed:
+            del index[name]
+        for slot in revived:
+            index[names[slot]] = slot
+        self._weights[:used] = weights
+        self._alive[:used] = alive
+        self._dead = used - len(index)
+        if len(changed):
+            self.version += 1
+            if self._dead > self.compact_ratio * used:
+                self.compact()
+    
+    def add(self, names, weights):
+        """
+        Add weights to names in one vectorized pass, inserting names that aren't held yet
+        """
+        slots = self.slots(names, insert = True)
+        if len(slots):
+            # bincount sums repeated names like np.add.at would, but much faster
+            self.array[:] += np.bincount(slots, np.asarray(weights, dtype = np.float64), minlength = len(self._names))
+
+
+# group cache key for the slot -> security master row lookup
+_MASTER_ROWS = object()
+
+
+class Portfolio(object):
+    def names(self): return self.port.live_names()
+    def weights(self): return self.port.live_weights()
     
     def __init__(self, names = [], weights = [], factors = {}):
-        self.port = defaultdict(float)
-        for i in xrange(len(names)):
-            self.port[names[i]] += weights[i]
+        self.port = PositionMap(max(16, len(names)))
+        if len(names):
+            self.port.add(names, weights)
+        self.constraints = []
+        # factor -> (slot layout version, group codes, group labels)
+        self._groups = {}
     
     def normalize(self, total = 1.0):
-        weight_sum = sum(self.weights())
-        for i in self.port:
-            self.port[i] = (self.port[i] / weight_sum) * total
+        weights = self.port.array
+        weights *= total / weights.sum()
+    
+    def copy(self, port = None):
+        """
+        Shallow copy of the Portfolio - positions are copied but the names (Security objects) are shared
+        
+        port : PositionMap
+            positions of the copy instead of a copy of these ones, e.g. from a rebalance
+        """
+        temp_port = self.__class__.__new__(self.__class__)
+        temp_port.__dict__.update(self.__dict__)
+        temp_port.constraints = list(self.constraints)
+        if port is None:
+            temp_port.port = self.port.copy()
+            temp_port._groups = dict(self._groups)
+        else:
+            # the cached group codes belong to the old positions
+            temp_port.port = port
+            temp_port._groups = {}
+        return temp_port
+    
+    @classmethod
+    def combine(cls, portfolios, scalars = None):
+        """
+        Combine many portfolios into one
+        
+        portfolios : iterable
+            Portfolio objects to add together
+        scalars : iterable
+            multiplier applied to the weights of each portfolio, defaults to 1.0
+        
+        Note : This is one pass over the positions of every portfolio, so it's linear in the total number of positions. Unlike summing with + nothing gets copied along the way.
+        """
+        portfolios = list(portfolios)
+        if scalars is None:
+            scalars = [1.0] * len(portfolios)
+        combined = cls()
+        for (port, scalar) in zip(portfolios, scalars):
+            combined.port.add(port.names(), port.weights() * scalar)
+        return combined
     
     def __add__(self, rhs):
-        temp_port = deepcopy(self)
-        for name in rhs.names():
-            temp_port.port[name] += rhs.port[name]
+        temp_port = self.copy()
+        temp_port += rhs
         return temp_port
+    
+    def __iadd__(self, rhs):
+        self.port.add(rhs.names(), rhs.weights())
+        return self
         
     def __mul__(self, rhs):
-        temp_port = deepcopy(self)
-        temp_port.normalize(total = rhs)
+        temp_port = self.copy()
+        temp_port *= rhs
         return temp_port
     
+    def __imul__(self, rhs):
+        self.normalize(total = rhs)
+        return self
+    
     def remove(self, pos):
         del self.port[pos]
         self.normalize()
@@ -39,10 +307,10 @@ class Portfolio:
         return str(self.port.items())
     
     def to_pandas(self):
-        return pd.DataFrame.from_dict(self.port, orient = 'index')
+        return pd.DataFrame(self.weights(), index = self.names())
     
     def sum_weights(self):
-        return sum(self.weights())
+        return self.port.array.sum()
     
     def replace(self, to_replace, replacements = None):
         """
@@ -54,21 +322,81 @@ class Portfolio:
             dictionary of replacement securities
         
         Note : This will work with many to one, one to many, and many to many replacements. It's annoying that there is no default value for replacement percentages.
+        Without replacements the weight is spread equally over every other position held.
+        The rules are applied one after another in to_replace's order, so when a name is both replaced and a replacement the weight an earlier rule gives it is passed on by its own rule. Only that case takes the name by name path, everything else is one vectorized transfer.
         """
+        port = self.port
+        if replacements is not None and any(name in replacements for name in to_replace):
+            for (name, fraction) in to_replace.items():
+                nominal = port[name] * fraction
+                for (security, share) in replacements.items():
+                    port[security] += share * nominal
+                port[name] -= nominal
+                if port[name] == 0.0:
+                    del port[name]
+            return
+        
+        items = to_replace.items()
+        rows = port.slots([name for (name, _) in items])
+        fractions = np.array([fraction for (_, fraction) in items], dtype = np.float64)
+        # names that aren't held have nothing to give
+        held = rows >= 0
+        rows, fractions = rows[held], fractions[held]
+        taken = port.array[rows] * fractions
+        
         if replacements == None:
-            tempkeys = to_replace.viewkeys() ^ self.port.viewkeys()
-            replacements = dict(zip(tempkeys, [1.0 / len(tempkeys) for x in range(len(tempkeys))]))
-        
-        for replaced in to_replace.iteritems():
-            nominal_percent = self.port[replaced[0]] * replaced[1]
-                
-            for security in replacements.iteritems():
-                self.port[security[0]] += security[1] * nominal_percent
-            
-            self.port[replaced[0]] -= nominal_percent
-            
-            if(self.port[replaced[0]] == 0.0):
-                del self.port[replaced[0]]
+            others = port.mask.copy()
+            others[rows] = False
+            cols = np.flatnonzero(others)
+            if not len(cols):
+                raise ValueError("no positions left to take the replaced weight")
+            added = np.repeat(taken.sum() / len(cols), len(cols))
+        else:
+            items = replacements.items()
+            cols = port.slots([name for (name, _) in items], insert = True)
+            added = np.array([share for (_, share) in items], dtype = np.float64) * taken.sum()
+        
+        self._transfer(rows, taken, cols, added)
+    
+    def replace_matrix(self, to_replace, replacements, matrix, removed = None):
+        """
+        Bulk replacement of positions through a substitution matrix
+        
+        to_replace : list
+            names being replaced, the rows of matrix
+        replacements : list
+            replacement names, the columns of matrix
+        matrix : sparse matrix or array_like
+            matrix[i, j] is the fraction of to_replace[i]'s weight given to replacements[j]
+        removed : array_like
+            fraction of each replaced weight taken away, defaults to the row sums of matrix
+        
+        Note : This is a single sparse mat-vec so it costs the number of nonzeros in matrix rather than len(to_replace) * len(replacements). Every row uses the weights from before the replacement, so a name that's both replaced and a replacement isn't chained through. With matrix = outer(fractions, shares) and removed = fractions it's the same as replace as long as no name is on both sides, replace chains those.
+        """
+        port = self.port
+        matrix = sparse.csr_matrix(matrix, dtype = np.float64)
+        rows = port.slots(to_replace)
+        held = rows >= 0
+        nominal = np.zeros(len(rows))
+        nominal[held] = port.array[rows[held]]
+        
+        if removed is None:
+            removed = np.asarray(matrix.sum(axis = 1)).ravel()
+        taken = nominal * np.asarray(removed, dtype = np.float64)
+        added = matrix.T.dot(nominal)
+        cols = port.slots(replacements, insert = True)
+        
+        self._transfer(rows[held], taken[held], cols, added)
+    
+    def _transfer(self, rows, taken, cols, added):
+        # move weight out of the replaced slots and into the replacement slots, dropping anything replaced down to zero
+        port = self.port
+        weights = port.array
+        np.subtract.at(weights, rows, taken)
+        np.add.at(weights, cols, added)
+        rows = np.unique(rows)
+        for name in [port._names[slot] for slot in rows[weights[rows] == 0.0]]:
+            del port[name]
     
     def get_drift(self, old_price, new_price):
         """
@@ -78,36 +406,182 @@ class Portfolio:
     
     def apply_drift(self, drift):
         """
-        drift : dict
-            dictionary of assets and the percent drift
+        drift : dict, Series or array_like
+            dictionary of assets and the percent drift, or an array in the same order as names()
         """
-        for x in self.port.iterkeys():
-            self.port[x] = self.port[x] * (1.0 + drift[x])
+        port = self.port
+        if isinstance(drift, dict) or isinstance(drift, pd.Series):
+            drift = [drift[x] for x in port.live_names()]
+        weights = port.array
+        if port.mask.all():
+            weights *= 1.0 + np.asarray(drift, dtype = np.float64)
+        else:
+            weights[port.mask] *= 1.0 + np.asarray(drift, dtype = np.float64)
         self.normalize()
         
-    def set_constraint(self, constraint_func, factor = None, factor_value = None):
-        # group the port weights by the factor
-        # call the replace function based on the factor and factor value
-        # default to just the position weight
-        # optionally pass postion characteristic for group level limit
-        pass
+    def apply_drift_path(self, returns, names = None, terminal_only = False):
+        """
+        Apply a whole block of periodic drifts at once
+        
+        returns : T by N DataFrame or array
+            percent drift of each asset in each period, the columns are the asset names
+        names : list
+            asset names of the columns when returns is an array, defaults to names()
+        terminal_only : bool
+            only return the weights after the last period, without keeping the T by N path
+        
+        Returns
+        -------
+        The weights after every period (T by N, normalized like apply_drift) or just the terminal ones, in the column order of returns. The Portfolio ends up with the terminal weights.
+        
+        Note : Normalizing after every period is the same as normalizing the cumulative growth once, so the path is a cumprod and a row normalization instead of T apply_drift calls. Positions without a column don't drift.
+        """
+        frame = isinstance(returns, pd.DataFrame)
+        if frame:
+            names = list(returns.columns)
+        elif names is None:
+            names = self.names()
+        R = np.asarray(returns, dtype = np.float64)
+        
+        port = self.port
+        slots = port.slots(names)
+        held = slots >= 0
+        start = np.where(held, port.array[np.where(held, slots, 0)], 0.0)
+        # weight held outside the columns, it doesn't drift
+        other = port.array.sum() - start.sum()
+        
+        if terminal_only:
+            growth = np.ones(R.shape[1])
+            # a chunk of periods at a time so there's no T by N temporary
+            for first in range(0, len(R), 256):
+                growth *= np.prod(1.0 + R[first:first + 256], axis = 0)
+            values = start * growth
+            result = values / (values.sum() + other)
+        else:
+            values = start * np.cumprod(1.0 + R, axis = 0)
+            result = values / (values.sum(axis = 1) + other)[:, np.newaxis]
+            growth = values[-1] / np.where(start == 0.0, 1.0, start) if len(R) else np.ones(R.shape[1])
+        
+        if len(R):
+            port.array[slots[held]] *= growth[held]
+            self.normalize()
+        
+        if frame:
+            if terminal_only:
+                return pd.Series(result, index = returns.columns)
+            return pd.DataFrame(result, index = returns.index, columns = returns.columns)
+        return result
+    
+    def set_constraint(self, limit, factor = None, factor_value = None):
+        """
+        Add a group limit that apply_constraints will enforce
+        
+        limit : float
+            maximum weight of a group
+        factor : key
+            Security.factors key to group the positions by, defaults to limiting each position
+        factor_value : key
+            only limit this group of the factor
+        """
+        constraint = GroupConstraint(limit, factor, factor_value)
+        self.constraints.append(constraint)
+        return constraint
+    
+    def apply_constraints(self, **kwargs):
+        """
+        Enforce every constraint added with set_constraint at once
+        
+        kwargs are passed to constraint.apply_limits
+        """
+        self._apply_limits(self.constraints, **kwargs)
+    
+    def group_codes(self, factor):
+        """
+        Integer group code of every slot for a factor and the group labels
+        
+        The codes are cached until the slot layout or the security master's labels change, so repeated limits don't regroup the positions. Securities that don't share a master are grouped from scratch every time, nothing tracks changes to their labels.
+        """
+        port = self.port
+        (master, rows) = (None, None) if factor is None else self._master_rows()
+        key = (port.version, None if master is None else master.version)
+        cached = self._groups.get(factor)
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        
+        if factor is None:
+            codes = np.arange(len(port.array))
+            groups = np.arange(len(port.array))
+        elif master is not None:
+            (codes, groups) = master.codes(factor, rows)
+            codes = codes.copy()
+        else:
+            (codes, groups) = group_codes([getattr(name, 'factors', {}).get(factor) for name in port._names])
+            codes[~port.mask] = -1
+            return codes, groups
+        codes[~port.mask] = -1
+        self._groups[factor] = (key, codes, groups)
+        return codes, groups
+    
+    def _master_rows(self):
+        # security master shared by every slot and each slot's row in it, (None, None) if the names aren't securities of one master
+        port = self.port
+        cached = self._groups.get(_MASTER_ROWS)
+        if cached is not None and cached[0] == port.version:
+            return cached[1], cached[2]
+        masters = set(getattr(name, 'master', None) for name in port._names)
+        if len(masters) == 1 and None not in masters:
+            master = masters.pop()
+            rows = np.array([name.row for name in port._names], dtype = np.intp)
+        else:
+            master, rows = None, None
+        self._groups[_MASTER_ROWS] = (port.version, master, rows)
+        return master, rows
+    
+    def _apply_limits(self, constraints, **kwargs):
+        codes = []
+        caps = []
+        for constraint in constraints:
+            (c, groups) = self.group_codes(constraint.factor)
+            codes.append(c)
+            caps.append(constraint.caps(groups))
+        apply_limits(self.port.array, codes, caps, **kwargs)
         
     def factors(self):
-        # get the factors of the securities being held
-        # I'm not sure this should be implemented in the base object
-        # I wish I could make it a pure virtual function
-        # Factor exposure should be part of every object in the pipeline
+        """
+        Exposure matrix of the positions held (names() by the numeric factors)
+        
+        Note : When every position is a security of one SecurityMaster the rows come straight out of it, in the master's factor order, and when the positions are consecutive rows of the master this is a view and nothing is copied. Otherwise the matrix is built a row at a time from each security's factors, with the numeric factors any of them has as columns in sorted order and NaN where a security doesn't have one.
+        """
         # Look at aggregated factor exposure formula
-        return [key.factors for key in self.port.iterkeys()]
+        (master, rows) = self._master_rows()
+        if master is None:
+            factors = [getattr(name, 'factors', {}) for name in self.names()]
+            columns = sorted(set(factor for row in factors for (factor, value) in row.items() if _is_number(value)))
+            exposures = np.full((len(factors), len(columns)), np.nan)
+            for (i, row) in enumerate(factors):
+                for (j, factor) in enumerate(columns):
+                    value = row.get(factor)
+                    if _is_number(value):
+                        exposures[i, j] = value
+            return exposures
+        if self.port._dead:
+            rows = rows[self.port.mask]
+        return master.exposures(rows)
     
     
     # maybe try join multiplier like I did in R
     def limit(self, factor, group, limit, **kwargs):
-        df = self.to_pandas()
-        grp = df.groupby(factor)[group]
-        if grp['weight'].sum() > limit:
-            self.rebalance({name:weight / limit for (name, weight) in grp[['names', 'weights']]}, **kwargs)
-            self.normalize()
+        """
+        Limit the weight of a group of positions
+        
+        factor : key
+            Security.factors key to group the positions by
+        group : key
+            the group to limit, None limits every group of the factor
+        limit : float
+            maximum weight of the group
+        """
+        self._apply_limits([GroupConstraint(limit, factor, group)], **kwargs)
 
 
 class EquityPortfolio(Portfolio):
@@ -121,3 +595,107 @@ class CombinationPortfolio(Portfolio):
     # I don't know if this is all that necessary
     # the regular portfolio object can hold portfolios
     pass
+
+
+class PortfolioSet(object):
+    """
+    Many portfolios held against one model universe, as an M by N sparse weight matrix
+    
+    portfolios : iterable
+        Portfolio objects, one row each
+    universe : list
+        the N names of the risk model, in the model's order
+    labels : list
+        a label for each portfolio (e.g. account ids), 0 to M - 1 by default
+    
+    Note : Positions in names outside the universe can't be risked, their total weight is kept in unmapped. The risk methods take any model with X (N by K exposures), F (K by K factor covariance) and delta (N specific variances) like RiskModel.FactorCovariance, and go through the factor structure, (W X) F (W X)' + W Delta W' - nothing N by N is formed.
+    """
+    def __init__(self, portfolios, universe, labels = None):
+        portfolios = list(portfolios)
+        self.universe = list(universe)
+        index = dict(zip(self.universe, range(len(self.universe))))
+        self.labels = list(range(len(portfolios))) if labels is None else list(labels)
+        
+        cols = []
+        vals = []
+        indptr = [0]
+        self.unmapped = np.zeros(len(portfolios))
+        for (row, port) in enumerate(portfolios):
+            slots = np.array([index.get(name, -1) for name in port.names()], dtype = np.intp)
+            weights = port.weights()
+            held = slots >= 0
+            self.unmapped[row] = weights[~held].sum()
+            cols.append(slots[held])
+            vals.append(weights[held])
+            indptr.append(indptr[-1] + held.sum())
+        shape = (len(portfolios), len(self.universe))
+        self.W = sparse.csr_matrix((np.concatenate(vals) if vals else np.zeros(0), np.concatenate(cols) if cols else np.zeros(0, dtype = np.intp), indptr), shape = shape)
+        # a name held twice in a portfolio is one position
+        self.W.sum_duplicates()
+    
+    def __len__(self):
+        return self.W.shape[0]
+    
+    def _frame(self, values, columns = None):
+        if np.ndim(values) == 1:
+            return pd.Series(values, index = self.labels)
+        return pd.DataFrame(values, index = self.labels, columns = columns)
+    
+    def exposures(self, model):
+        """
+        M by K factor exposures of the portfolios, W X
+        """
+        return np.asarray(self.W.dot(model.X))
+    
+    def factor_variance(self, model):
+        WX = self.exposures(model)
+        return np.einsum('ij,ij->i', np.dot(WX, model.F), WX)
+    
+    def specific_variance(self, model):
+        return np.asarray(self.W.multiply(self.W).dot(model.delta)).ravel()
+    
+    def variance(self, model):
+        return self.factor_variance(model) + self.specific_variance(model)
+    
+    def risk(self, model):
+        """
+        Total, factor and specific risk of every portfolio, as a DataFrame
+        """
+        factor = self.factor_variance(model)
+        specific = self.specific_variance(model)
+        return pd.DataFrame({'total': np.sqrt(factor + specific), 'factor': np.sqrt(factor), 'specific': np.sqrt(specific)}, index = self.labels, columns = ['total', 'factor', 'specific'])
+    
+    def factor_contributions(self, model, factors = None):
+        """
+        Contribution of each factor to each portfolio's total risk, M by K plus a 'specific' column
+        
+        factors : list
+            names for the K factor columns
+        
+        Note : Euler contributions, x_k (F x)_k / risk with x = W X, so every row sums to the portfolio's total risk.
+        """
+        WX = self.exposures(model)
+        FWX = np.dot(WX, model.F)
+        specific = self.specific_variance(model)
+        total = np.sqrt(np.einsum('ij,ij->i', FWX, WX) + specific)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            contributions = np.column_stack([WX * FWX, specific]) / total[:, np.newaxis]
+        if factors is None:
+            factors = list(range(WX.shape[1]))
+        return self._frame(contributions, list(factors) + ['specific'])
+    
+    def marginal_contributions(self, model, rows = None):
+        """
+        Marginal contribution to risk of every name in the universe, V w / risk, as an M by N array
+        
+        rows : slice or index array
+            only these portfolios - the result is dense, so chunk a large set through this
+        """
+        W = self.W if rows is None else self.W[rows]
+        WX = np.asarray(W.dot(model.X))
+        FWX = np.dot(WX, model.F)
+        specific = np.asarray(W.multiply(W).dot(model.delta)).ravel()
+        total = np.sqrt(np.einsum('ij,ij->i', FWX, WX) + specific)
+        Vw = np.dot(FWX, np.transpose(model.X)) + W.multiply(model.delta[np.newaxis, :]).toarray()
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return Vw / total[:, np.newaxis]
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+
+from portfolio import Portfolio, PositionMap
+
+
+def _shift(d, k, total, nu = 0.0):
+    """
+    nu such that sum(soft_threshold(d - nu, k)) == total
+    
+    The sum is piecewise linear and decreasing in nu with kinks at d - k and d + k. A Newton step from any nu lands on the root of the linear piece nu is on, which is the answer once the step stays on that piece, so it takes a few O(N) passes with no sorting. Steps that leave the bracket fall back to bisection. nu is the starting guess, e.g. the shift of the previous solve.
+    """
+    if not len(d):
+        return 0.0
+    spread = abs(total) / len(d) + 1.0
+    # the kinks, made once so each pass only shifts them
+    below = d - k
+    above = d + k
+    lo = below.min() - spread
+    hi = above.max() + spread
+    n = len(d)
+    d_total = d.sum()
+    scale = np.abs(d).sum() + abs(total) + 1e-300
+    for i in range(200):
+        # soft_threshold(x, k) = x - clip(x, -k, k) and the clip is (|x + k| - |x - k|) / 2 with x = d - nu, plain arithmetic is much quicker than maximum/minimum here
+        level = d_total - n * nu - 0.5 * (np.abs(above - nu).sum() - np.abs(below - nu).sum()) - total
+        if abs(level) <= 1e-14 * scale:
+            return nu
+        if level > 0.0:
+            lo = nu
+        else:
+            hi = nu
+        # the names trading at this shift, x > k or x < -k
+        slope = np.count_nonzero(below > nu) + np.count_nonzero(above < nu)
+        step = nu + level / slope if slope else hi + lo - nu
+        nu = step if lo < step < hi else 0.5 * (lo + hi)
+        if hi - lo <= 1e-15 * scale:
+            break
+    return nu
+
+
+class Rebalancer(object):
+    """
+    Turnover and cost aware rebalancing from a current to a target Portfolio
+    
+    cost : float, dict or Series
+        linear transaction cost per unit of weight traded, for every name or by name
+    default_cost : float
+        cost of the names a dict or Series of costs leaves out - without it a missing name raises KeyError, rather than quietly becoming the cheapest place to trade
+    min_trade : float
+        trades smaller than this are skipped
+    risk_aversion : float
+        penalty on the distance left to the target - the higher it is the closer the rebalance gets for the same costs
+    
+    The trades minimize risk_aversion / 2 * |w - target|^2 + sum(cost * |w - current|) while keeping the total weight of the target. The solution is the weight difference soft-thresholded by cost / risk_aversion around one shift that keeps the trades balanced, so it's a handful of vectorized passes over the aligned weight arrays.
+    Only the names held by either portfolio can trade. solve on already aligned arrays is the fast path, under a millisecond for 10k names (one _shift per solve plus one more each time min_trade drops names), and it's what run_backtest uses. trades and rebalance also line up the names of two Portfolios and build a new one - a millisecond or two for 10k names when they share slots (see rebalance), several when the names have to be looked up one at a time.
+    """
+    def __init__(self, cost = 0.0, min_trade = 0.0, risk_aversion = 1.0, default_cost = None):
+        self.cost = cost
+        self.default_cost = default_cost
+        self.min_trade = min_trade
+        self.risk_aversion = risk_aversion
+    
+    def _shared(self, current, target):
+        """
+        (port, live, cur, tgt) lined up on the slots of whichever PositionMap's layout extends the other's, None if neither does
+        
+        A Portfolio and its copy() share their slots (names added to either one later go on the end), so they line up with array operations instead of a pass over the names.
+        """
+        c, t = current.port, target.port
+        (short, port) = (c, t) if len(c._names) <= len(t._names) else (t, c)
+        if port._names[:len(short._names)] != short._names:
+            return None
+        used = len(port._names)
+        live_c = _padded(c.mask, used)
+        live_t = _padded(t.mask, used)
+        # a name one side deleted and added back sits in a different slot on each side, it would show up twice
+        for slot in np.flatnonzero(live_c != live_t):
+            name = port._names[slot]
+            if c._index.get(name, slot) != slot or t._index.get(name, slot) != slot:
+                return None
+        live = np.flatnonzero(live_c | live_t)
+        return port, live, _padded(c.array, used)[live], _padded(t.array, used)[live]
+    
+    def align(self, current, target):
+        """
+        Names held by either portfolio with the current and target weights in that order
+        """
+        shared = self._shared(current, target)
+        if shared is not None:
+            (port, live, cur, tgt) = shared
+            return [port._names[i] for i in live], cur, tgt
+        port = target.port
+        held = port.mask
+        names = port.live_names()
+        current_names = current.names()
+        current_weights = current.weights()
+        slots = port.slots(current_names)
+        # a deleted target name is no longer in the index, so it's only here if current still holds it
+        extra = np.flatnonzero(slots < 0)
+        shared = np.flatnonzero(slots >= 0)
+        names.extend([current_names[i] for i in extra])
+        tgt = np.concatenate([port.array[held], np.zeros(len(extra))])
+        cur = np.zeros(len(tgt))
+        # position of each live slot among the live names
+        live = np.cumsum(held) - 1
+        cur[live[slots[shared]]] = current_weights[shared]
+        cur[len(tgt) - len(extra):] = current_weights[extra]
+        return names, cur, tgt
+    
+    def costs(self, names):
+        if isinstance(self.cost, (dict, pd.Series)):
+            if self.default_cost is None:
+                missing = [name for name in names if name not in self.cost]
+                if missing:
+                    raise KeyError("no transaction cost for %s, give the Rebalancer a default_cost" % missing[:10])
+            return np.array([self.cost.get(name, self.default_cost) for name in names], dtype = np.float64)
+        return np.repeat(float(self.cost), len(names))
+    
+    def solve(self, current, target, costs):
+        """
+        Trade array for aligned current and target weight arrays
+        """
+        d = target - current
+        total = d.sum()
+        k = costs / self.risk_aversion
+        trades = np.zeros(len(d))
+        # slots still allowed to trade, with their diffs and thresholds
+        rows = np.arange(len(d))
+        nu = 0.0
+        # skipping small trades unbalances the rest, so solve again without them until nothing else drops out - each solve starts from the last shift
+        while len(rows):
+            nu = _shift(d, k, total, nu)
+            x = d - nu
+            traded = np.where(np.abs(x) > k, x - np.copysign(k, x), 0.0)
+            small = (traded != 0.0) & (np.abs(traded) < self.min_trade)
+            if not small.any():
+                trades[rows] = traded
+                break
+            keep = ~small
+            rows, d, k = rows[keep], d[keep], k[keep]
+        return trades
+    
+    def _slot_costs(self, port, live):
+        # costs of the live slots, the names are only looked up for costs by name
+        if isinstance(self.cost, (dict, pd.Series)):
+            return self.costs([port._names[i] for i in live])
+        return np.repeat(float(self.cost), len(live))
+    
+    def trades(self, current, target):
+        """
+        Portfolio of the (signed) trades that take current towards target
+        """
+        shared = self._shared(current, target)
+        if shared is not None:
+            (port, live, cur, tgt) = shared
+            trades = Portfolio()
+            trades.port = _assigned(port, live, self.solve(cur, tgt, self._slot_costs(port, live)))
+            return trades
+        names, cur, tgt = self.align(current, target)
+        trades = self.solve(cur, tgt, self.costs(names))
+        traded = np.flatnonzero(trades)
+        return Portfolio([names[i] for i in traded], trades[traded])
+    
+    def transaction_cost(self, trades):
+        return np.sum(self.costs(trades.names()) * np.abs(trades.weights()))
+    
+    def rebalance(self, current, target):
+        """
+        New Portfolio after trading current towards target
+        
+        Note : When one portfolio is a copy() of the other (or of a common ancestor that only grew) the names are lined up with array operations on their shared slots, otherwise one at a time. Either way the new Portfolio needs its own copy of the name index, which is most of the millisecond or so the shared case takes for 10k names - inside a backtest give the BacktestConfig the Rebalancer and it runs solve on the weight arrays instead.
+        """
+        shared = self._shared(current, target)
+        if shared is not None:
+            (port, live, cur, tgt) = shared
+            return current.copy(_assigned(port, live, cur + self.solve(cur, tgt, self._slot_costs(port, live))))
+        names, cur, tgt = self.align(current, target)
+        weights = cur + self.solve(cur, tgt, self.costs(names))
+        held = np.flatnonzero(weights)
+        # built straight from the aligned arrays, positions traded down to zero are left out
+        port = PositionMap(max(16, len(held)))
+        port.add([names[i] for i in held], weights[held])
+        return current.copy(port)
+
+def _padded(array, n):
+    # array zero padded out to n
+    padded = np.zeros(n, dtype = array.dtype)
+    padded[:len(array)] = array
+    return padded
+
+
+def _assigned(port, live, weights):
+    # copy of port with the live slots set to weights and everything else zero
+    new = port.copy()
+    full = np.zeros(len(new._names))
+    full[live] = weights
+    new.assign(full)
+    return new
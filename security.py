@@ -1,16 +1,276 @@
-class Security:
-    def __init__(self, name, factors = {}):
+import numbers
+from collections import MutableMapping
+
+import numpy as np
+import pandas as pd
+
+
+class FactorTable(object):
+    """
+    Column-wise store of security characteristics
+    
+    Numeric factors live together in one float64 array (rows by factors, NaN where missing) so the exposure matrix of a set of securities is a slice or a single take. Labels (sector, country, ...) are stored as integer codes into a list of categories, -1 where missing.
+    
+    capacity : int
+        rows allocated up front
+    categorical : iterable
+        factors stored as labels even though their values are numbers, e.g. integer GICS codes. Otherwise a factor's kind is set by the first value it's given.
+    """
+    def __init__(self, capacity = 64, categorical = ()):
+        self.n = 0
+        # bumped by every set, so anything cached from the table (e.g. a Portfolio's group codes) can tell it's stale
+        self.version = 0
+        self._declared = set(categorical)
+        self.numeric = []
+        self._numeric_index = {}
+        self._values = np.empty((capacity, 0), dtype = np.float64)
+        self._codes = {}
+        self._categories = {}
+        self._category_index = {}
+    
+    def __len__(self):
+        return self.n
+    
+    def __contains__(self, factor):
+        return factor in self._numeric_index or factor in self._codes
+    
+    @property
+    def categorical(self):
+        return list(self._codes)
+    
+    def factors(self):
+        return self.numeric + self.categorical
+    
+    def _capacity(self):
+        return len(self._values)
+    
+    def _grow(self, capacity):
+        values = np.full((capacity, len(self.numeric)), np.nan)
+        values[:self.n] = self._values[:self.n]
+        self._values = values
+        for factor in self._codes:
+            codes = np.full(capacity, -1, dtype = np.intp)
+            codes[:self.n] = self._codes[factor][:self.n]
+            self._codes[factor] = codes
+    
+    def _add_factor(self, factor, value):
+        if _is_number(value) and factor not in self._declared:
+            self._numeric_index[factor] = len(self.numeric)
+            self.numeric.append(factor)
+            values = np.full((self._capacity(), len(self.numeric)), np.nan)
+            values[:, :-1] = self._values
+            self._values = values
+        else:
+            self._codes[factor] = np.full(self._capacity(), -1, dtype = np.intp)
+            self._categories[factor] = []
+            self._category_index[factor] = {}
+    
+    def add_row(self, factors = {}):
+        """
+        Append a row of characteristics and return its row number
+        """
+        # check before anything changes so a bad value doesn't leave half a row behind
+        for (factor, value) in factors.iteritems():
+            self._check(factor, value)
+        if self.n == self._capacity():
+            self._grow(max(64, 2 * self.n))
+        row = self.n
+        self._values[row] = np.nan
+        for factor in self._codes:
+            self._codes[factor][row] = -1
+        self.n += 1
+        self.update(row, factors)
+        return row
+    
+    def update(self, row, factors):
+        for (factor, value) in factors.iteritems():
+            self.set(row, factor, value)
+    
+    def _check(self, factor, value):
+        if factor in self._numeric_index and value is not None and not _is_number(value):
+            raise TypeError("%r is a numeric factor, got %r - declare it categorical if it holds labels" % (factor, value))
+    
+    def set(self, row, factor, value):
+        if factor not in self:
+            self._add_factor(factor, value)
+        self._check(factor, value)
+        self.version += 1
+        if factor in self._numeric_index:
+            if value is None:
+                value = np.nan
+            self._values[row, self._numeric_index[factor]] = value
+            return
+        index = self._category_index[factor]
+        if value is None:
+            code = -1
+        elif value in index:
+            code = index[value]
+        else:
+            code = index[value] = len(self._categories[factor])
+            self._categories[factor].append(value)
+        self._codes[factor][row] = code
+    
+    def get(self, row, factor, default = None):
+        if factor in self._numeric_index:
+            value = self._values[row, self._numeric_index[factor]]
+            return default if np.isnan(value) else value
+        if factor in self._codes:
+            code = self._codes[factor][row]
+            return default if code < 0 else self._categories[factor][code]
+        return default
+    
+    def row_dict(self, row):
+        """
+        Characteristics of one row as a dictionary, leaving out the missing ones
+        """
+        missing = object()
+        values = ((factor, self.get(row, factor, missing)) for factor in self.factors())
+        return dict((factor, value) for (factor, value) in values if value is not missing)
+    
+    def _take(self, array, rows):
+        if rows is None:
+            return array[:self.n]
+        rows = np.asarray(rows, dtype = np.intp)
+        # a run of consecutive rows can be a view instead of a copy
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and (len(rows) == 1 or (np.diff(rows) == 1).all()):
+            return array[rows[0]:rows[-1] + 1]
+        return array[rows]
+    
+    def exposures(self, rows = None, factors = None):
+        """
+        Exposure matrix (rows by numeric factors)
+        
+        rows : array_like
+            rows to return, defaults to all of them
+        factors : list
+            numeric factors to return, defaults to self.numeric
+        
+        Note : With every factor and consecutive rows this is a view of the table, otherwise it's one take.
+        """
+        values = self._take(self._values, rows)
+        if factors is not None:
+            values = values[:, [self._numeric_index[f] for f in factors]]
+        return values
+    
+    def codes(self, factor, rows = None):
+        """
+        Integer group codes of a factor and the group labels they index
+        
+        Numeric factors are grouped by value.
+        """
+        if factor in self._codes:
+            return self._take(self._codes[factor], rows), np.asarray(self._categories[factor], dtype = object)
+        if factor in self._numeric_index:
+            codes, groups = pd.factorize(self.exposures(rows, [factor])[:, 0])
+            return codes.astype(np.intp), groups
+        n = self.n if rows is None else len(rows)
+        return np.full(n, -1, dtype = np.intp), np.empty(0, dtype = object)
+
+
+class SecurityMaster(FactorTable):
+    """
+    FactorTable with a row per security name
+    """
+    def __init__(self, capacity = 64, categorical = ()):
+        FactorTable.__init__(self, capacity, categorical)
+        self.names = []
+        self.index = {}
+    
+    def add(self, name, factors = {}, update = False):
+        """
+        Row of a security, adding it if it's new
+        
+        For a known name, characteristics it doesn't have yet are filled in. Changing one it already has raises ValueError unless update is True, so two securities made with the same name can't quietly rewrite each other.
+        """
+        row = self.index.get(name)
+        if row is None:
+            row = self.index[name] = self.add_row(factors)
+            self.names.append(name)
+            return row
+        if not update:
+            missing = object()
+            for (factor, value) in factors.iteritems():
+                current = self.get(row, factor, missing)
+                if current is not missing and current != value:
+                    raise ValueError("%s already has %s = %r, not %r - pass update = True to change it" % (name, factor, current, value))
+        self.update(row, factors)
+        return row
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+class FactorView(MutableMapping):
+    """
+    Dictionary view of one security's row in its master
+    """
+    __slots__ = ('master', 'row')
+    
+    def __init__(self, master, row):
+        self.master = master
+        self.row = row
+    
+    def _items(self):
+        return self.master.row_dict(self.row)
+    
+    def __getitem__(self, factor):
+        missing = object()
+        value = self.master.get(self.row, factor, missing)
+        if value is missing:
+            raise KeyError(factor)
+        return value
+    
+    def get(self, factor, default = None):
+        return self.master.get(self.row, factor, default)
+    
+    def __setitem__(self, factor, value):
+        self.master.set(self.row, factor, value)
+    
+    def __delitem__(self, factor):
+        self[factor]
+        self.master.set(self.row, factor, np.nan if factor in self.master.numeric else None)
+    
+    def __iter__(self):
+        return iter(self._items())
+    
+    def __len__(self):
+        return len(self._items())
+    
+    def __repr__(self):
+        return repr(self._items())
+
+
+class Security(object):
+    # a handle into the security master - the characteristics live there, not on the object
+    # securities made without a master keep their characteristics in a plain dict like they always have, share a SecurityMaster to get the columnar exposures and group codes
+    __slots__ = ('name', 'master', 'row', '_factors')
+    
+    def __init__(self, name, factors = {}, master = None, update = False):
         self.name = name
-        self.factors = factors
+        self.master = master
+        if master is None:
+            self.row = None
+            self._factors = dict(factors)
+        else:
+            self.row = master.add(name, factors, update)
+            self._factors = None
     def __repr__(self):
         return self.name
     def __str__(self):
         return self.name
+    
+    @property
+    def factors(self):
+        if self.master is None:
+            return self._factors
+        return FactorView(self.master, self.row)
+    
     def price(self):
         pass
 
 class Equity(Security):
-    pass
+    __slots__ = ()
     
 class Bond(Security):
-    pass
\ No newline at end of file
+    __slots__ = ()
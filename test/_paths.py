@@ -0,0 +1,9 @@
+# the modules aren't installed, put the repo's module directories on the path for the tests
+# run from the repo root with: python -m unittest discover -s test -p "test_*.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, 'chap3', 'fm'), os.path.join(ROOT, 'chap3'), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,91 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+from backtest import BacktestConfig, run_backtest, simulate
+from portfolio import Portfolio
+from rebalance import Rebalancer
+
+
+class BacktestTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.names = ['a', 'b', 'c', 'd']
+        self.prices = pd.DataFrame(100.0 * np.cumprod(1.0 + 0.02 * rng.randn(25, 4), axis = 0), columns = self.names)
+        self.target = np.array([0.4, 0.3, 0.2, 0.1])
+    
+    def looped(self, target, rebalance):
+        # one Portfolio drifted a period at a time, the way a single backtest would do it
+        port = Portfolio(self.names, target)
+        returns = []
+        for t in range(1, len(self.prices)):
+            drift = port.get_drift(self.prices.iloc[t - 1], self.prices.iloc[t])
+            returns.append(np.dot(port.weights(), drift.values))
+            port.apply_drift(drift)
+            if rebalance and t % rebalance == 0:
+                port = Portfolio(self.names, target)
+        return np.array(returns)
+    
+    def test_matches_looped_apply_drift(self):
+        p = self.prices.values
+        returns = (p[1:] - p[:-1]) / p[:-1]
+        targets = np.array([self.target, self.target[::-1], self.target])
+        port_returns, path = simulate(returns, targets, [0, 3, 5], keep_weights = True)
+        for (m, rebalance) in enumerate([0, 3, 5]):
+            np.testing.assert_allclose(port_returns[:, m], self.looped(targets[m], rebalance))
+        np.testing.assert_allclose(path[1, 2], targets[1])
+    
+    def test_processes_agree(self):
+        configs = [(self.target, None), (self.target, 2, 'monthly'), BacktestConfig(self.target[::-1], 4)]
+        serial = run_backtest(self.prices, configs, processes = 1)[0]
+        parallel = run_backtest(self.prices, configs, processes = 2, batch_size = 1)[0]
+        pd.testing.assert_frame_equal(serial, parallel)
+        self.assertEqual(list(serial.columns), [0, 'monthly', 2])
+    
+    def test_replacements_and_constraints_shape_the_target(self):
+        rules = ({'a': 1.0}, {'b': 0.5, 'c': 0.5})
+        port = Portfolio(self.names, self.target)
+        port.replace(*rules)
+        port.limit(None, None, 0.45)
+        expected = np.array([port.port[name] for name in self.names])
+        config = BacktestConfig(Portfolio(self.names, self.target), 1, constraints = [(0.45,)], replace = rules)
+        result = run_backtest(self.prices, [config, (expected, 1)], processes = 1)[0]
+        np.testing.assert_allclose(result[0], result[1])
+        # rebalanced every period, so the return is the target's every time
+        p = self.prices.values
+        np.testing.assert_allclose(result[0], np.dot((p[1:] - p[:-1]) / p[:-1], expected))
+    
+    def test_rebalancer_trades_part_way_and_pays_for_it(self):
+        p = self.prices.values
+        returns = (p[1:] - p[:-1]) / p[:-1]
+        rebalancer = Rebalancer(cost = 0.002, min_trade = 0.001)
+        costs = rebalancer.costs(self.names)
+        port_returns, path = simulate(returns, [self.target, self.target], [2, 2], keep_weights = True, rebalancers = [None, (rebalancer, costs)])
+        # by hand: drift, then trade what the solve says at every rebalance
+        weights = self.target.copy()
+        for t in range(len(returns)):
+            drifted = weights * (1.0 + returns[t])
+            expected = drifted.sum() - 1.0
+            weights = drifted / drifted.sum()
+            if (t + 1) % 2 == 0:
+                trades = rebalancer.solve(weights, self.target, costs)
+                weights = weights + trades
+                expected -= np.dot(costs, np.abs(trades))
+            self.assertAlmostEqual(port_returns[t, 1], expected)
+            np.testing.assert_allclose(path[1, t], weights)
+        self.assertFalse(np.allclose(path[1, 1], self.target))
+        np.testing.assert_allclose(path[0, 1], self.target)
+        configs = [(self.target, 2), BacktestConfig(self.target, 2, rebalancer = rebalancer)]
+        result = run_backtest(self.prices, configs, processes = 2, batch_size = 1)[0]
+        np.testing.assert_allclose(result.values, port_returns)
+    
+    def test_bad_rebalance_raises(self):
+        for rebalance in [0, -2, 1.5, True, '5']:
+            with self.assertRaises(ValueError):
+                run_backtest(self.prices, [(self.target, rebalance)], processes = 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
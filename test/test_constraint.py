@@ -0,0 +1,104 @@
+import unittest
+
+import numpy as np
+
+import _paths
+from constraint import GroupConstraint, apply_limits, group_codes
+from portfolio import Portfolio
+from security import Security, SecurityMaster
+
+
+class ApplyLimitsTest(unittest.TestCase):
+    def test_caps_groups_and_keeps_the_total(self):
+        weights = np.array([0.3, 0.3, 0.2, 0.1, 0.1])
+        codes = np.array([0, 0, 1, 1, 2])
+        apply_limits(weights, [codes], [np.repeat(0.4, 3)])
+        sums = np.bincount(codes, weights)
+        self.assertTrue((sums <= 0.4 + 1e-9).all())
+        self.assertAlmostEqual(weights.sum(), 1.0)
+    
+    def test_several_constraints_at_once(self):
+        rng = np.random.RandomState(1)
+        weights = rng.rand(40)
+        weights /= weights.sum()
+        sector = rng.randint(0, 5, 40)
+        country = rng.randint(0, 4, 40)
+        apply_limits(weights, [sector, country, np.arange(40)], [np.repeat(0.25, 5), np.repeat(0.3, 4), np.repeat(0.05, 40)])
+        self.assertTrue((np.bincount(sector, weights) <= 0.25 * (1 + 1e-9)).all())
+        self.assertTrue((np.bincount(country, weights) <= 0.3 * (1 + 1e-9)).all())
+        self.assertTrue((weights <= 0.05 * (1 + 1e-9)).all())
+        self.assertAlmostEqual(weights.sum(), 1.0)
+    
+    def test_names_outside_a_group_are_left_alone_by_it(self):
+        weights = np.array([0.6, 0.2, 0.2])
+        apply_limits(weights, [np.array([0, -1, -1])], [np.array([0.3])])
+        self.assertAlmostEqual(weights[0], 0.3)
+        np.testing.assert_allclose(weights[1:], [0.35, 0.35])
+    
+    def test_infeasible_caps_raise(self):
+        weights = np.array([0.5, 0.5])
+        with self.assertRaises(ValueError):
+            apply_limits(weights, [np.array([0, 1])], [np.array([0.2, 0.2])])
+
+
+class GroupConstraintTest(unittest.TestCase):
+    def test_caps_only_the_named_group(self):
+        caps = GroupConstraint(0.1, 'sector', 'tech').caps(np.array(['energy', 'tech'], dtype = object))
+        self.assertEqual(caps.tolist(), [np.inf, 0.1])
+    
+    def test_missing_labels_get_no_group(self):
+        codes, groups = group_codes(['a', None, 'b', 'a', np.nan])
+        self.assertEqual(codes.tolist(), [0, -1, 1, 0, -1])
+        self.assertEqual(list(groups), ['a', 'b'])
+
+
+class PortfolioLimitTest(unittest.TestCase):
+    def setUp(self):
+        master = SecurityMaster()
+        sectors = ['tech', 'tech', 'energy', 'energy', 'utilities']
+        self.securities = [Security('s%d' % i, {'sector': sector}, master) for (i, sector) in enumerate(sectors)]
+        self.port = Portfolio(self.securities, [0.3, 0.3, 0.2, 0.1, 0.1])
+    
+    def sector_weight(self, sector):
+        return sum(w for (s, w) in zip(self.port.names(), self.port.weights()) if s.factors['sector'] == sector)
+    
+    def test_limit_one_group(self):
+        self.port.limit('sector', 'tech', 0.4)
+        self.assertAlmostEqual(self.sector_weight('tech'), 0.4)
+        self.assertAlmostEqual(self.port.sum_weights(), 1.0)
+    
+    def test_set_constraints_are_applied_together(self):
+        self.port.set_constraint(0.45, 'sector')
+        self.port.set_constraint(0.25)
+        self.port.apply_constraints()
+        for sector in ['tech', 'energy', 'utilities']:
+            self.assertLessEqual(self.sector_weight(sector), 0.45 + 1e-9)
+        self.assertTrue((self.port.weights() <= 0.25 + 1e-9).all())
+    
+    def test_delete_drops_the_position_from_cached_groups(self):
+        codes = self.port.group_codes('sector')[0]
+        self.assertEqual(codes.tolist(), [0, 0, 1, 1, 2])
+        self.port.remove(self.securities[0])
+        codes = self.port.group_codes('sector')[0]
+        self.assertEqual(codes[0], -1)
+        self.port.limit('sector', 'tech', 0.2)
+        self.assertAlmostEqual(self.sector_weight('tech'), 0.2)
+        self.assertNotIn(self.securities[0], self.port.port)
+    
+    def test_relabelled_security_is_regrouped(self):
+        self.assertEqual(self.port.group_codes('sector')[0].tolist(), [0, 0, 1, 1, 2])
+        self.securities[1].factors['sector'] = 'energy'
+        self.assertEqual(self.port.group_codes('sector')[0].tolist(), [0, 1, 1, 1, 2])
+        Security('s0', {'sector': 'utilities'}, self.securities[0].master, update = True)
+        self.port.limit('sector', 'utilities', 0.25)
+        self.assertAlmostEqual(self.sector_weight('utilities'), 0.25)
+    
+    def test_position_groups_keep_their_labels(self):
+        self.port.remove(self.securities[1])
+        codes, groups = self.port.group_codes(None)
+        self.assertEqual(codes.tolist(), [0, -1, 2, 3, 4])
+        self.assertEqual(groups.tolist(), [0, 1, 2, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+
+import numpy as np
+
+import _paths
+from exposures import RollingExposures, first_pass, rolling_exposures
+
+
+def random_returns(T = 60, N = 8, K = 2, seed = 0):
+    rng = np.random.RandomState(seed)
+    F = rng.randn(T, K)
+    B = rng.randn(K, N)
+    return np.dot(F, B) + 0.01 + 0.5 * rng.randn(T, N), F
+
+
+def lstsq(y, F, intercept = True):
+    use = np.isfinite(y)
+    D = np.column_stack([F, np.ones(len(F))]) if intercept else F
+    coef, ssr = np.linalg.lstsq(D[use], y[use], rcond = None)[:2]
+    return coef, ssr[0] / (use.sum() - D.shape[1])
+
+
+class FirstPassTest(unittest.TestCase):
+    def setUp(self):
+        self.Y, self.F = random_returns()
+    
+    def test_matches_one_regression_per_asset(self):
+        self.Y[:10, 2] = np.nan
+        self.Y[[5, 30, 41], 6] = np.nan
+        result = first_pass(self.Y, self.F)
+        for n in range(self.Y.shape[1]):
+            coef, resid_var = lstsq(self.Y[:, n], self.F)
+            np.testing.assert_allclose(result.exposures[n], coef[:-1])
+            self.assertAlmostEqual(result.intercepts[n], coef[-1])
+            self.assertAlmostEqual(result.resid_var[n], resid_var)
+    
+    def test_without_intercept(self):
+        result = first_pass(self.Y, self.F, intercept = False)
+        np.testing.assert_allclose(result.exposures[3], lstsq(self.Y[:, 3], self.F, False)[0])
+        self.assertFalse(result.intercepts.any())
+    
+    def test_short_histories_are_nan(self):
+        self.Y[3:, 0] = np.nan
+        result = first_pass(self.Y, self.F)
+        self.assertTrue(np.isnan(result.exposures[0]).all())
+        self.assertTrue(np.isnan(result.r2[0]))
+        self.assertTrue(np.isfinite(result.exposures[1:]).all())
+
+
+class RollingExposuresTest(unittest.TestCase):
+    def setUp(self):
+        self.Y, self.F = random_returns(T = 30)
+    
+    def test_rolling_window_matches_refitting(self):
+        exposures, intercepts = rolling_exposures(self.Y, self.F, window = 10)
+        self.assertTrue(np.isnan(exposures[1]).all())
+        for t in [9, 15, 29]:
+            result = first_pass(self.Y[t - 9:t + 1], self.F[t - 9:t + 1])
+            np.testing.assert_allclose(exposures[t], result.exposures)
+            np.testing.assert_allclose(intercepts[t], result.intercepts)
+    
+    def test_expanding_window_matches_refitting(self):
+        exposures = rolling_exposures(self.Y, self.F)[0]
+        np.testing.assert_allclose(exposures[20], first_pass(self.Y[:21], self.F[:21]).exposures)
+    
+    def test_decay_matches_weighted_least_squares(self):
+        decay = 0.9
+        rolling = RollingExposures(2, self.Y.shape[1], window = 12, decay = decay)
+        for t in range(len(self.Y)):
+            rolling.update(self.Y[t], self.F[t])
+        root = np.sqrt(decay ** np.arange(11, -1, -1))[:, np.newaxis]
+        D = np.column_stack([self.F[-12:], np.ones(12)])
+        coef = np.linalg.lstsq(D * root, self.Y[-12:] * root, rcond = None)[0]
+        np.testing.assert_allclose(rolling.exposures, coef[:-1].T)
+        np.testing.assert_allclose(rolling.intercepts, coef[-1])
+    
+    def test_missing_return_is_nan_until_it_rolls_out(self):
+        self.Y[12, 3] = np.nan
+        exposures = rolling_exposures(self.Y, self.F, window = 10)[0]
+        self.assertTrue(np.isnan(exposures[21, 3]).all())
+        self.assertTrue(np.isfinite(exposures[22, 3]).all())
+        self.assertTrue(np.isfinite(exposures[21, 2]).all())
+    
+    def test_days_without_factor_data_are_skipped(self):
+        self.F[12, 0] = np.nan
+        exposures = rolling_exposures(self.Y, self.F, window = 10)[0]
+        for t in [15, 21, 29]:
+            np.testing.assert_allclose(exposures[t], first_pass(self.Y[t - 9:t + 1], self.F[t - 9:t + 1]).exposures)
+        expanding = rolling_exposures(self.Y, self.F)[0]
+        np.testing.assert_allclose(expanding[29], first_pass(self.Y, self.F).exposures)
+    
+    def test_late_listings_in_an_expanding_window(self):
+        self.Y[:8, 1] = np.nan
+        self.Y[:15, 5] = np.nan
+        exposures = rolling_exposures(self.Y, self.F)[0]
+        self.assertTrue(np.isnan(exposures[9, 5]).all())
+        for t in [12, 20, 29]:
+            np.testing.assert_allclose(exposures[t], first_pass(self.Y[:t + 1], self.F[:t + 1]).exposures)
+        # a return missing after listing still counts
+        self.Y[22, 1] = np.nan
+        self.assertTrue(np.isnan(rolling_exposures(self.Y, self.F)[0][29, 1]).all())
+    
+    def test_late_listings_with_decay(self):
+        decay = 0.95
+        self.Y[:10, 2] = np.nan
+        rolling = RollingExposures(2, self.Y.shape[1], decay = decay)
+        for t in range(len(self.Y)):
+            rolling.update(self.Y[t], self.F[t])
+        root = np.sqrt(decay ** np.arange(19, -1, -1))[:, np.newaxis]
+        D = np.column_stack([self.F[10:], np.ones(20)])
+        coef = np.linalg.lstsq(D * root, self.Y[10:, 2] * root[:, 0], rcond = None)[0]
+        np.testing.assert_allclose(rolling.exposures[2], coef[:-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
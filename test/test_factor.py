@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+from factor import CrossSections, Factor, Lag, Rank, Winsorize, ZScore
+
+
+class CountingZScore(ZScore):
+    def __init__(self):
+        self.calls = 0
+    
+    def __call__(self, values):
+        self.calls += 1
+        return ZScore.__call__(self, values)
+
+
+class FactorTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.raw = pd.DataFrame(rng.randn(5, 6), index = range(5), columns = list('abcdef'))
+        self.data = CrossSections.from_frame(self.raw)
+    
+    def test_pipeline_matches_applying_the_transforms(self):
+        factor = Factor('value', [Winsorize(0.1, 0.9), ZScore()])
+        result = factor(self.data)
+        for date in self.raw.index:
+            row = self.raw.loc[date]
+            row = row.clip(row.quantile(0.1), row.quantile(0.9))
+            np.testing.assert_allclose(result.loc[date], (row - row.mean()) / row.std())
+    
+    def test_lag_reads_earlier_dates(self):
+        result = Factor('momentum', [Lag(1), Rank()])(self.data)
+        self.assertTrue(result.loc[0].isnull().all())
+        np.testing.assert_allclose(result.loc[3], self.raw.loc[2].rank(pct = True))
+    
+    def test_only_changed_dates_are_recomputed(self):
+        zscore = CountingZScore()
+        factor = Factor('value', [zscore])
+        factor(self.data)
+        self.assertEqual(zscore.calls, 5)
+        factor(self.data)
+        self.assertEqual(zscore.calls, 5)
+        self.data.append(5, self.raw.loc[4] * 2)
+        factor(self.data)
+        self.assertEqual(zscore.calls, 6)
+        self.data.append(2, self.raw.loc[2] + 1)
+        factor(self.data)
+        self.assertEqual(zscore.calls, 7)
+    
+    def test_dates_go_in_order(self):
+        with self.assertRaises(ValueError):
+            self.data.append(-1, self.raw.loc[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
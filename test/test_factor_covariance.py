@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import _paths
+from factor_covariance import FactorCovarianceEstimator
+
+
+class FactorCovarianceEstimatorTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(8)
+        A = rng.randn(3, 3)
+        self.f = np.dot(0.01 * rng.randn(120, 3), A) + 0.001
+    
+    def test_equal_weights_match_numpy(self):
+        estimator = FactorCovarianceEstimator(3).extend(self.f)
+        np.testing.assert_allclose(estimator.covariance, np.cov(self.f.T, bias = True))
+        np.testing.assert_allclose(estimator.mean, self.f.mean(axis = 0))
+        self.assertAlmostEqual(estimator.effective_count, 120)
+    
+    def test_decay_matches_weighted_covariance(self):
+        decay = 0.97
+        estimator = FactorCovarianceEstimator(3, decay = decay).extend(self.f)
+        w = decay ** np.arange(119, -1, -1)
+        np.testing.assert_allclose(estimator.covariance, np.cov(self.f.T, aweights = w, bias = True))
+        self.assertAlmostEqual(estimator.effective_count, w.sum()**2 / (w**2).sum())
+    
+    def test_newey_west_matches_the_lagged_products(self):
+        estimator = FactorCovarianceEstimator(3, nw_lags = 2, demean = False).extend(self.f)
+        expected = np.dot(self.f.T, self.f) / 120
+        for lag in [1, 2]:
+            gamma = np.dot(self.f[lag:].T, self.f[:-lag]) / (120 - lag)
+            expected += (1.0 - lag / 3.0) * (gamma + gamma.T)
+        np.testing.assert_allclose(estimator.covariance, expected)
+    
+    def test_shrinkage(self):
+        sample = FactorCovarianceEstimator(3).extend(self.f).covariance
+        fixed = FactorCovarianceEstimator(3, shrinkage = 0.25).extend(self.f).covariance
+        mu = np.trace(sample) / 3
+        np.testing.assert_allclose(fixed, 0.75 * sample + 0.25 * mu * np.eye(3))
+        auto = FactorCovarianceEstimator(3, shrinkage = 'auto').extend(self.f)
+        intensity = auto.shrinkage_intensity()
+        self.assertTrue(0.0 < intensity < 1.0)
+        # fewer days, less trust in the sample
+        short = FactorCovarianceEstimator(3, shrinkage = 'auto').extend(self.f[:15])
+        self.assertGreater(short.shrinkage_intensity(), intensity)
+    
+    def test_days_with_nan_are_skipped(self):
+        f = self.f.copy()
+        f[10, 1] = np.nan
+        estimator = FactorCovarianceEstimator(3).extend(f)
+        self.assertEqual(estimator.count, 119)
+        np.testing.assert_allclose(estimator.covariance, np.cov(np.delete(self.f, 10, axis = 0).T, bias = True))
+    
+    def test_checkpoint_carries_on(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'state.npz')
+            whole = FactorCovarianceEstimator(3, decay = 0.98, nw_lags = 2, shrinkage = 'auto').extend(self.f)
+            FactorCovarianceEstimator(3, decay = 0.98, nw_lags = 2, shrinkage = 'auto').extend(self.f[:70]).save(path)
+            resumed = FactorCovarianceEstimator.load(path).extend(self.f[70:])
+            np.testing.assert_allclose(resumed.covariance, whole.covariance)
+            self.assertEqual(resumed.count, 120)
+        finally:
+            shutil.rmtree(directory)
+    
+    def test_checkpoint_keeps_the_exact_shrinkage(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'state.npz')
+            for shrinkage in [0.123456789012345678, np.float64(1.0) / 3.0, None, 'auto']:
+                FactorCovarianceEstimator(3, shrinkage = shrinkage).extend(self.f).save(path)
+                loaded = FactorCovarianceEstimator.load(path)
+                self.assertEqual(loaded.shrinkage, shrinkage)
+                np.testing.assert_array_equal(loaded.covariance, FactorCovarianceEstimator(3, shrinkage = shrinkage).extend(self.f).covariance)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
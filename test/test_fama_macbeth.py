@@ -0,0 +1,118 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+from fama_macbeth import FamaMacBeth, MovingFamaMacBeth, _calc_t_stat, _rolling_t_stat, fama_macbeth
+
+
+def random_panel(T = 40, N = 30, K = 2, seed = 0):
+    rng = np.random.RandomState(seed)
+    X = rng.randn(T, N, K)
+    Y = np.dot(X, [0.5, -0.2][:K]) + 0.1 + rng.randn(T, N)
+    return Y, X
+
+
+class FamaMacBethTest(unittest.TestCase):
+    def setUp(self):
+        self.Y, self.X = random_panel()
+        self.Y[3, :5] = np.nan
+        self.X[7, 2, 1] = np.nan
+    
+    def period_betas(self):
+        betas = []
+        for (y, x) in zip(self.Y, self.X):
+            use = np.isfinite(y) & np.isfinite(x).all(axis = 1)
+            design = np.column_stack([x[use], np.ones(use.sum())])
+            betas.append(np.linalg.lstsq(design, y[use], rcond = None)[0])
+        return np.array(betas)
+    
+    def test_matches_one_regression_per_period(self):
+        betas = self.period_betas()
+        fm = FamaMacBeth(self.Y, self.X, chunksize = 7)
+        np.testing.assert_allclose(fm._beta_raw, betas)
+        mean, std, t = _calc_t_stat(betas, None)
+        np.testing.assert_allclose(fm.mean_beta.values, mean)
+        np.testing.assert_allclose(fm.t_stat.values, t)
+        self.assertEqual(list(fm.mean_beta.index), ['x0', 'x1', 'intercept'])
+    
+    def test_newey_west(self):
+        fm = FamaMacBeth(self.Y, self.X, nw_lags_beta = 2)
+        np.testing.assert_allclose(fm.std_beta.values, _calc_t_stat(self.period_betas(), 2)[1])
+        self.assertIn('Newey-West', fm.summary)
+    
+    def test_multiindex_input_matches_arrays(self):
+        dates, assets = range(self.Y.shape[0]), range(self.Y.shape[1])
+        index = pd.MultiIndex.from_product([dates, assets])
+        y = pd.Series(self.Y.ravel(), index = index)
+        x = pd.DataFrame(self.X.reshape(-1, 2), index = index, columns = ['value', 'size'])
+        fm = fama_macbeth(y = y, x = x)
+        self.assertEqual(list(fm.mean_beta.index), ['value', 'size', 'intercept'])
+        np.testing.assert_allclose(fm.mean_beta.values, FamaMacBeth(self.Y, self.X).mean_beta.values)
+    
+    def test_periods_without_enough_assets_are_skipped(self):
+        self.Y[5, 2:] = np.nan
+        fm = FamaMacBeth(self.Y, self.X)
+        self.assertFalse(fm._mask[5])
+        self.assertEqual(len(fm._beta_raw), len(self.Y) - 1)
+
+
+class RollingTStatTest(unittest.TestCase):
+    def setUp(self):
+        self.beta = np.random.RandomState(4).randn(50, 3)
+    
+    def check(self, starts, ends, lags):
+        mean, std, t = _rolling_t_stat(self.beta, np.array(starts), np.array(ends), lags)
+        for (j, (s, e)) in enumerate(zip(starts, ends)):
+            expected = _calc_t_stat(self.beta[s:e], lags)
+            np.testing.assert_allclose(mean[j], expected[0])
+            np.testing.assert_allclose(std[j], expected[1])
+            np.testing.assert_allclose(t[j], expected[2])
+    
+    def test_rolling_windows_match(self):
+        for lags in [None, 0, 1, 3]:
+            self.check(range(0, 41), range(10, 51), lags)
+    
+    def test_expanding_windows_match(self):
+        self.check([0] * 40, range(11, 51), 2)
+    
+    def test_windows_that_jump(self):
+        # windows can skip ahead and shrink, as long as neither end moves back
+        self.check([0, 0, 5, 20, 22, 30], [8, 15, 15, 40, 40, 50], 2)
+    
+    def test_lags_longer_than_the_window(self):
+        # _calc_t_stat can't take more lags than periods, the lags past the window just have no pairs
+        mean, std, t = _rolling_t_stat(self.beta, np.array([0, 1]), np.array([3, 4]), 4)
+        for (j, s) in enumerate([0, 1]):
+            B = self.beta[s:s + 3] - self.beta[s:s + 3].mean(0)
+            C = np.dot(B.T, B) / 3
+            for i in range(3):
+                # same weights as _calc_t_stat
+                weight = i / (4 + 1)
+                C += 2 * (1 - weight) * np.dot(B[i:].T, B[:3 - i]) / 3
+            np.testing.assert_allclose(std[j], np.sqrt(np.diag(C)) / np.sqrt(3))
+
+
+class MovingFamaMacBethTest(unittest.TestCase):
+    def test_matches_each_window(self):
+        Y, X = random_panel()
+        Y[0] = np.nan
+        for window_type in ['rolling', 'expanding']:
+            fm = MovingFamaMacBeth(Y, X, window_type = window_type, window = 8, nw_lags_beta = 1)
+            # windows are counted in dates, a date that couldn't be fit just has fewer betas
+            ends = np.flatnonzero(fm._mask.cumsum() >= 8)
+            self.assertEqual(len(fm.mean_beta), len(ends))
+            for (j, end) in enumerate(ends):
+                window = fm._all_betas[end - 7 if window_type == 'rolling' else 0:end + 1]
+                window = window[np.isfinite(window).all(axis = 1)]
+                np.testing.assert_allclose(fm.std_beta.values[j], _calc_t_stat(window, 1)[1])
+    
+    def test_bad_window_type(self):
+        Y, X = random_panel()
+        with self.assertRaises(ValueError):
+            MovingFamaMacBeth(Y, X, window_type = 'sliding')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+from ingest import count_rows, ingest_prices
+
+
+class IngestTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'prices.csv')
+        rng = np.random.RandomState(0)
+        dates = pd.bdate_range('2010-01-04', periods = 23)
+        self.prices = pd.DataFrame(100.0 * np.cumprod(1.0 + 0.01 * rng.randn(23, 3), axis = 0), index = dates, columns = ['a', 'b', 'c'])
+        self.prices.iloc[7, 1] = np.nan
+        self.rates = pd.Series(2.0 + rng.rand(23), index = dates)
+        frame = self.prices.copy()
+        frame['USGG10YR Index'] = self.rates
+        frame.index.name = 'date'
+        with open(self.path, 'w') as f:
+            f.write(frame.to_csv().replace('\n', '\njunk,,,,\n', 1))
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def assertFrame(self, frame, expected):
+        np.testing.assert_allclose(frame.values, expected.values)
+        self.assertEqual(list(frame.index), list(expected.index))
+        self.assertEqual(list(frame.columns), list(expected.columns))
+    
+    def check(self, horizon = 5, chunksize = 4):
+        frames = ingest_prices(self.path, os.path.join(self.directory, 'out'), horizon = horizon, chunksize = chunksize)
+        n = len(self.prices) - horizon
+        forward = self.prices.shift(-horizon) / self.prices - 1.0
+        self.assertFrame(frames['forward_returns'], forward[:n])
+        self.assertFrame(frames['trailing_returns'], (self.prices / self.prices.shift(horizon) - 1.0)[horizon:])
+        self.assertFrame(frames['excess_returns'], forward.sub(self.rates / 100.0, axis = 0)[:n])
+    
+    def test_matches_pandas(self):
+        self.check()
+    
+    def test_chunks_smaller_and_larger_than_the_horizon(self):
+        self.check(horizon = 5, chunksize = 2)
+        self.check(horizon = 3, chunksize = 100)
+    
+    def test_trailing_blank_lines(self):
+        with open(self.path, 'a') as f:
+            f.write('\n\n\n')
+        self.assertEqual(count_rows(self.path), 27)
+        self.check()
+    
+    def test_trailing_returns_share_the_forward_values(self):
+        out = os.path.join(self.directory, 'out')
+        ingest_prices(self.path, out, horizon = 5)
+        self.assertFalse(os.path.exists(os.path.join(out, 'trailing_returns', 'values.npy')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+from panel import Panel
+
+
+class PanelTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        dates = pd.date_range('2010-01-04', periods = 6)
+        self.panel = Panel.create(self.directory, dates, ['a', 'b', 'c'], ['beta', 'size'], fill = 0.0)
+        self.panel.values[:] = np.arange(36.0).reshape(6, 3, 2)
+    
+    def tearDown(self):
+        del self.panel
+        shutil.rmtree(self.directory)
+    
+    def test_slices_are_views(self):
+        chunk = self.panel[1:3, 1]
+        self.assertEqual(chunk.shape, (2, 1, 2))
+        self.assertEqual(list(chunk.assets), ['b'])
+        self.assertTrue(np.may_share_memory(chunk.values, self.panel.values))
+        chunk.values[0, 0, 0] = -1.0
+        self.assertEqual(self.panel.values[1, 1, 0], -1.0)
+    
+    def test_lists_are_copies(self):
+        picked = self.panel[:, [0, 2]]
+        self.assertEqual(list(picked.assets), ['a', 'c'])
+        self.assertFalse(np.may_share_memory(picked.values, self.panel.values))
+        np.testing.assert_array_equal(picked.values, self.panel.values[:, [0, 2]])
+    
+    def test_chunks_cover_every_date(self):
+        chunks = list(self.panel.iter_chunks(4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 2])
+        np.testing.assert_array_equal(np.concatenate([chunk.values for chunk in chunks]), self.panel.values)
+        self.assertEqual(len(self.panel.between('2010-01-05', '2010-01-07')), 3)
+    
+    def test_reopens_and_round_trips_frames(self):
+        self.panel.values.flush()
+        opened = Panel.open(self.directory)
+        np.testing.assert_array_equal(opened.values, self.panel.values)
+        self.assertEqual(list(opened.factors), ['beta', 'size'])
+        again = Panel.from_frame(opened.to_frame())
+        np.testing.assert_array_equal(again.values, self.panel.values)
+        pd.testing.assert_frame_equal(opened.factor('size'), pd.DataFrame(self.panel.values[:, :, 1], index = opened.dates, columns = opened.assets))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+from collections import defaultdict
+
+from portfolio import Portfolio, PortfolioSet, PositionMap
+from RiskModel import FactorCovariance
+from security import Equity, SecurityMaster
+
+
+def loop_replace(port, to_replace, replacements = None):
+    # the name by name replace from before the vectorized one, on a plain dict
+    port = defaultdict(float, port)
+    if replacements == None:
+        tempkeys = to_replace.viewkeys() ^ port.viewkeys()
+        replacements = dict(zip(tempkeys, [1.0 / len(tempkeys) for x in range(len(tempkeys))]))
+    for (name, fraction) in to_replace.items():
+        nominal = port[name] * fraction
+        for (security, share) in replacements.items():
+            port[security] += share * nominal
+        port[name] -= nominal
+        if port[name] == 0.0:
+            del port[name]
+    return dict(port)
+
+
+class PositionMapTest(unittest.TestCase):
+    def test_reads_like_a_dict(self):
+        port = PositionMap()
+        port['a'] = 0.5
+        port['b'] = 0.25
+        self.assertEqual(port['a'], 0.5)
+        self.assertEqual(port['missing'], 0.0)
+        self.assertNotIn('missing', port)
+        self.assertEqual(sorted(port), ['a', 'b'])
+        self.assertEqual(len(port), 2)
+    
+    def test_delete_leaves_a_tombstone(self):
+        port = PositionMap()
+        port.add(list('abcd'), [0.1, 0.2, 0.3, 0.4])
+        del port['b']
+        self.assertEqual(port.live_names(), ['a', 'c', 'd'])
+        np.testing.assert_allclose(port.live_weights(), [0.1, 0.3, 0.4])
+        # the slot is still there, holding zero so sums don't need the mask
+        self.assertEqual(len(port.array), 4)
+        self.assertEqual(port.array.sum(), 0.8)
+        self.assertEqual(port.slots(['b', 'c']).tolist(), [-1, 2])
+    
+    def test_reinserted_name_is_listed_once(self):
+        port = PositionMap()
+        port.add(list('abcdef'), np.ones(6))
+        del port['a']
+        port['a'] = 2.0
+        self.assertEqual(sorted(port), list('abcdef'))
+        self.assertEqual(port['a'], 2.0)
+    
+    def test_compacts_once_most_slots_are_dead(self):
+        port = PositionMap()
+        port.add(list('abcd'), [0.1, 0.2, 0.3, 0.4])
+        del port['a']
+        del port['b']
+        self.assertEqual(len(port.array), 4)
+        del port['c']
+        self.assertEqual(len(port.array), 1)
+        self.assertEqual(port.live_names(), ['d'])
+        self.assertEqual(port.slots(['d']).tolist(), [0])
+        self.assertEqual(port['d'], 0.4)
+    
+    def test_add_sums_repeated_names(self):
+        port = PositionMap(capacity = 2)
+        port.add(['a', 'b', 'a', 'c'], [1.0, 2.0, 3.0, 4.0])
+        port.add(['c', 'd'], [1.0, 1.0])
+        self.assertEqual(dict(zip(port.live_names(), port.live_weights())), {'a': 4.0, 'b': 2.0, 'c': 5.0, 'd': 1.0})
+    
+    def test_copy_is_independent(self):
+        port = PositionMap()
+        port.add(['a', 'b'], [1.0, 2.0])
+        other = port.copy()
+        other['a'] = 5.0
+        del other['b']
+        self.assertEqual(port['a'], 1.0)
+        self.assertIn('b', port)
+
+
+class PortfolioTest(unittest.TestCase):
+    def test_arithmetic(self):
+        port = Portfolio(list('abc'), [0.2, 0.3, 0.5])
+        other = Portfolio(list('cd'), [0.5, 0.5])
+        total = port + other
+        self.assertEqual(dict(zip(total.names(), total.weights())), {'a': 0.2, 'b': 0.3, 'c': 1.0, 'd': 0.5})
+        self.assertAlmostEqual((port * 5).sum_weights(), 5.0)
+        # neither side changes
+        self.assertAlmostEqual(port.sum_weights(), 1.0)
+        self.assertEqual(other.names(), ['c', 'd'])
+    
+    def test_combine_matches_summing(self):
+        ports = [Portfolio(list('abc'), [0.2, 0.3, 0.5]), Portfolio(list('bcd'), [0.1, 0.1, 0.8]), Portfolio(['a'], [1.0])]
+        scalars = [0.5, 2.0, -1.0]
+        combined = Portfolio.combine(ports, scalars)
+        total = ports[0] * 0.5 + ports[1] * 2.0 + ports[2] * -1.0
+        self.assertEqual(sorted(combined.names()), sorted(total.names()))
+        for name in total.names():
+            self.assertAlmostEqual(combined.port[name], total.port[name])
+    
+    def test_copy_doesnt_share_positions(self):
+        port = Portfolio(list('ab'), [0.5, 0.5])
+        other = port.copy()
+        other.remove('a')
+        self.assertEqual(port.names(), ['a', 'b'])
+        self.assertEqual(other.names(), ['b'])
+    
+    def test_remove_renormalizes(self):
+        port = Portfolio(list('abcd'), [0.25] * 4)
+        port.remove('a')
+        self.assertEqual(port.names(), list('bcd'))
+        np.testing.assert_allclose(port.weights(), [1.0 / 3] * 3)
+
+
+class ReplaceTest(unittest.TestCase):
+    def assertMatches(self, port, expected):
+        self.assertEqual(sorted(port.names()), sorted(expected))
+        for name in expected:
+            self.assertAlmostEqual(port.port[name], expected[name])
+    
+    def test_matches_the_loop(self):
+        rng = np.random.RandomState(0)
+        names = ['s%d' % i for i in range(8)]
+        for trial in range(200):
+            weights = rng.rand(len(names))
+            port = Portfolio(names, weights)
+            before = dict(zip(names, weights))
+            picked = rng.choice(len(names) + 3, rng.randint(1, 4), replace = False)
+            to_replace = dict(('s%d' % i, rng.choice([rng.rand(), 1.0])) for i in picked)
+            picked = rng.choice(len(names) + 3, rng.randint(1, 4), replace = False)
+            replacements = dict(('s%d' % i, rng.rand()) for i in picked)
+            port.replace(to_replace, replacements)
+            self.assertMatches(port, loop_replace(before, to_replace, replacements))
+    
+    def test_chains_a_name_on_both_sides(self):
+        port = Portfolio(list('abc'), [0.5, 0.3, 0.2])
+        port.replace({'a': 1.0, 'b': 0.5}, {'b': 0.5, 'd': 0.5})
+        self.assertMatches(port, loop_replace({'a': 0.5, 'b': 0.3, 'c': 0.2}, {'a': 1.0, 'b': 0.5}, {'b': 0.5, 'd': 0.5}))
+    
+    def test_without_replacements_spreads_over_the_rest(self):
+        port = Portfolio(list('abcd'), [0.4, 0.3, 0.2, 0.1])
+        port.replace({'a': 1.0, 'b': 0.5})
+        self.assertMatches(port, loop_replace({'a': 0.4, 'b': 0.3, 'c': 0.2, 'd': 0.1}, {'a': 1.0, 'b': 0.5}))
+    
+    def test_matrix_matches_replace(self):
+        port = Portfolio(list('abcd'), [0.4, 0.3, 0.2, 0.1])
+        other = port.copy()
+        fractions, shares = np.array([1.0, 0.25]), np.array([0.6, 0.4])
+        port.replace({'a': 1.0, 'b': 0.25}, {'e': 0.6, 'f': 0.4})
+        other.replace_matrix(['a', 'b'], ['e', 'f'], np.outer(fractions, shares), removed = fractions)
+        self.assertMatches(other, dict(zip(port.names(), port.weights())))
+        self.assertNotIn('a', other.port)
+
+
+class DriftPathTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.names = list('abcde')
+        self.weights = rng.rand(5)
+        self.returns = pd.DataFrame(0.02 * rng.randn(12, 5), columns = self.names)
+    
+    def test_matches_looped_apply_drift(self):
+        port = Portfolio(self.names, self.weights)
+        looped = Portfolio(self.names, self.weights)
+        path = port.apply_drift_path(self.returns)
+        for (t, (_, row)) in enumerate(self.returns.iterrows()):
+            looped.apply_drift(row)
+            np.testing.assert_allclose(path.iloc[t].values, looped.weights())
+        np.testing.assert_allclose(port.weights(), looped.weights())
+    
+    def test_terminal_only(self):
+        port = Portfolio(self.names, self.weights)
+        path = Portfolio(self.names, self.weights).apply_drift_path(self.returns.values)
+        terminal = port.apply_drift_path(self.returns.values, terminal_only = True)
+        np.testing.assert_allclose(terminal, path[-1])
+        np.testing.assert_allclose(port.weights(), path[-1])
+    
+    def test_positions_without_a_column_dont_drift(self):
+        port = Portfolio(self.names, self.weights)
+        looped = Portfolio(self.names, self.weights)
+        port.apply_drift_path(self.returns[['b', 'd']])
+        for (_, row) in self.returns.iterrows():
+            drift = dict((name, row[name] if name in ('b', 'd') else 0.0) for name in self.names)
+            looped.apply_drift(drift)
+        np.testing.assert_allclose(port.weights(), looped.weights())
+    
+    def test_after_a_delete(self):
+        port = Portfolio(self.names, self.weights)
+        looped = Portfolio(self.names, self.weights)
+        for p in (port, looped):
+            del p.port['c']
+        returns = self.returns.drop('c', axis = 1)
+        port.apply_drift_path(returns)
+        for (_, row) in returns.iterrows():
+            looped.apply_drift(row)
+        np.testing.assert_allclose(port.weights(), looped.weights())
+
+
+class PortfolioSetTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(12)
+        self.universe = ['s%d' % i for i in range(15)]
+        A = rng.randn(3, 3)
+        self.model = FactorCovariance(rng.randn(15, 3), np.dot(A, A.T), rng.rand(15) + 0.1)
+        self.portfolios = [Portfolio(list(rng.choice(self.universe, 6, replace = False)) + ['cash'], rng.rand(7)) for i in range(4)]
+        self.set = PortfolioSet(self.portfolios, self.universe, labels = list('abcd'))
+    
+    def dense(self, port):
+        return np.array([port.port[name] for name in self.universe])
+    
+    def test_risk_matches_each_dense_portfolio(self):
+        risk = self.set.risk(self.model)
+        V = self.model.to_dense()
+        for (label, port) in zip('abcd', self.portfolios):
+            w = self.dense(port)
+            self.assertAlmostEqual(risk.loc[label, 'total'], np.sqrt(np.dot(w, np.dot(V, w))))
+            self.assertAlmostEqual(risk.loc[label, 'specific']**2, np.sum(self.model.delta * w**2))
+            self.assertAlmostEqual(self.set.unmapped[self.set.labels.index(label)], port.port['cash'])
+    
+    def test_contributions_add_up(self):
+        contributions = self.set.factor_contributions(self.model, ['mkt', 'value', 'size'])
+        self.assertEqual(list(contributions.columns), ['mkt', 'value', 'size', 'specific'])
+        np.testing.assert_allclose(contributions.sum(axis = 1), self.set.risk(self.model)['total'])
+        marginal = self.set.marginal_contributions(self.model, rows = slice(1, 3))
+        for (row, port) in zip(marginal, self.portfolios[1:3]):
+            w = self.dense(port)
+            np.testing.assert_allclose(row, self.model.marginal_contribution(w))
+
+
+class FactorsTest(unittest.TestCase):
+    def test_shared_master_rows(self):
+        master = SecurityMaster()
+        securities = [Equity(name, {'beta': beta, 'size': 1.0}, master) for (name, beta) in zip('abc', [0.8, 1.0, 1.2])]
+        port = Portfolio(securities[1:], [0.5, 0.5])
+        np.testing.assert_array_equal(port.factors(), [[1.0, 1.0], [1.2, 1.0]])
+    
+    def test_securities_without_a_master(self):
+        securities = [Equity('a', {'beta': 1.0, 'sector': 'tech'}), Equity('b', {'size': 2.0, 'beta': 0.5}), Equity('c')]
+        port = Portfolio(securities, [0.2, 0.3, 0.5])
+        np.testing.assert_array_equal(port.factors(), [[1.0, np.nan], [0.5, 2.0], [np.nan, np.nan]])
+        port.remove(securities[0])
+        np.testing.assert_array_equal(port.factors(), [[0.5, 2.0], [np.nan, np.nan]])
+        securities[1].factors['sector'] = 'energy'
+        securities[2].factors['sector'] = 'energy'
+        (codes, groups) = port.group_codes('sector')
+        self.assertEqual(codes[0], -1)
+        self.assertEqual(list(groups[codes[1:]]), ['energy', 'energy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+
+import numpy as np
+
+import _paths
+from portfolio import Portfolio
+from rebalance import Rebalancer, _shift
+
+
+class SolveTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.current = rng.rand(50)
+        self.current /= self.current.sum()
+        self.target = rng.rand(50)
+        self.target /= self.target.sum()
+        self.costs = 0.002 * rng.rand(50)
+    
+    def objective(self, rebalancer, weights):
+        return 0.5 * rebalancer.risk_aversion * np.sum((weights - self.target)**2) + np.sum(self.costs * np.abs(weights - self.current))
+    
+    def test_optimality_conditions(self):
+        rebalancer = Rebalancer(risk_aversion = 2.0)
+        trades = rebalancer.solve(self.current, self.target, self.costs)
+        weights = self.current + trades
+        self.assertAlmostEqual(weights.sum(), self.target.sum())
+        # the gradient is the same multiplier everywhere the name trades and within the cost of it everywhere else
+        gradient = rebalancer.risk_aversion * (weights - self.target)
+        traded = trades != 0.0
+        multiplier = -(gradient + self.costs * np.sign(trades))[traded]
+        np.testing.assert_allclose(multiplier, multiplier[0], atol = 1e-12)
+        self.assertTrue((np.abs(gradient[~traded] + multiplier[0]) <= self.costs[~traded] + 1e-12).all())
+        self.assertTrue((~traded).any())
+    
+    def test_beats_balanced_perturbations(self):
+        rebalancer = Rebalancer()
+        weights = self.current + rebalancer.solve(self.current, self.target, self.costs)
+        best = self.objective(rebalancer, weights)
+        rng = np.random.RandomState(1)
+        for i in range(200):
+            step = 1e-4 * rng.randn(50)
+            self.assertLessEqual(best, self.objective(rebalancer, weights + step - step.mean()) + 1e-15)
+    
+    def test_without_costs_it_reaches_the_target(self):
+        trades = Rebalancer().solve(self.current, self.target, np.zeros(50))
+        np.testing.assert_allclose(self.current + trades, self.target)
+    
+    def test_small_trades_are_skipped_and_the_rest_stay_balanced(self):
+        trades = Rebalancer(min_trade = 0.01).solve(self.current, self.target, self.costs)
+        traded = trades[trades != 0.0]
+        self.assertTrue((np.abs(traded) >= 0.01).all())
+        self.assertAlmostEqual(trades.sum(), self.target.sum() - self.current.sum())
+    
+    def test_shift_balances_the_soft_threshold(self):
+        d = self.target - self.current
+        k = self.costs
+        for total in [0.0, 0.3, -0.2]:
+            nu = _shift(d, k, total)
+            x = d - nu
+            self.assertAlmostEqual(np.sum(np.sign(x) * np.maximum(np.abs(x) - k, 0.0)), total)
+
+
+class RebalancePortfolioTest(unittest.TestCase):
+    def test_names_held_by_either_side(self):
+        current = Portfolio(['a', 'b', 'c'], [0.5, 0.3, 0.2])
+        target = Portfolio(['b', 'c', 'd'], [0.2, 0.3, 0.5])
+        new = Rebalancer().rebalance(current, target)
+        self.assertEqual(sorted(new.names()), ['b', 'c', 'd'])
+        self.assertAlmostEqual(new.port['d'], 0.5)
+        trades = Rebalancer().trades(current, target)
+        self.assertAlmostEqual(trades.port['a'], -0.5)
+    
+    def test_deleted_target_names_are_sold_not_bought(self):
+        current = Portfolio(['a', 'b'], [0.5, 0.5])
+        target = Portfolio(['a', 'b', 'c', 'd', 'e'], [0.2, 0.2, 0.2, 0.2, 0.2])
+        del target.port['c']
+        target.normalize()
+        trades = Rebalancer().trades(current, target)
+        self.assertNotIn('c', trades.port)
+        self.assertAlmostEqual(trades.port['d'], 0.25)
+        self.assertAlmostEqual(trades.sum_weights(), 0.0)
+    
+    def test_missing_costs_raise(self):
+        current = Portfolio(['a', 'b'], [0.5, 0.5])
+        target = Portfolio(['a', 'c'], [0.5, 0.5])
+        with self.assertRaises(KeyError):
+            Rebalancer(cost = {'a': 0.001, 'b': 0.001}).trades(current, target)
+        trades = Rebalancer(cost = {'a': 0.001}, default_cost = 0.01).trades(current, target)
+        self.assertAlmostEqual(trades.port['c'], 0.49)
+        self.assertAlmostEqual(Rebalancer(cost = {'a': 0.001}, default_cost = 0.01).transaction_cost(trades), 0.0098)
+    
+    def test_rebalance_keeps_the_current_portfolio(self):
+        current = Portfolio(['a', 'b'], [0.6, 0.4])
+        Rebalancer(cost = 0.01).rebalance(current, Portfolio(['b'], [1.0]))
+        self.assertEqual(current.names(), ['a', 'b'])
+        np.testing.assert_allclose(current.weights(), [0.6, 0.4])
+
+    
+    def test_copies_line_up_by_slot_like_by_name(self):
+        rng = np.random.RandomState(2)
+        names = ['s%d' % i for i in range(40)]
+        current = Portfolio(names, rng.rand(40))
+        target = current.copy()
+        target.port.array[:] = rng.rand(40)
+        del target.port['s3']
+        target.port.add(['new'], [0.5])
+        # same positions with a layout of their own, so these go by name
+        rebuilt = Portfolio(target.names(), target.weights())
+        rebalancer = Rebalancer(cost = 0.01, min_trade = 0.005)
+        self.assertIsNotNone(rebalancer._shared(current, target))
+        self.assertIsNone(rebalancer._shared(current, rebuilt))
+        for (fast, slow) in [(rebalancer.trades(current, target), rebalancer.trades(current, rebuilt)), (rebalancer.rebalance(current, target), rebalancer.rebalance(current, rebuilt))]:
+            self.assertEqual(sorted(fast.names()), sorted(slow.names()))
+            np.testing.assert_allclose([fast.port[name] for name in slow.names()], slow.weights())
+        self.assertIn('new', rebalancer.trades(current, target).port)
+        self.assertLess(rebalancer.trades(current, target).port['s3'], 0.0)
+    
+    def test_name_added_back_to_a_copy_goes_by_name(self):
+        current = Portfolio(['a', 'b', 'c'], [0.5, 0.3, 0.2])
+        target = current.copy()
+        del target.port['a']
+        target.port.add(['a'], [0.1])
+        # 'a' is in another slot of target now, lining up by slot would count it twice
+        self.assertIsNone(Rebalancer()._shared(current, target))
+        trades = Rebalancer().trades(current, target)
+        self.assertAlmostEqual(trades.port['a'], -0.4)
+
+
+class AssignTest(unittest.TestCase):
+    def test_zeros_are_deleted_and_tombstones_revived(self):
+        port = Portfolio(['a', 'b', 'c'], [0.5, 0.3, 0.2]).port
+        del port['b']
+        version = port.version
+        port.assign([0.0, 0.4, 0.6])
+        self.assertEqual(port.live_names(), ['b', 'c'])
+        np.testing.assert_allclose(port.live_weights(), [0.4, 0.6])
+        self.assertNotIn('a', port)
+        self.assertGreater(port.version, version)
+    
+    def test_a_name_in_two_slots_raises(self):
+        port = Portfolio(['a', 'b'], [0.5, 0.5]).port
+        del port['a']
+        port.add(['a'], [0.2])
+        with self.assertRaises(ValueError):
+            port.assign([0.1, 0.5, 0.2])
+        # nothing was changed
+        self.assertEqual(sorted(port.live_names()), ['a', 'b'])
+        self.assertAlmostEqual(port['a'], 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+import risk
+from RiskModel import FactorCovariance
+
+
+class RunningMomentsTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.x = rng.randn(200) * 0.01
+        self.y = 0.5 * self.x + rng.randn(200) * 0.01
+    
+    def test_matches_numpy(self):
+        moments = risk.RunningMoments()
+        for x in self.x:
+            moments.update(x)
+        self.assertAlmostEqual(moments.mean, self.x.mean())
+        self.assertAlmostEqual(moments.variance, self.x.var())
+    
+    def test_decay_matches_weighted_moments(self):
+        decay = 0.94
+        moments = risk.RunningMoments(decay)
+        for x in self.x:
+            moments.update(x)
+        w = decay ** np.arange(len(self.x) - 1, -1, -1)
+        mean = np.average(self.x, weights = w)
+        self.assertAlmostEqual(moments.mean, mean)
+        self.assertAlmostEqual(moments.variance, np.average((self.x - mean)**2, weights = w))
+    
+    def test_merge_matches_one_pass(self):
+        for decay in [1.0, 0.97]:
+            whole = risk.RunningMoments(decay)
+            first = risk.RunningMoments(decay)
+            second = risk.RunningMoments(decay)
+            for (i, x) in enumerate(self.x):
+                whole.update(x)
+                (first if i < 120 else second).update(x)
+            first.merge(second)
+            self.assertAlmostEqual(first.mean, whole.mean)
+            self.assertAlmostEqual(first.variance, whole.variance)
+            self.assertEqual(first.count, whole.count)
+    
+    def test_arrays_of_returns(self):
+        panel = np.column_stack([self.x, self.y])
+        moments = risk.RunningMoments()
+        for row in panel:
+            moments.update(row)
+        np.testing.assert_allclose(moments.std, panel.std(axis = 0))
+    
+    def test_tracking_error_matches_active_risk(self):
+        te = risk.TrackingError()
+        for (x, y) in zip(self.x, self.y):
+            te.update(x, y)
+        self.assertAlmostEqual(te.active_risk, risk.active_risk(self.x, self.y))
+    
+    def test_covariance_matches_beta_and_residual_risk(self):
+        whole = risk.RunningCovariance()
+        first = risk.RunningCovariance()
+        second = risk.RunningCovariance()
+        for (i, (x, y)) in enumerate(zip(self.x, self.y)):
+            whole.update(x, y)
+            (first if i < 50 else second).update(x, y)
+        first.merge(second)
+        for cov in [whole, first]:
+            self.assertAlmostEqual(cov.beta, risk.beta(self.x, self.y))
+            self.assertAlmostEqual(cov.residual_risk, risk.residual_risk(self.x, self.y))
+            self.assertAlmostEqual(cov.correlation, np.corrcoef(self.x, self.y)[0, 1])
+    
+    def test_compound_return(self):
+        compound = risk.CompoundReturn()
+        for x in self.x[:100]:
+            compound.update(x)
+        rest = risk.CompoundReturn()
+        for x in self.x[100:]:
+            rest.update(x)
+        compound.merge(rest)
+        self.assertAlmostEqual(compound.value, risk.compound_returns(self.x)[-1])
+
+
+class PanelTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.prices = pd.DataFrame(100.0 * np.cumprod(1.0 + 0.01 * rng.randn(60, 4), axis = 0), columns = list('abcd'))
+        self.returns = risk.ror(self.prices)
+        self.benchmark = self.returns.mean(axis = 1)
+    
+    def test_each_column_matches_the_single_series(self):
+        for function in [risk.beta, risk.residual_risk, risk.active_risk]:
+            result = function(self.returns, self.benchmark)
+            self.assertEqual(list(result.index), list('abcd'))
+            for name in 'abcd':
+                self.assertAlmostEqual(result[name], function(self.returns[name].values, self.benchmark.values))
+        risks = risk.period_risk(self.returns, 12)
+        for name in 'abcd':
+            self.assertAlmostEqual(risks[name], risk.period_risk(self.returns[name].values, 12))
+    
+    def test_axis_one_is_the_transpose(self):
+        returns = self.returns.values
+        np.testing.assert_allclose(risk.beta(returns.T, self.benchmark.values, axis = 1), risk.beta(returns, self.benchmark.values))
+        np.testing.assert_allclose(risk.ror(self.prices.values.T, axis = 1), returns.T)
+    
+    def test_skipna_matches_dropping_the_missing_periods(self):
+        returns = self.returns.copy()
+        returns.iloc[:10, 0] = np.nan
+        result = risk.beta(returns, self.benchmark, skipna = True)
+        self.assertAlmostEqual(result['a'], risk.beta(self.returns['a'].values[10:], self.benchmark.values[10:]))
+        self.assertAlmostEqual(result['b'], risk.beta(self.returns['b'].values, self.benchmark.values))
+        vol = risk.period_risk(returns, skipna = True)
+        self.assertAlmostEqual(vol['a'], risk.period_risk(self.returns['a'].values[10:]))
+    
+    def test_compound_returns_skip_missing_periods(self):
+        returns = self.returns.copy()
+        returns.iloc[:3, 1] = np.nan
+        compounded = risk.compound_returns(returns, skipna = True)
+        self.assertTrue(compounded['b'][:3].isnull().all())
+        np.testing.assert_allclose(compounded['b'].values[3:], risk.compound_returns(self.returns['b'].values[3:]))
+        np.testing.assert_allclose(compounded['a'], risk.compound_returns(self.returns['a'].values))
+
+
+class CharacteristicPortfolioTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(6)
+        self.X = rng.randn(20, 3)
+        A = rng.randn(3, 3)
+        self.F = np.dot(A, A.T)
+        self.delta = rng.rand(20) + 0.1
+        self.V = np.dot(self.X, np.dot(self.F, self.X.T)) + np.diag(self.delta)
+        self.A = rng.randn(20, 4)
+    
+    def expected(self, a):
+        Va = np.dot(np.linalg.inv(self.V), a)
+        return Va / np.dot(a, Va), 1.0 / np.dot(a, Va)
+    
+    def test_matches_the_inverse(self):
+        holdings, variances = risk.characteristic_portfolios(self.V, self.A)
+        for j in range(self.A.shape[1]):
+            h, v = self.expected(self.A[:, j])
+            np.testing.assert_allclose(holdings[:, j], h)
+            self.assertAlmostEqual(variances[j], v)
+            # unit exposure to its own attribute
+            self.assertAlmostEqual(np.dot(self.A[:, j], holdings[:, j]), 1.0)
+    
+    def test_factor_covariance_and_single_attributes(self):
+        V = FactorCovariance(self.X, self.F, self.delta)
+        holdings = risk.characteristic_portfolios(V, self.A)[0]
+        np.testing.assert_allclose(holdings, risk.characteristic_portfolios(self.V, self.A)[0])
+        np.testing.assert_allclose(risk.characteristic_portfolio(V, self.A[:, 1]), self.expected(self.A[:, 1])[0])
+    
+    def test_indefinite_matrix_falls_back_to_lu(self):
+        V = self.V - np.eye(20) * (np.linalg.eigvalsh(self.V)[0] + 1.0)
+        solver = risk.CharacteristicSolver(V)
+        self.assertIsNotNone(solver._lu)
+        np.testing.assert_allclose(solver.solve(self.A), np.linalg.solve(V, self.A))
+    
+    def test_labels_are_kept(self):
+        A = pd.DataFrame(self.A, columns = ['alpha', 'beta', 'value', 'size'])
+        holdings, variances = risk.characteristic_portfolios(self.V, A)
+        self.assertEqual(list(holdings.columns), list(A.columns))
+        self.assertEqual(list(variances.index), list(A.columns))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+import numpy as np
+
+import _paths
+import RiskModel
+
+
+def random_model(N = 30, K = 4, seed = 0):
+    rng = np.random.RandomState(seed)
+    X = rng.randn(N, K)
+    A = rng.randn(K, K)
+    return X, np.dot(A, A.T), rng.rand(N) + 0.1
+
+
+class FactorCovarianceTest(unittest.TestCase):
+    def setUp(self):
+        X, F, delta = random_model()
+        self.V = RiskModel.FactorCovariance(X, F, delta)
+        self.dense = np.dot(X, np.dot(F, X.T)) + np.diag(delta)
+        self.w = np.random.RandomState(1).randn(30, 3)
+    
+    def test_dense_matches_returns_covariance(self):
+        np.testing.assert_allclose(self.V.to_dense(), self.dense)
+        np.testing.assert_allclose(RiskModel.returns_covariance(self.V.X, self.V.F, self.V.delta), self.dense)
+    
+    def test_products_match_the_dense_matrix(self):
+        w = self.w
+        np.testing.assert_allclose(self.V.matvec(w), np.dot(self.dense, w))
+        np.testing.assert_allclose(self.V.matvec(w[:, 0]), np.dot(self.dense, w[:, 0]))
+        np.testing.assert_allclose(self.V.variance(w), np.einsum('im,ij,jm->m', w, self.dense, w))
+        np.testing.assert_allclose(self.V.marginal_contribution(w[:, 0]), np.dot(self.dense, w[:, 0]) / np.sqrt(np.dot(w[:, 0], np.dot(self.dense, w[:, 0]))))
+    
+    def test_solve_matches_a_dense_solve(self):
+        np.testing.assert_allclose(self.V.solve(self.w), np.linalg.solve(self.dense, self.w))
+        np.testing.assert_allclose(self.V.solve(self.w[:, 1]), np.linalg.solve(self.dense, self.w[:, 1]))
+    
+    def test_solve_with_a_singular_F(self):
+        X, F, delta = random_model()
+        F[0] = F[:, 0] = 0.0
+        V = RiskModel.FactorCovariance(X, F, delta)
+        np.testing.assert_allclose(V.solve(self.w), np.linalg.solve(V.to_dense(), self.w))
+    
+    def test_diagonal_matrix_delta(self):
+        V = RiskModel.FactorCovariance(self.V.X, self.V.F, np.diag(self.V.delta))
+        np.testing.assert_array_equal(V.delta, self.V.delta)
+
+
+class FactorReturnPanelTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(2)
+        T, N, K = 6, 25, 3
+        self.X = rng.randn(T, N, K)
+        self.r = rng.randn(T, N)
+        self.delta = rng.rand(T, N) + 0.1
+    
+    def test_matches_one_gls_per_period(self):
+        b, u = RiskModel.factor_return_panel(self.X, self.r, self.delta)
+        for t in range(len(self.r)):
+            expected = RiskModel.factor_return_matrix(self.X[t], self.delta[t], self.r[t])
+            np.testing.assert_allclose(b[t], expected)
+            np.testing.assert_allclose(u[t], self.r[t] - np.dot(self.X[t], expected))
+    
+    def test_chunks_give_the_same_answer(self):
+        b, u = RiskModel.factor_return_panel(self.X, self.r, self.delta)
+        chunked = RiskModel.factor_return_panel(self.X, self.r, self.delta, chunksize = 4)
+        np.testing.assert_allclose(chunked[0], b)
+        np.testing.assert_allclose(chunked[1], u)
+    
+    def test_missing_data_is_left_out_of_its_period(self):
+        r = self.r.copy()
+        r[1, :5] = np.nan
+        r[3] = np.nan
+        r[3, :2] = 0.1
+        b, u = RiskModel.factor_return_panel(self.X, r, self.delta[0])
+        expected = RiskModel.factor_return_matrix(self.X[1, 5:], self.delta[0, 5:], r[1, 5:])
+        np.testing.assert_allclose(b[1], expected)
+        self.assertTrue(np.isnan(u[1, :5]).all())
+        # two assets can't pin down three factors
+        self.assertTrue(np.isnan(b[3]).all())
+
+
+class FactorPortfolioTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(7)
+        self.X = rng.randn(5, 30, 3)
+        self.delta = rng.rand(5, 30) + 0.1
+        self.r = rng.randn(5, 30)
+    
+    def test_weights_are_the_gls_projection(self):
+        X, delta = self.X[0], self.delta[0]
+        W = RiskModel.factor_portfolio_weights(X, delta)
+        XtW = X.T / delta
+        np.testing.assert_allclose(W, np.dot(np.linalg.inv(np.dot(XtW, X)), XtW))
+        # unit exposure to its own factor, none to the others
+        np.testing.assert_allclose(np.dot(W, X), np.eye(3), atol = 1e-12)
+        np.testing.assert_allclose(RiskModel.factor_return(W, self.r[0]), RiskModel.factor_return_matrix(X, delta, self.r[0]))
+    
+    def test_fixed_exposures_over_many_periods(self):
+        returns = RiskModel.factor_portfolio_returns(self.X[0], self.delta[0], self.r)
+        for t in range(len(self.r)):
+            np.testing.assert_allclose(returns[t], RiskModel.factor_return_matrix(self.X[0], self.delta[0], self.r[t]))
+    
+    def test_a_stack_matches_the_panel_regression(self):
+        b = RiskModel.factor_return_panel(self.X, self.r, self.delta)[0]
+        np.testing.assert_allclose(RiskModel.factor_portfolio_returns(self.X, self.delta, self.r, chunksize = 2), b)
+        W = RiskModel.factor_portfolio_weights(self.X, self.delta)
+        self.assertEqual(W.shape, (5, 3, 30))
+    
+    def test_assets_without_data_get_no_weight(self):
+        delta = self.delta[0].copy()
+        delta[4] = np.nan
+        X = self.X[0].copy()
+        X[7, 1] = np.nan
+        W = RiskModel.factor_portfolio_weights(X, delta)
+        self.assertFalse(W[:, [4, 7]].any())
+        keep = np.setdiff1d(np.arange(30), [4, 7])
+        np.testing.assert_allclose(W[:, keep], RiskModel.factor_portfolio_weights(X[keep], delta[keep]))
+    
+    def test_periods_with_too_few_assets_are_nan(self):
+        delta = self.delta.copy()
+        # two usable assets for three factors in period 1, as in the panel regression
+        delta[1, 2:] = np.nan
+        W = RiskModel.factor_portfolio_weights(self.X, delta)
+        self.assertTrue(np.isnan(W[1]).all())
+        np.testing.assert_allclose(np.matmul(W[[0, 2, 3, 4]], self.X[[0, 2, 3, 4]]), np.tile(np.eye(3), (4, 1, 1)), atol = 1e-12)
+        self.assertTrue(np.isnan(RiskModel.factor_portfolio_weights(self.X[1], delta[1])).all())
+        returns = RiskModel.factor_portfolio_returns(self.X, delta, self.r)
+        b = RiskModel.factor_return_panel(self.X, self.r, delta)[0]
+        self.assertTrue(np.isnan(returns[1]).all() and np.isnan(b[1]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+import _paths
+from security import FactorTable, Security, SecurityMaster
+
+
+class SecurityMasterTest(unittest.TestCase):
+    def setUp(self):
+        self.master = SecurityMaster()
+        self.a = Security('a', {'beta': 1.1, 'size': 2.0, 'sector': 'tech'}, self.master)
+        self.b = Security('b', {'beta': 0.9, 'sector': 'energy'}, self.master)
+    
+    def test_factors_read_like_a_dict(self):
+        self.assertEqual(self.a.factors['beta'], 1.1)
+        self.assertEqual(dict(self.b.factors), {'beta': 0.9, 'sector': 'energy'})
+        self.assertNotIn('size', self.b.factors)
+        self.b.factors['size'] = 3.0
+        self.assertEqual(self.master.get(self.b.row, 'size'), 3.0)
+    
+    def test_exposures_are_columns(self):
+        np.testing.assert_array_equal(self.master.exposures(factors = ['beta', 'size']), [[1.1, 2.0], [0.9, np.nan]])
+        codes, groups = self.master.codes('sector')
+        self.assertEqual(codes.tolist(), [0, 1])
+        self.assertEqual(list(groups), ['tech', 'energy'])
+    
+    def test_consecutive_rows_are_a_view(self):
+        exposures = self.master.exposures([0, 1])
+        self.assertTrue(np.may_share_memory(exposures, self.master._values))
+    
+    def test_same_name_fills_in_but_doesnt_overwrite(self):
+        again = Security('a', {'beta': 1.1, 'momentum': 0.5}, self.master)
+        self.assertEqual(again.row, self.a.row)
+        self.assertEqual(self.a.factors['momentum'], 0.5)
+        with self.assertRaises(ValueError):
+            Security('a', {'beta': 2.0}, self.master)
+        self.assertEqual(self.a.factors['beta'], 1.1)
+        Security('a', {'beta': 2.0}, self.master, update = True)
+        self.assertEqual(self.a.factors['beta'], 2.0)
+    
+    def test_securities_without_a_master_keep_a_dict(self):
+        first = Security('x', {'beta': 1.0})
+        second = Security('x', {'beta': 2.0})
+        self.assertIsNone(first.master)
+        self.assertEqual(first.factors, {'beta': 1.0})
+        second.factors['sector'] = 'tech'
+        self.assertEqual(second.factors, {'beta': 2.0, 'sector': 'tech'})
+        self.assertNotIn('sector', first.factors)
+    
+    def test_grows_past_its_capacity(self):
+        master = SecurityMaster(capacity = 1)
+        for i in range(100):
+            Security(str(i), {'beta': float(i), 'sector': i % 3}, master)
+        self.assertEqual(len(master), 100)
+        np.testing.assert_array_equal(master.exposures(factors = ['beta'])[:, 0], np.arange(100.0))
+
+
+class CategoricalTest(unittest.TestCase):
+    def test_declared_factors_hold_numeric_labels(self):
+        table = FactorTable(categorical = ['gics'])
+        table.add_row({'gics': 4510})
+        table.add_row({'gics': 1010})
+        self.assertEqual(table.categorical, ['gics'])
+        self.assertEqual(table.get(1, 'gics'), 1010)
+    
+    def test_label_in_a_numeric_factor_raises(self):
+        table = FactorTable()
+        table.add_row({'industry': 10})
+        with self.assertRaises(TypeError):
+            table.add_row({'industry': 'banks'})
+        # the bad row isn't left half added
+        self.assertEqual(len(table), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+from specific_risk import bayesian_shrinkage, ewma_variance, size_buckets, specific_variance, structural_risk
+
+
+class EwmaVarianceTest(unittest.TestCase):
+    def test_matches_weighted_mean_of_squares(self):
+        rng = np.random.RandomState(9)
+        u = 0.02 * rng.randn(50, 4)
+        u[:20, 1] = np.nan
+        decay = 0.95
+        variance, count = ewma_variance(u, decay)
+        w = decay ** np.arange(49, -1, -1)
+        self.assertAlmostEqual(variance[0], np.average(u[:, 0]**2, weights = w))
+        self.assertAlmostEqual(variance[1], np.average(u[20:, 1]**2, weights = w[20:]))
+        self.assertAlmostEqual(count[1], w[20:].sum()**2 / (w[20:]**2).sum())
+        self.assertAlmostEqual(ewma_variance(u)[1][0], 50)
+
+
+class ShrinkageTest(unittest.TestCase):
+    def test_bayesian_shrinkage_formula(self):
+        sigma = np.array([0.1, 0.2, 0.3, 0.5])
+        shrunk = bayesian_shrinkage(sigma, np.zeros(4, dtype = int), q = 0.5)
+        mean = sigma.mean()
+        spread = np.sqrt(np.mean((sigma - mean)**2))
+        v = 0.5 * np.abs(sigma - mean) / (spread + 0.5 * np.abs(sigma - mean))
+        np.testing.assert_allclose(shrunk, v * mean + (1 - v) * sigma)
+        np.testing.assert_allclose(bayesian_shrinkage(sigma, [-1, -1, -1, -1]), sigma)
+    
+    def test_size_buckets(self):
+        codes = size_buckets([5.0, np.nan, 1.0, 3.0, 9.0, 7.0], n_buckets = 2)
+        self.assertEqual(codes.tolist(), [0, -1, 0, 0, 1, 1])
+    
+    def test_structural_model_recovers_a_log_linear_risk(self):
+        rng = np.random.RandomState(10)
+        exposures = rng.randn(40, 2)
+        sigma = np.exp(-3.0 + np.dot(exposures, [0.3, -0.2]))
+        reliable = np.arange(40) >= 5
+        structural = structural_risk(np.where(reliable, sigma, np.nan), reliable, exposures)
+        np.testing.assert_allclose(structural, sigma)
+
+
+class SpecificVarianceTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(11)
+        self.T, self.N = 120, 40
+        self.sigma = 0.01 + 0.02 * rng.rand(self.N)
+        self.u = rng.randn(self.T, self.N) * self.sigma
+        # a few short histories
+        self.u[:100, :3] = np.nan
+        self.cap = np.exp(rng.randn(self.N))
+    
+    def test_full_histories_keep_their_own_estimate(self):
+        delta = specific_variance(self.u, cap = self.cap, q = 0)
+        np.testing.assert_allclose(delta[3:], ewma_variance(self.u[:, 3:])[0])
+    
+    def test_decayed_histories_stay_finite(self):
+        for decay in [0.9, 0.95, 0.97, 0.99]:
+            delta = specific_variance(self.u, decay = decay, cap = self.cap)
+            self.assertTrue(np.isfinite(delta).all())
+            self.assertTrue((delta > 0).all())
+            # a full history gets all the weight whatever the decay
+            unshrunk = specific_variance(self.u, decay = decay, cap = self.cap, q = 0)
+            np.testing.assert_allclose(unshrunk[3:], ewma_variance(self.u[:, 3:], decay)[0])
+    
+    def test_short_histories_lean_on_the_structural_model(self):
+        delta = specific_variance(self.u, q = 0)
+        time_series = ewma_variance(self.u)[0]
+        # 20 of 120 periods is below min_history, so only the structural estimate is used
+        self.assertAlmostEqual(delta[0], np.mean(np.sqrt(time_series[3:]))**2)
+    
+    def test_missing_caps(self):
+        cap = self.cap.copy()
+        cap[:5] = np.nan
+        self.assertTrue(np.isfinite(specific_variance(self.u, decay = 0.95, cap = cap)).all())
+        delta = specific_variance(self.u, decay = 0.95, cap = np.full(self.N, np.nan))
+        self.assertTrue(np.isfinite(delta).all())
+    
+    def test_no_structural_estimate_keeps_the_time_series(self):
+        # nothing is reliable enough to fit, so every asset keeps its own estimate
+        u = self.u.copy()
+        u[:100] = np.nan
+        delta = specific_variance(u, q = 0)
+        np.testing.assert_allclose(delta, ewma_variance(u)[0])
+    
+    def test_frames_give_a_series(self):
+        u = pd.DataFrame(self.u, columns = ['s%d' % i for i in range(self.N)])
+        delta = specific_variance(u, cap = self.cap)
+        self.assertEqual(list(delta.index), list(u.columns))
+        np.testing.assert_allclose(delta.values, specific_variance(self.u, cap = self.cap))
+
+
+if __name__ == '__main__':
+    unittest.main()
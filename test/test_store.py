@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import _paths
+import store
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'prices.csv')
+        with open(self.source, 'w') as f:
+            f.write('date,a\n2010-01-04,1.0\n')
+        self.calls = []
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def build(self, horizon):
+        self.calls.append(horizon)
+        dates = pd.date_range('2010-01-04', periods = 5)
+        return {
+            'returns': pd.DataFrame(np.arange(10.0).reshape(5, 2) * horizon, index = dates, columns = ['a', 'b']),
+            'market': pd.Series(np.arange(5.0), index = dates, name = 'mkt'),
+        }
+    
+    def test_frames_round_trip(self):
+        frames = self.build(1)
+        for (name, frame) in frames.items():
+            store.save_frame(frame, os.path.join(self.directory, name))
+        returns = store.load_frame(os.path.join(self.directory, 'returns'))
+        pd.testing.assert_frame_equal(returns, frames['returns'])
+        # wrapped, not read into memory
+        base = returns.values
+        while base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        self.assertIsInstance(base, np.memmap)
+        pd.testing.assert_series_equal(store.load_frame(os.path.join(self.directory, 'market')), frames['market'])
+    
+    def test_cached_builds_with_the_params_once(self):
+        cache = os.path.join(self.directory, 'cache')
+        first = store.cached(cache, [self.source], {'horizon': 2}, self.build)
+        again = store.cached(cache, [self.source], {'horizon': 2}, self.build)
+        self.assertEqual(self.calls, [2])
+        pd.testing.assert_frame_equal(again['returns'], first['returns'])
+        self.assertEqual(again['returns'].values[1, 0], 4.0)
+        store.cached(cache, [self.source], {'horizon': 3}, self.build)
+        self.assertEqual(self.calls, [2, 3])
+    
+    def test_changed_source_is_a_new_entry(self):
+        key = store.cache_key([self.source], {'horizon': 1})
+        with open(self.source, 'a') as f:
+            f.write('2010-01-05,1.1\n')
+        self.assertNotEqual(store.cache_key([self.source], {'horizon': 1}), key)
+
+    
+    def test_frame_filled_in_pieces(self):
+        path = os.path.join(self.directory, 'pieces')
+        values = store.create_frame(path, 10, ['a', 'b'])
+        values[:3] = [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+        values.flush()
+        del values
+        store.write_labels(path, ['x', 'y', 'z'])
+        frame = store.load_frame(path)
+        self.assertEqual(frame.shape, (3, 2))
+        self.assertEqual(frame.loc['z', 'b'], 6.0)
+        # a second labelling of the same values
+        shared = os.path.join(self.directory, 'shared')
+        store.share_frame(shared, path, ['p', 'q'])
+        self.assertFalse(os.path.exists(os.path.join(shared, 'values.npy')))
+        self.assertEqual(store.load_frame(shared).loc['q', 'a'], 3.0)
+    
+    def test_names_survive_and_frames_can_be_changed(self):
+        frame = self.build(1)['returns']
+        frame.index.name = 'date'
+        frame.columns.name = 'ticker'
+        path = os.path.join(self.directory, 'named')
+        store.save_frame(frame, path)
+        loaded = store.load_frame(path)
+        pd.testing.assert_frame_equal(loaded, frame)
+        self.assertEqual(loaded.index.name, 'date')
+        self.assertEqual(loaded.columns.name, 'ticker')
+        loaded.iloc[0, 0] = 5.0
+        self.assertEqual(loaded.iloc[0, 0], 5.0)
+        # copy on write, the file keeps the saved values
+        self.assertEqual(store.load_frame(path).iloc[0, 0], frame.iloc[0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()